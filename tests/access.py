@@ -0,0 +1,287 @@
+"""
+Local effective-access resolution.
+
+An attachment existing says nothing about whether its user can actually reach a resource: that depends on the
+role's access rules matching the resource's id, type or tags. Asking the server means listing roles, attachments and
+resources again for every assertion. AccessResolver loads them once into inverted indexes, tag -> resources,
+type -> resources and account -> roles, and then answers "which resources can this account reach" from memory.
+
+The full load is lazy, on the first question, and the clients it is attached to write their creates, updates and
+deletes through to it, so the indexes follow what the tests change without listing anything again.
+"""
+import contextlib
+import functools
+import threading
+from collections import defaultdict
+
+import strongdm
+from strongdm import plumbing
+
+from tests.batch import response_entity
+from tests.prefetch import prefetch_chain
+
+# Services whose entities decide who can reach what
+resolved_services = ["accounts", "roles", "resources", "account_attachments"]
+# The AccessResolver attributes a load replaces
+index_attributes = ["resources", "by_tag", "by_type", "roles", "attachments", "by_account", "by_role"]
+
+
+def resource_type(resource) -> str:
+    """
+    Gets the type name access rules use for a resource, ie 'postgres' or 'amazon_es'
+    :param resource: a strongdm resource
+    :return: str
+    """
+    return plumbing.convert_resource_to_plumbing(resource).WhichOneof("resource")
+
+
+class ResolvedService:
+    """
+    Wraps a client service so the entities its writes create, change or delete reach an AccessResolver
+    """
+    def __init__(self, service, name: str, resolver):
+        self.service = service
+        self.name = name
+        self.resolver = resolver
+
+    def create(self, entity, *args, **kwargs):
+        response = self.service.create(entity, *args, **kwargs)
+        self.resolver.store(self.name, response_entity(response))
+        return response
+
+    def update(self, entity, *args, **kwargs):
+        response = self.service.update(entity, *args, **kwargs)
+        self.resolver.store(self.name, response_entity(response))
+        return response
+
+    def delete(self, entity_id, *args, **kwargs):
+        try:
+            response = self.service.delete(entity_id, *args, **kwargs)
+        except strongdm.NotFoundError:
+            # Something before this call deleted it
+            self.resolver.forget(self.name, entity_id)
+            raise
+        self.resolver.forget(self.name, entity_id)
+        return response
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.service, attribute)
+
+
+class AccessResolver:
+    """
+    Answers which resources an account can reach, from indexes of the org's roles, attachments and resources
+    """
+    def __init__(self, client: strongdm.Client):
+        """
+        :param client: strongdm.Client the org is loaded with, not one attached to this resolver
+        """
+        self.client = client
+        # Guards the indexes, and load_lock keeps loads from running side by side
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.loaded = False
+        # Writes made while a load lists the org, as (method, service name, entity or id), None when not loading
+        self.pending = None
+        # resource id -> (type, tags)
+        self.resources = dict()
+        self.by_tag = defaultdict(set)
+        self.by_type = defaultdict(set)
+        # role id -> access rules
+        self.roles = dict()
+        # attachment id -> (account id, role id), and the attachment ids of each account and of each role
+        self.attachments = dict()
+        self.by_account = defaultdict(set)
+        self.by_role = defaultdict(set)
+        self.loads = 0
+
+    def attach(self, client: strongdm.Client) -> strongdm.Client:
+        """
+        Writes a client's creates, updates and deletes through to the resolver
+        :param client: strongdm.Client
+        :return: strongdm.Client the same client
+        """
+        for name in resolved_services:
+            service = getattr(client, name)
+            if not isinstance(service, ResolvedService):
+                setattr(client, name, ResolvedService(service, name, self))
+        return client
+
+    # --- Loading ---
+    def _list_all(self, service_name: str):
+        for entity in getattr(self.client, service_name).list(""):
+            yield service_name, entity
+
+    def load(self, only_once: bool = False):
+        """
+        Reads every role, attachment and resource in the org, replacing whatever is indexed.
+        The listing fills separate indexes, so reads and writes go on meanwhile against the current ones. The writes
+        are also kept and made again on the new indexes once they are swapped in, so none are lost to the snapshot.
+        :param only_once: bool skip it if the org was loaded already
+        """
+        listings = [functools.partial(self._list_all, name) for name in ("roles", "account_attachments", "resources")]
+        with self.load_lock:
+            if only_once and self.loaded:
+                return
+            with self.lock:
+                self.pending = list()
+            try:
+                snapshot = AccessResolver(self.client)
+                with contextlib.closing(prefetch_chain(listings)) as listed:
+                    for service_name, entity in listed:
+                        snapshot._store(service_name, entity)
+            except BaseException:
+                with self.lock:
+                    self.pending = None
+                raise
+
+            with self.lock:
+                for attribute in index_attributes:
+                    setattr(self, attribute, getattr(snapshot, attribute))
+                for method, service_name, value in self.pending:
+                    getattr(self, method)(service_name, value)
+                self.pending = None
+                self.loaded = True
+                self.loads += 1
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load(only_once=True)
+
+    # --- Writes ---
+    def store(self, service_name: str, entity):
+        """
+        Indexes a created or updated entity
+        :param service_name: str client service the entity belongs to
+        :param entity: a strongdm entity
+        """
+        with self.lock:
+            self._store(service_name, entity)
+            if self.pending is not None:
+                self.pending.append(("_store", service_name, entity))
+
+    def forget(self, service_name: str, entity_id: str):
+        """
+        Drops a deleted entity, and the attachments the server deletes along with an account or role
+        :param service_name: str
+        :param entity_id: str
+        """
+        with self.lock:
+            self._forget(service_name, entity_id)
+            if self.pending is not None:
+                self.pending.append(("_forget", service_name, entity_id))
+
+    def _store(self, service_name: str, entity):
+        if service_name == "resources":
+            self._forget("resources", entity.id)
+            tags = dict(entity.tags or dict())
+            kind = resource_type(entity)
+            self.resources[entity.id] = (kind, tags)
+            self.by_type[kind].add(entity.id)
+            for tag in tags.items():
+                self.by_tag[tag].add(entity.id)
+        elif service_name == "roles":
+            self.roles[entity.id] = list(entity.access_rules or list())
+        elif service_name == "account_attachments":
+            self.attachments[entity.id] = (entity.account_id, entity.role_id)
+            self.by_account[entity.account_id].add(entity.id)
+            self.by_role[entity.role_id].add(entity.id)
+
+    def _forget(self, service_name: str, entity_id: str):
+        if service_name == "resources":
+            if entity_id not in self.resources:
+                return
+            kind, tags = self.resources.pop(entity_id)
+            self.by_type[kind].discard(entity_id)
+            for tag in tags.items():
+                self.by_tag[tag].discard(entity_id)
+        elif service_name == "account_attachments":
+            if entity_id not in self.attachments:
+                return
+            account_id, role_id = self.attachments.pop(entity_id)
+            self.by_account[account_id].discard(entity_id)
+            self.by_role[role_id].discard(entity_id)
+        elif service_name == "accounts":
+            for attachment_id in list(self.by_account.pop(entity_id, set())):
+                self._forget("account_attachments", attachment_id)
+        elif service_name == "roles":
+            self.roles.pop(entity_id, None)
+            for attachment_id in list(self.by_role.pop(entity_id, set())):
+                self._forget("account_attachments", attachment_id)
+
+    # --- Reads ---
+    def _rule_matches(self, rule: dict) -> set:
+        """
+        Gets the resources one access rule grants: the listed ids, or every resource of its type carrying all its tags
+        """
+        if "ids" in rule:
+            return {resource_id for resource_id in rule["ids"] or list() if resource_id in self.resources}
+
+        candidates = [self.by_tag.get(tag, set()) for tag in (rule.get("tags") or dict()).items()]
+        if rule.get("type"):
+            candidates.append(self.by_type.get(rule["type"], set()))
+        if not candidates:
+            return set()
+        # Intersecting from the smallest set keeps the work to the size of the narrowest term
+        candidates.sort(key=len)
+        return candidates[0].intersection(*candidates[1:])
+
+    def _grants(self, rule: dict, resource_id: str) -> bool:
+        """
+        Checks one access rule against one resource, without working out everything the rule grants
+        """
+        if resource_id not in self.resources:
+            return False
+        if "ids" in rule:
+            return resource_id in (rule["ids"] or list())
+        kind, tags = self.resources[resource_id]
+        rule_tags = rule.get("tags") or dict()
+        if not rule_tags and not rule.get("type"):
+            return False
+        return rule.get("type") in (None, "", kind) and all(tags.get(key) == value for key, value in rule_tags.items())
+
+    def _roles_of(self, account_id: str) -> set:
+        return {self.attachments[attachment_id][1] for attachment_id in self.by_account.get(account_id, set())}
+
+    def roles_of(self, account_id: str) -> set:
+        """
+        :param account_id: str
+        :return: set of role ids attached to the account
+        """
+        self._ensure_loaded()
+        with self.lock:
+            return self._roles_of(account_id)
+
+    def reachable(self, account_id: str) -> set:
+        """
+        Gets every resource an account can reach through the roles attached to it
+        :param account_id: str
+        :return: set of resource ids
+        """
+        self._ensure_loaded()
+        with self.lock:
+            found = set()
+            for role_id in self._roles_of(account_id):
+                for rule in self.roles.get(role_id, list()):
+                    found |= self._rule_matches(rule)
+            return found
+
+    def can_reach(self, account_id: str, resource_id: str) -> bool:
+        """
+        :param account_id: str
+        :param resource_id: str
+        :return: bool
+        """
+        return bool(self.explain(account_id, resource_id))
+
+    def explain(self, account_id: str, resource_id: str) -> list:
+        """
+        Gets why an account can reach a resource, for assertion messages
+        :param account_id: str
+        :param resource_id: str
+        :return: list of (role id, access rule) pairs that grant it, empty when it can not
+        """
+        self._ensure_loaded()
+        with self.lock:
+            return [(role_id, rule) for role_id in sorted(self._roles_of(account_id))
+                    for rule in self.roles.get(role_id, list()) if self._grants(rule, resource_id)]
@@ -0,0 +1,91 @@
+"""
+An asyncio facade over the sdk client.
+
+The sdk only makes blocking calls, so steps that do not depend on each other, like creating the user, resource and
+role of a grant, run one after another and a test takes the sum of their latencies. AsyncClient exposes the same
+services with every method awaitable, each call running on a bounded thread pool, so a coroutine test can gather
+independent steps and take only as long as the slowest of them.
+
+The calls still go through the client they wrap, so the scheduler, recorder and cassettes attached to it see every
+one of them as usual.
+"""
+import asyncio
+import functools
+import inspect
+from concurrent import futures
+from typing import Callable
+
+import strongdm
+
+from tests.scheduler import scheduled_services
+
+
+class AsyncService:
+    """
+    One of a client's services, ie client.roles, with awaitable methods
+    """
+    def __init__(self, service, executor: futures.Executor):
+        """
+        :param service: a strongdm service like client.roles
+        :param executor: Executor the blocking calls run on
+        """
+        self.service = service
+        self.executor = executor
+
+    def __getattr__(self, name: str):
+        method = getattr(self.service, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await run_blocking(self.executor, method, *args, **kwargs)
+
+        return call
+
+
+async def run_blocking(executor: futures.Executor, func: Callable, *args, **kwargs):
+    """
+    Runs a blocking call on the executor.
+    Lists page lazily as they are iterated, so they are read to the end on the executor too rather than on the loop.
+    :param executor: Executor
+    :param func: callable
+    :return: what func returned, a list for generators
+    """
+    def call():
+        result = func(*args, **kwargs)
+        return list(result) if inspect.isgenerator(result) else result
+
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+class AsyncClient:
+    """
+    Wraps a strongdm.Client, ie `await aclient.roles.create(role)` or `await aclient.accounts.list("email:?", email)`
+    """
+    def __init__(self, client: strongdm.Client, executor: futures.Executor):
+        """
+        :param client: strongdm.Client
+        :param executor: Executor bounding how many calls run at once, usually shared by the whole session
+        """
+        self.client = client
+        self.executor = executor
+        for name in scheduled_services:
+            setattr(self, name, AsyncService(getattr(client, name), executor))
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Awaits any other blocking helper, ie `await aclient.run(lookup.find_by_id, client.roles, role_id)`
+        :param func: callable
+        :return: what func returned
+        """
+        return await run_blocking(self.executor, func, *args, **kwargs)
+
+
+def run_coroutine_test(test_function: Callable, arguments: dict):
+    """
+    Runs a coroutine test function to completion on a fresh event loop
+    :param test_function: async callable
+    :param arguments: dict of fixture values the test requested
+    """
+    asyncio.run(test_function(**arguments))
@@ -0,0 +1,155 @@
+import random
+import time
+from concurrent import futures
+from typing import Callable
+
+from strongdm import errors
+
+# Errors worth retrying, everything else is returned to the caller untouched so assertions still see it
+transient_error_codes = {8, 14}
+entity_attributes = ["account", "resource", "role", "node", "account_attachment"]
+
+
+def is_transient(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Checks if an sdk error is worth retrying: a rate limit, which the control plane rejects before doing anything,
+    or a timeout or unavailable error for a call that is safe to repeat. A create or delete that timed out may still
+    have happened, so sending it again can leave a duplicate behind or fail with AlreadyExists or NotFound.
+    :param error: Exception
+    :param idempotent: bool whether the call may be repeated
+    :return: bool
+    """
+    if isinstance(error, errors.RateLimitError):
+        return True
+    if not idempotent:
+        return False
+    if isinstance(error, errors.TimeoutError):
+        return True
+    return isinstance(error, errors.RPCError) and error.code in transient_error_codes
+
+
+def response_entity(response):
+    """
+    Gets the entity out of a create response, ie response.account or response.role
+    :param response: a strongdm create response
+    :return: the created entity
+    """
+    for attribute in entity_attributes:
+        entity = getattr(response, attribute, None)
+        if entity is not None:
+            return entity
+
+    raise ValueError(f"Could not find an entity on {type(response).__name__}")
+
+
+class Batch:
+    """
+    Collects creates and deletes and issues them concurrently with a bounded number in flight.
+    Every queued call returns a Future that holds its own response or error once the batch has run.
+    """
+    def __init__(self, max_in_flight: int = 8, retries: int = 3, backoff: float = 0.5):
+        """
+        :param max_in_flight: int max number of requests running at once
+        :param retries: int number of times a transient error is retried, see is_transient
+        :param backoff: float base seconds to wait before a retry, doubled each attempt
+        """
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.operations = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.run(raise_errors=exc_type is None)
+
+    def add(self, func: Callable, *args, idempotent: bool = True, **kwargs) -> futures.Future:
+        """
+        Queues any sdk call
+        :param func: callable
+        :param idempotent: bool whether the call may be sent again after a timeout or unavailable error
+        :return: Future
+        """
+        future = futures.Future()
+        self.operations.append((future, func, args, kwargs, idempotent))
+        return future
+
+    def create(self, service, entity, timeout: int = 30) -> futures.Future:
+        """
+        Queues a create, ie batch.create(client.accounts, user)
+        :param service: a strongdm service like client.roles
+        :param entity: the entity to create
+        :param timeout: int
+        :return: Future of the create response
+        """
+        return self.add(service.create, entity, timeout=timeout, idempotent=False)
+
+    def delete(self, service, entity_id: str, timeout: int = 30, ignore_missing: bool = True) -> futures.Future:
+        """
+        Queues a delete, by default an entity that is already gone is not an error
+        :param service: a strongdm service like client.roles
+        :param entity_id: str
+        :param timeout: int
+        :param ignore_missing: bool
+        :return: Future of the delete response
+        """
+        def delete():
+            try:
+                return service.delete(entity_id, timeout=timeout)
+            except errors.NotFoundError:
+                if not ignore_missing:
+                    raise
+                return None
+
+        # A delete sent again after it went through only finds the entity gone, which is fine when that is ignored
+        return self.add(delete, idempotent=ignore_missing)
+
+    def delete_created(self, service, created: futures.Future, timeout: int = 30):
+        """
+        Queues a delete for whatever a create future made, skipping creates that failed
+        :param service: a strongdm service like client.roles
+        :param created: Future returned by create
+        :param timeout: int
+        """
+        if created.done() and not created.cancelled() and created.exception() is None:
+            self.delete(service, response_entity(created.result()).id, timeout=timeout)
+
+    def _call(self, func: Callable, args: tuple, kwargs: dict, idempotent: bool):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not is_transient(e, idempotent):
+                    raise
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                attempt += 1
+
+    def _execute(self, operation: tuple):
+        future, func, args, kwargs, idempotent = operation
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._call(func, args, kwargs, idempotent))
+        except Exception as e:
+            future.set_exception(e)
+
+    def run(self, raise_errors: bool = True) -> list:
+        """
+        Issues every queued call and waits for all of them to finish
+        :param raise_errors: bool raise the first error after everything has finished
+        :return: list of the futures in the order they were queued
+        """
+        operations, self.operations = self.operations, list()
+        if operations:
+            with futures.ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(operations))) as executor:
+                list(executor.map(self._execute, operations))
+
+        results = [operation[0] for operation in operations]
+        if raise_errors:
+            for future in results:
+                if future.exception() is not None:
+                    raise future.exception()
+
+        return results
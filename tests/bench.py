@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Callable
+
+import strongdm
+
+from tests.batch import Batch, response_entity
+from tests.data_factory import factory
+from tests.instrumentation import percentile
+
+
+@dataclass
+class Workload:
+    """
+    One service's create, update, list and delete cycle.
+    setup creates whatever the entities depend on and returns a builder for them and a cleanup function, update changes
+    a created entity in place, or is None for services that cannot update.
+    """
+    name: str
+    service_name: str
+    setup: Callable
+    update: Callable = None
+
+
+def rename(entity):
+    entity.name = f"{entity.name}_renamed"
+
+
+def retag(entity):
+    entity.tags = {"bench": "updated"}
+
+
+def builds(kind: str) -> Callable:
+    """
+    Setup for workloads whose entities depend on nothing
+    :param kind: str data factory kind
+    """
+    def setup(client: strongdm.Client) -> tuple:
+        return lambda: factory.build(kind), lambda: None
+    return setup
+
+
+def attachment_setup(client: strongdm.Client) -> tuple:
+    """
+    Creates the account attachments are made to, and a role for each attachment as they are created
+    :return: tuple of a callable building a new attachment and a callable deleting the account and roles
+    """
+    account = client.accounts.create(factory.build("user"), timeout=30).account
+    role_ids = list()
+
+    def build():
+        role = client.roles.create(factory.build("role"), timeout=30).role
+        role_ids.append(role.id)
+        return strongdm.AccountAttachment(account_id=account.id, role_id=role.id)
+
+    def cleanup():
+        with Batch() as teardown:
+            teardown.delete(client.accounts, account.id)
+            for role_id in role_ids:
+                teardown.delete(client.roles, role_id)
+
+    return build, cleanup
+
+
+workloads = {
+    "accounts": Workload("accounts", "accounts", builds("user"), retag),
+    "roles": Workload("roles", "roles", builds("role"), rename),
+    "resources": Workload("resources", "resources", builds("postgres"), rename),
+    "nodes": Workload("nodes", "nodes", builds("relay"), rename),
+    "account_attachments": Workload("account_attachments", "account_attachments", attachment_setup),
+}
+
+
+class Benchmark:
+    """
+    Runs workloads at increasing concurrency and compares the results against a baseline
+    """
+    operations = ["create", "update", "list", "delete"]
+
+    def __init__(self, levels: list = None, cycles: int = 50):
+        """
+        :param levels: list of int concurrency levels, run in order
+        :param cycles: int create-update-list-delete cycles run at each level
+        """
+        self.levels = levels or [1, 4, 16]
+        self.cycles = cycles
+        self.results = list()
+        self.lock = threading.Lock()
+
+    def _cycle(self, service, build: Callable, update: Callable, samples: dict):
+        """
+        Runs one create, update, list and delete, timing each call on its own
+        """
+        def timed(operation, func, *args):
+            start = time.perf_counter()
+            try:
+                result = func(*args)
+            except Exception as e:
+                samples[operation].append((time.perf_counter() - start, type(e).__name__))
+                raise
+            samples[operation].append((time.perf_counter() - start, None))
+            return result
+
+        entity = response_entity(timed("create", service.create, build()))
+        try:
+            if update is not None:
+                update(entity)
+                timed("update", service.update, entity)
+            timed("list", lambda: list(service.list("id:?", entity.id)))
+        finally:
+            timed("delete", service.delete, entity.id)
+
+    def run(self, client: strongdm.Client, workload: Workload) -> list:
+        """
+        Runs a workload at every concurrency level
+        :param client: strongdm.Client
+        :param workload: Workload
+        :return: list of result dicts, one per level and operation
+        """
+        service = getattr(client, workload.service_name)
+        build, cleanup = workload.setup(client)
+        results = list()
+        try:
+            for level in self.levels:
+                results.extend(self._run_level(service, build, workload, level))
+        finally:
+            cleanup()
+
+        with self.lock:
+            self.results.extend(results)
+        return results
+
+    def _run_level(self, service, build: Callable, workload: Workload, level: int) -> list:
+        samples = {operation: list() for operation in self.operations}
+        start = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=level) as executor:
+            cycles = [executor.submit(self._cycle, service, build, workload.update, samples)
+                      for _ in range(self.cycles)]
+            futures.wait(cycles)
+        elapsed = time.perf_counter() - start
+
+        results = list()
+        for operation in self.operations:
+            if not samples[operation]:
+                continue
+            durations = [duration for duration, _ in samples[operation]]
+            errors = [error for _, error in samples[operation] if error]
+            results.append({
+                "workload": workload.name,
+                "concurrency": level,
+                "operation": operation,
+                "count": len(durations),
+                "throughput": round(len(durations) / elapsed, 3),
+                "p50": round(percentile(durations, 50), 6),
+                "p95": round(percentile(durations, 95), 6),
+                "p99": round(percentile(durations, 99), 6),
+                "error_rate": round(len(errors) / len(durations), 4),
+                "errors": sorted(set(errors)),
+            })
+        return results
+
+    def compare(self, baseline: list, tolerance: float = 1.5, results: list = None, noise: float = 0.005) -> list:
+        """
+        Finds results that got slower, lost throughput or gained errors compared to a baseline
+        :param baseline: list of result dicts from an earlier run
+        :param tolerance: float factor a metric may move by before it counts as a regression
+        :param results: list of result dicts to check, defaults to every result so far
+        :param noise: float seconds of added latency, per call or per unit of throughput, that is never a regression,
+                      so sub millisecond jitter against the fake backend does not fail a run
+        :return: list of str describing each regression
+        """
+        def key(result):
+            return result["workload"], result["concurrency"], result["operation"]
+
+        previous = {key(result): result for result in baseline}
+        regressions = list()
+        for result in self.results if results is None else results:
+            before = previous.get(key(result))
+            if before is None:
+                continue
+            label = "{} x{} {}".format(*key(result))
+            if result["p95"] > before["p95"] * tolerance and result["p95"] - before["p95"] > noise:
+                regressions.append(f"{label}: p95 {before['p95']:.4f}s -> {result['p95']:.4f}s")
+            if result["throughput"] * tolerance < before["throughput"] \
+                    and 1 / result["throughput"] - 1 / before["throughput"] > noise:
+                regressions.append(f"{label}: throughput {before['throughput']}/s -> {result['throughput']}/s")
+            if result["error_rate"] > before["error_rate"]:
+                regressions.append(f"{label}: error rate {before['error_rate']} -> {result['error_rate']}")
+        return regressions
+
+    def write(self, path: str, regressions: list = None):
+        """
+        Writes the results, and any regressions against the baseline, as json
+        :param path: str
+        :param regressions: list of str
+        """
+        with open(path, "w") as output:
+            json.dump({"results": self.results, "regressions": regressions or list()}, output, indent=2)
+
+
+def load_baseline(path: str) -> list:
+    """
+    :param path: str a bench_output.txt from an earlier run
+    :return: list of result dicts
+    """
+    with open(path) as baseline:
+        return json.load(baseline)["results"]
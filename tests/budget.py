@@ -0,0 +1,249 @@
+"""
+Per-test latency budgets.
+
+A test marked `@pytest.mark.latency_budget(60, setup=10, call=45)` fails once it runs past its budget: 60 seconds
+over setup, call and teardown together, and 10 and 45 seconds for its setup and call on their own. `cli=` budgets the
+sdm cli commands run on a test's behalf, which the cli tests run together ahead of time rather than in their own call.
+--latency-budget gives every test a default budget in the same form, ie '120' or '120,setup=30', which a marker's
+values take precedence over, and --latency-budget-action, or a marker's action=, makes overruns warn instead.
+
+An overrun is reported with how far over it went and where the time went: every api call the test made, grouped by
+phase and operation, and the time spent outside of them, so a slower control plane or sdk shows as a failing test
+that names the slow call instead of a CI run that is just slower.
+"""
+from collections import defaultdict
+
+import pytest
+
+from tests.instrumentation import Recorder
+
+phases = ["setup", "call", "teardown"]
+# Everything a budget can limit, total being setup, call and teardown together
+budget_keys = ["total"] + phases + ["cli"]
+actions = ["fail", "warn", "off"]
+
+
+class LatencyBudgetWarning(UserWarning):
+    """
+    A test ran past a latency budget that only warns
+    """
+
+
+def parse_budget(spec: str) -> dict:
+    """
+    Parses a budget given on the command line, ie '120' or '120,setup=30,call=60'
+    :param spec: str comma separated seconds, a bare number is the total
+    :return: dict of budget key to seconds
+    """
+    budget = dict()
+    for term in (spec or "").split(","):
+        term = term.strip()
+        if not term:
+            continue
+        key, _, seconds = term.rpartition("=")
+        key = key.strip() or "total"
+        if key not in budget_keys:
+            raise ValueError(f"Unknown latency budget {key!r}, expected one of {', '.join(budget_keys)}")
+        budget[key] = float(seconds)
+    return budget
+
+
+def budget_for(item, defaults: dict, default_action: str) -> tuple:
+    """
+    Gets a test's budget, its marker's values over the suite's defaults
+    :param item: pytest item
+    :param defaults: dict suite wide budget
+    :param default_action: str
+    :return: (dict budget, str action)
+    """
+    budget = dict(defaults)
+    action = default_action
+    marker = item.get_closest_marker("latency_budget")
+    if marker is not None:
+        kwargs = dict(marker.kwargs)
+        action = kwargs.pop("action", action)
+        if marker.args:
+            kwargs["total"] = marker.args[0]
+        unknown = set(kwargs) - set(budget_keys)
+        if unknown:
+            raise ValueError(f"Unknown latency budget {', '.join(sorted(unknown))} on {item.nodeid}")
+        budget.update({key: float(seconds) for key, seconds in kwargs.items() if seconds is not None})
+    return budget, action
+
+
+def overruns(budget: dict, took: dict) -> list:
+    """
+    Compares what a test took against its budget
+    :param budget: dict of budget key to seconds
+    :param took: dict of budget key to seconds measured, keys not measured yet are left out
+    :return: list of (key, took, allowed) for every budget exceeded
+    """
+    return [(key, took[key], budget[key]) for key in budget_keys
+            if key in budget and key in took and took[key] > budget[key]]
+
+
+def breakdown(records: list, cli_results: list, took: dict) -> list:
+    """
+    Works out where a test's time went
+    :param records: list of the test's CallRecords
+    :param cli_results: list of the CommandResults run for the test
+    :param took: dict of phase to seconds
+    :return: list of (phase, operation, calls, seconds, slowest) rows, slowest first within each phase
+    """
+    by_operation = defaultdict(list)
+    for record in records:
+        by_operation[(record.phase or "call", record.operation)].append(record.duration)
+    for result in cli_results:
+        by_operation[("cli", " ".join(result.command.split()[:4]))].append(result.duration)
+
+    rows = list()
+    for phase in phases + ["cli"]:
+        calls = [(operation, durations) for (row_phase, operation), durations in by_operation.items()
+                 if row_phase == phase]
+        calls.sort(key=lambda call: sum(call[1]), reverse=True)
+        rows.extend((phase, operation, len(durations), sum(durations), max(durations))
+                    for operation, durations in calls)
+        if phase in took:
+            # Calls made in parallel can add up to more than the phase took
+            other = took[phase] - sum(sum(durations) for _, durations in calls)
+            if other > 0.0005:
+                rows.append((phase, "outside api calls", 0, other, None))
+    return rows
+
+
+def format_overrun(test_id: str, exceeded: list, rows: list) -> str:
+    """
+    :param test_id: str
+    :param exceeded: list from overruns
+    :param rows: list from breakdown
+    :return: str
+    """
+    terms = [f"{key} took {took:.2f}s of {allowed:.2f}s (+{took - allowed:.2f}s)" for key, took, allowed in exceeded]
+    lines = [f"{test_id} ran over its latency budget: {', '.join(terms)}"]
+    width = max([len(operation) for _, operation, _, _, _ in rows] or [0])
+    for phase, operation, calls, seconds, slowest in rows:
+        counted = f"x{calls}" if calls else ""
+        longest = f"slowest {slowest:.3f}s" if slowest is not None else ""
+        lines.append(f"  {phase:<8}  {operation:<{width}}  {counted:>5}  {seconds:>8.3f}s  {longest}".rstrip())
+    return "\n".join(lines)
+
+
+class BudgetPlugin:
+    """
+    Times each phase of each test, fails or warns on the ones over budget and reports where their time went
+    """
+    def __init__(self, config, recorder: Recorder, cli_results_key):
+        """
+        :param config: pytest config
+        :param recorder: Recorder every client is instrumented with
+        :param cli_results_key: StashKey of the session's cli CommandResults
+        """
+        self.config = config
+        self.recorder = recorder
+        self.cli_results_key = cli_results_key
+        self.defaults = parse_budget(config.getoption("--latency-budget"))
+        self.action = config.getoption("--latency-budget-action")
+        # test id -> (budget key -> seconds measured), while the test runs
+        self.took = dict()
+        # test id -> index of the first record the test could have made
+        self.marks = dict()
+        # Tests already failed, for their budget or otherwise, while they run
+        self.settled = set()
+        # (test id, action, report text) of every test over budget, across workers
+        self.overruns = list()
+
+    def _phase(self, item, phase: str):
+        if phase == "setup":
+            self.took[item.nodeid] = dict()
+            with self.recorder.lock:
+                self.marks[item.nodeid] = len(self.recorder.records)
+        self.recorder.current_phase = phase
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        self._phase(item, "setup")
+        yield
+        self.recorder.current_phase = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        self._phase(item, "call")
+        yield
+        self.recorder.current_phase = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item):
+        self._phase(item, "teardown")
+        yield
+        self.recorder.current_phase = None
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        took = self.took.setdefault(item.nodeid, dict())
+        took[call.when] = call.duration
+        try:
+            # Checked once the call is timed and again with its teardown, a test is only ever failed for it once
+            if report.when == "setup" or report.skipped or item.nodeid in self.settled:
+                return
+            if report.failed:
+                self.settled.add(item.nodeid)
+                return
+            if self._check(item, report, took):
+                self.settled.add(item.nodeid)
+        finally:
+            if report.when == "teardown":
+                self._forget(item.nodeid)
+
+    def _check(self, item, report, took: dict) -> bool:
+        """
+        Fails or warns on a test over its budget
+        :return: bool whether it was over
+        """
+        budget, action = budget_for(item, self.defaults, self.action)
+        if action not in actions:
+            raise ValueError(f"Unknown latency budget action {action!r} on {item.nodeid}")
+        if action == "off":
+            return False
+        cli_results = [result for result in self.config.stash.get(self.cli_results_key, list())
+                       if getattr(result, "test_id", None) == item.nodeid]
+        if cli_results:
+            took["cli"] = sum(result.duration for result in cli_results)
+        took["total"] = sum(took.get(phase, 0.0) for phase in phases)
+        exceeded = overruns(budget, took)
+        if not exceeded:
+            return False
+
+        with self.recorder.lock:
+            records = [record for record in self.recorder.records[self.marks.get(item.nodeid, 0):]
+                       if record.test_id == item.nodeid]
+        text = format_overrun(item.nodeid, exceeded, breakdown(records, cli_results, took))
+        report.latency_budget = (action, text)
+        if action == "warn":
+            item.warn(LatencyBudgetWarning(text))
+        else:
+            report.outcome = "failed"
+            report.longrepr = text
+        return True
+
+    def _forget(self, test_id: str):
+        self.took.pop(test_id, None)
+        self.marks.pop(test_id, None)
+        self.settled.discard(test_id)
+
+    def pytest_runtest_logreport(self, report):
+        # Reports from xdist workers arrive here on the controller with the overrun attached
+        overrun = getattr(report, "latency_budget", None)
+        if overrun is not None:
+            action, text = overrun
+            self.overruns.append((report.nodeid, action, text))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.overruns or hasattr(self.config, "workerinput"):
+            return
+        terminalreporter.write_sep("-", "latency budgets")
+        failed = sum(1 for _, action, _ in self.overruns if action == "fail")
+        terminalreporter.write_line(f"{len(self.overruns)} tests over budget, {failed} failed for it")
+        for _, _, text in self.overruns:
+            terminalreporter.write_line(text)
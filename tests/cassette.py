@@ -0,0 +1,424 @@
+"""
+Record and replay of api traffic.
+
+With --cassettes=record every rpc the suite's clients make is saved, request and response or error, to a gzipped
+cassette per test. --cassettes=replay answers the same rpcs from the cassettes without touching the network, so a
+failing case reruns instantly and identically, and --cassettes=verify runs against the control plane and flags every
+response whose shape or error no longer matches the recording.
+
+Calls are matched to the recording by their exact request first and, when a test built different names or ids,
+by the shape of the request in the order the calls were recorded. Replay also hands the test the data factory cases
+it was recorded with, so the entities it builds locally match the ones in the responses.
+
+Calls made by session wide fixture clients, like the entity pool's, do not belong to any one test. They go to shared
+cassettes that are replayed to whichever tests need them, reusing the last answer once a recording runs out. Each
+test's cassette also remembers which pooled entities it leased, so a replay of only some of the tests leases the same
+ones. Shared fixtures that read their identity from responses, like grants, replay the same way in any selection.
+"""
+import base64
+import collections
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+import grpc
+import strongdm
+from google.protobuf import descriptor_pool, message_factory
+
+from tests.impact import sdk_version
+
+# Bumped whenever the cassette layout changes, cassettes of another version are treated as missing
+format_version = 1
+cassette_services = ["accounts", "roles", "resources", "nodes", "account_attachments"]
+
+Metadatum = collections.namedtuple("Metadatum", ["key", "value"])
+
+
+class CassetteMiss(Exception):
+    """
+    Raised in replay when a test makes a call its cassette has no answer for
+    """
+
+
+def encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def shape(message, prefix: str = "") -> list:
+    """
+    Gets the fields a message has set, and the type of each, ignoring their values
+    :param message: a protobuf message
+    :param prefix: str path of the message inside its parent
+    :return: list of str like 'role.access_rules:str'
+    """
+    paths = list()
+    for field, value in message.ListFields():
+        path = f"{prefix}{field.name}"
+        # Newer protobuf releases dropped field labels for is_repeated
+        repeated = field.is_repeated if hasattr(field, "is_repeated") else field.label == field.LABEL_REPEATED
+        values = value if repeated else [value]
+        if field.type == field.TYPE_MESSAGE:
+            if field.message_type.GetOptions().map_entry:
+                paths.append(f"{path}:map")
+                continue
+            for item in values:
+                paths.extend(shape(item, f"{path}."))
+            paths.append(f"{path}:message")
+        else:
+            paths.append(f"{path}:{type(values[0]).__name__ if values else 'empty'}")
+    return sorted(set(paths))
+
+
+def message_class(full_name: str):
+    return message_factory.GetMessageClass(descriptor_pool.Default().FindMessageTypeByName(full_name))
+
+
+def cassette_path(directory: str, test_id: str) -> str:
+    """
+    Gets the file a test's cassette lives in, named for its function plus a hash as parameters can be very long
+    :param directory: str
+    :param test_id: str pytest node id
+    :return: str
+    """
+    module, _, name = test_id.partition("::")
+    readable = re.sub(r"\W+", "_", name.split("[")[0])[:60]
+    digest = hashlib.sha1(test_id.encode()).hexdigest()[:12]
+    return os.path.join(directory, os.path.splitext(os.path.basename(module))[0], f"{readable}-{digest}.json.gz")
+
+
+class ReplayedRpcError(grpc.RpcError):
+    """
+    A recorded rpc failure, shaped like the grpc errors the sdk converts into its own
+    """
+    def __init__(self, error: dict):
+        super().__init__(error["details"])
+        self._code = grpc.StatusCode[error["code"]]
+        self._details = error["details"]
+        self._status = base64.b64decode(error["status"]) if error.get("status") else None
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+    def trailing_metadata(self):
+        return [Metadatum("grpc-status-details-bin", self._status)] if self._status else list()
+
+
+class Cassette:
+    """
+    The rpcs one test, or one shared fixture client, made, in order
+    """
+    def __init__(self, key: str, interactions: list = None, meta: dict = None):
+        """
+        :param key: str test id or shared cassette name
+        :param interactions: list of dicts, as saved
+        :param meta: dict of what the cassette was recorded with
+        """
+        self.key = key
+        self.interactions = interactions or list()
+        self.meta = meta or dict()
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def record(self, service: str, rpc: str, request, response=None, error: grpc.RpcError = None):
+        interaction = {
+            "service": service,
+            "rpc": rpc,
+            "request": encode(request.SerializeToString()),
+            "request_shape": shape(request),
+        }
+        if error is not None:
+            status = [item.value for item in error.trailing_metadata() or list() if item.key.startswith("grpc-status")]
+            interaction["error"] = {"code": error.code().name, "details": error.details(),
+                                    "status": encode(status[0]) if status else None}
+        else:
+            interaction["response_type"] = response.DESCRIPTOR.full_name
+            interaction["response"] = encode(response.SerializeToString())
+            interaction["response_shape"] = shape(response)
+        with self.lock:
+            self.interactions.append(interaction)
+
+    def match(self, service: str, rpc: str, request, reuse: bool = False) -> dict:
+        """
+        Finds the recorded interaction for a call, by exact request or else by request shape in recorded order
+        :param service: str
+        :param rpc: str ie 'Create'
+        :param request: the protobuf request
+        :param reuse: bool fall back to the last matching interaction once every one has been used
+        :return: dict interaction, or None
+        """
+        body = encode(request.SerializeToString())
+        request_shape = shape(request)
+        with self.lock:
+            candidates = [(index, interaction) for index, interaction in enumerate(self.interactions)
+                          if interaction["service"] == service and interaction["rpc"] == rpc]
+            for same_body in (True, False):
+                for index, interaction in candidates:
+                    if index in self.used:
+                        continue
+                    if (interaction["request"] == body) if same_body else interaction["request_shape"] == request_shape:
+                        self.used.add(index)
+                        return interaction
+            if reuse:
+                similar = [item for _, item in candidates if item["request_shape"] == request_shape]
+                return similar[-1] if similar else None
+        return None
+
+    def unused(self) -> list:
+        with self.lock:
+            return [interaction for index, interaction in enumerate(self.interactions) if index not in self.used]
+
+    def dump(self) -> dict:
+        return {"format": format_version, "key": self.key, "meta": self.meta, "interactions": self.interactions}
+
+
+def save(cassette: Cassette, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt") as output:
+        json.dump(cassette.dump(), output, separators=(",", ":"))
+
+
+def load(path: str) -> Cassette:
+    """
+    :param path: str
+    :return: Cassette, or None if the file is missing or was written in another format
+    """
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt") as source:
+        data = json.load(source)
+    if data.get("format") != format_version:
+        return None
+    return Cassette(data["key"], data["interactions"], data["meta"])
+
+
+class Cassettes:
+    """
+    Records, replays or verifies every rpc made by the clients attached to it
+    """
+    def __init__(self, directory: str, mode: str, worker: str = "main"):
+        """
+        :param directory: str where cassettes are saved
+        :param mode: str 'record', 'replay' or 'verify'
+        :param worker: str xdist worker id, shared cassettes are recorded per worker
+        """
+        self.directory = directory
+        self.mode = mode
+        self.worker = worker
+        self.current_test = None
+        self.tests = dict()
+        self.shared = dict()
+        self.drift = collections.defaultdict(list)
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # --- Cassette lookup ---
+    def shared_path(self, name: str, worker: str = None) -> str:
+        return os.path.join(self.directory, "_shared", f"{name}.{worker or self.worker}.json.gz")
+
+    def test_cassette(self, test_id: str) -> Cassette:
+        """
+        Gets a test's cassette, loading it on first use in replay and verify
+        :param test_id: str
+        :return: Cassette, or None if nothing was recorded for the test
+        """
+        with self.lock:
+            if test_id not in self.tests:
+                if self.mode == "record":
+                    self.tests[test_id] = Cassette(test_id, meta=self.meta())
+                else:
+                    self.tests[test_id] = load(cassette_path(self.directory, test_id))
+            return self.tests[test_id]
+
+    def shared_cassette(self, name: str) -> Cassette:
+        """
+        Gets a shared cassette, in replay and verify the recordings of every worker are combined
+        :param name: str
+        :return: Cassette
+        """
+        with self.lock:
+            if name not in self.shared:
+                cassette = Cassette(name, meta=self.meta())
+                if self.mode != "record":
+                    for path in sorted(glob.glob(self.shared_path(name, "*"))):
+                        recorded = load(path)
+                        if recorded is not None:
+                            cassette.interactions.extend(recorded.interactions)
+                            cassette.meta = recorded.meta
+                self.shared[name] = cassette
+            return self.shared[name]
+
+    @staticmethod
+    def meta() -> dict:
+        return {"sdk_version": sdk_version(), "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+
+    def recorded_cases(self, test_id: str) -> list:
+        cassette = self.test_cassette(test_id)
+        return cassette.meta.get("data_cases", list()) if cassette is not None else list()
+
+    def remember(self, test_id: str, name: str, value: str):
+        """
+        Saves which shared entity a fixture handed a test, ie the pooled user it leased, while recording
+        :param test_id: str
+        :param name: str fixture name
+        :param value: str
+        """
+        cassette = self.test_cassette(test_id) if self.mode == "record" else None
+        if cassette is not None:
+            cassette.meta.setdefault("fixtures", dict())[name] = value
+
+    def recall(self, test_id: str, name: str) -> str:
+        """
+        Gets what a fixture handed a test when it was recorded, so replay can hand it the same shared entity
+        :param test_id: str
+        :param name: str fixture name
+        :return: str, or None when not replaying or nothing was saved
+        """
+        cassette = self.test_cassette(test_id) if self.mode == "replay" else None
+        return cassette.meta.get("fixtures", dict()).get(name) if cassette is not None else None
+
+    # --- Test lifecycle ---
+    def begin(self, test_id: str):
+        self.current_test = test_id
+        cassette = self.test_cassette(test_id)
+        if self.mode == "verify" and cassette is not None and cassette.meta.get("sdk_version") != sdk_version():
+            self.flag(test_id, f"recorded with sdk {cassette.meta.get('sdk_version')}, running {sdk_version()}")
+
+    def end(self, test_id: str, data_cases: list = None, uses_api: bool = False):
+        """
+        Saves a recorded test's cassette, or flags the recorded calls a verified test never made
+        :param test_id: str
+        :param data_cases: list of the data factory case ids the test used, saved so replay can hand them out again
+        :param uses_api: bool save the cassette even without calls, ie for a test whose calls failed validation
+        """
+        self.current_test = None
+        cassette = self.tests.get(test_id)
+        if cassette is None:
+            return
+        if self.mode == "record" and (cassette.interactions or uses_api):
+            cassette.meta["data_cases"] = data_cases or list()
+            save(cassette, cassette_path(self.directory, test_id))
+        elif self.mode == "verify":
+            for interaction in cassette.unused():
+                self.flag(test_id, f"{interaction['service']}.{interaction['rpc']} was recorded but not called")
+        # Each test's cassette is only needed while it runs
+        with self.lock:
+            self.tests.pop(test_id, None)
+
+    def close(self):
+        """
+        Saves the shared cassettes when recording
+        """
+        if self.mode != "record":
+            return
+        for name, cassette in self.shared.items():
+            if cassette.interactions:
+                save(cassette, self.shared_path(name))
+
+    def flag(self, key: str, message: str):
+        with self.lock:
+            self.drift[key].append(message)
+
+    # --- Clients ---
+    def attach(self, client: strongdm.Client, shared: str = None) -> strongdm.Client:
+        """
+        Routes a client's rpcs through the cassettes
+        :param client: strongdm.Client
+        :param shared: str name of the shared cassette for a session wide fixture client, None for test clients
+        :return: strongdm.Client the same client
+        """
+        if self.mode == "replay":
+            # Recorded retries are replayed too, without waiting between them
+            client.base_retry_delay = 0
+            client.max_retry_delay = 0
+        for name in cassette_services:
+            stub = getattr(client, name).stub
+            for rpc_name, rpc in list(vars(stub).items()):
+                if callable(rpc):
+                    setattr(stub, rpc_name, self._wrap_rpc(name, rpc_name, rpc, shared))
+        return client
+
+    def _cassette(self, shared: str) -> Cassette:
+        if shared is not None:
+            return self.shared_cassette(shared)
+        if self.current_test is None:
+            return None
+        return self.test_cassette(self.current_test)
+
+    def _wrap_rpc(self, service: str, rpc_name: str, rpc, shared: str):
+        def call_rpc(request, *args, **kwargs):
+            cassette = self._cassette(shared)
+            if self.mode == "replay":
+                return self._replay(cassette, service, rpc_name, request, shared is not None)
+            if cassette is None:
+                return rpc(request, *args, **kwargs)
+
+            try:
+                response = rpc(request, *args, **kwargs)
+            except grpc.RpcError as e:
+                if self.mode == "record":
+                    cassette.record(service, rpc_name, request, error=e)
+                else:
+                    self._verify(cassette, service, rpc_name, request, error=e)
+                raise
+            if self.mode == "record":
+                cassette.record(service, rpc_name, request, response)
+            else:
+                self._verify(cassette, service, rpc_name, request, response)
+            return response
+
+        return call_rpc
+
+    def _replay(self, cassette: Cassette, service: str, rpc_name: str, request, reuse: bool):
+        interaction = cassette.match(service, rpc_name, request, reuse) if cassette is not None else None
+        if interaction is None:
+            with self.lock:
+                self.misses += 1
+            raise CassetteMiss(f"No recorded {service}.{rpc_name} left for {cassette.key if cassette else 'this call'},"
+                               f" record the test again with --cassettes=record")
+        if "error" in interaction:
+            raise ReplayedRpcError(interaction["error"])
+        return message_class(interaction["response_type"]).FromString(base64.b64decode(interaction["response"]))
+
+    def _verify(self, cassette: Cassette, service: str, rpc_name: str, request, response=None,
+                error: grpc.RpcError = None):
+        """
+        Compares a live answer with the recorded one and flags any difference in outcome or shape
+        """
+        interaction = cassette.match(service, rpc_name, request, reuse=cassette.key in self.shared)
+        operation = f"{service}.{rpc_name}"
+        if interaction is None:
+            self.flag(cassette.key, f"{operation} was called but not recorded")
+            return
+
+        recorded_error = interaction.get("error", dict()).get("code")
+        live_error = error.code().name if error is not None else None
+        if recorded_error != live_error:
+            self.flag(cassette.key, f"{operation} was recorded {recorded_error or 'OK'}, now {live_error or 'OK'}")
+        elif response is not None:
+            recorded, live = set(interaction["response_shape"]), set(shape(response))
+            if recorded != live:
+                changes = [f"+{path}" for path in sorted(live - recorded)] + \
+                          [f"-{path}" for path in sorted(recorded - live)]
+                self.flag(cassette.key, f"{operation} response changed shape: {' '.join(changes)}")
+
+    def report(self) -> str:
+        """
+        :return: str drift found in verify mode, or a summary of the other modes
+        """
+        if self.mode != "verify":
+            done = {"record": "recorded to", "replay": "replayed from"}[self.mode]
+            return f"cassettes {done} {self.directory}, {self.misses} calls had no recording"
+        if not self.drift:
+            return "no drift, every response matched its recording"
+        lines = [f"{len(self.drift)} cassettes drifted from the live api:"]
+        for key, messages in sorted(self.drift.items()):
+            lines.extend(f"  {key}: {message}" for message in messages)
+        return "\n".join(lines)
@@ -0,0 +1,188 @@
+"""
+Fail fast when the control plane or the credentials are unusable.
+
+Without this every api test waits out its own timeout, and a run against a down backend or with empty keys takes close
+to an hour to report nothing but errors. A preflight probe at session start, or a few connectivity or authentication
+failures in a row, open the circuit; api tests then skip or error straight away with the reason. While open, a probe
+is sent every cooldown seconds and the first one that gets through closes the circuit again.
+"""
+import threading
+import time
+from typing import Callable
+
+import strongdm
+from strongdm import errors
+
+# Unavailable, the control plane could not be reached at all
+connectivity_error_codes = {14}
+
+
+def is_connectivity_failure(error: Exception) -> bool:
+    """
+    Checks if a call failed because the control plane is unreachable or rejected the credentials,
+    rather than because of anything about the call itself
+    :param error: Exception
+    :return: bool
+    """
+    if isinstance(error, (errors.AuthenticationError, errors.TimeoutError)):
+        return True
+    return type(error) is errors.RPCError and error.code in connectivity_error_codes
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a call while the circuit is open
+    """
+    def __init__(self, reason: str):
+        super().__init__(f"The api circuit breaker is open: {reason}")
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    Closed, calls go through and consecutive connectivity failures are counted.
+    Open, calls fail at once with the reason it opened.
+    Half open, once the cooldown has passed a single probe, or a single call when there is no probe, decides whether
+    the circuit closes or stays open for another cooldown.
+    """
+    def __init__(self, threshold: int = 3, cooldown: float = 30, probe: Callable = None):
+        """
+        :param threshold: int consecutive connectivity failures that open the circuit
+        :param cooldown: float seconds between attempts to close an open circuit
+        :param probe: callable that raises when the control plane is unusable
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.probe = probe
+        self.failures = 0
+        self.reason = None
+        self.opened_at = None
+        self.trial_running = False
+        self.trips = 0
+        self.short_circuited = 0
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.reason is not None
+
+    def trip(self, reason: str):
+        """
+        Opens the circuit
+        :param reason: str shown on every call and test it stops
+        """
+        with self.lock:
+            if self.reason is None:
+                self.trips += 1
+            self.reason = reason
+            self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def reset(self):
+        """
+        Closes the circuit
+        """
+        with self.lock:
+            self.reason = None
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def check_probe(self) -> bool:
+        """
+        Runs the probe and opens or closes the circuit on its result
+        :return: bool True if the control plane is usable
+        """
+        try:
+            self.probe()
+        except Exception as e:
+            self.trip(f"probe failed with {type(e).__name__}: {e}")
+            return False
+        self.reset()
+        return True
+
+    def blocks(self) -> bool:
+        """
+        Checks, without starting a trial, if an open circuit would turn a call away right now
+        :return: bool
+        """
+        with self.lock:
+            return self.reason is not None and (self.trial_running or time.monotonic() - self.opened_at < self.cooldown)
+
+    def allow(self) -> bool:
+        """
+        Checks if a call or test may talk to the control plane, probing first when an open circuit's cooldown is up
+        :return: bool
+        """
+        with self.lock:
+            if self.reason is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.cooldown:
+                self.short_circuited += 1
+                return False
+            self.trial_running = True
+
+        if self.probe is not None:
+            return self.check_probe()
+        # With no probe the caller's own call is the trial, its result closes or reopens the circuit
+        return True
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if a call should not be made
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.reason)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.reason is not None and self.trial_running:
+                self.reason = None
+                self.opened_at = None
+                self.trial_running = False
+
+    def record_failure(self, error: Exception):
+        """
+        Counts a failed call, only connectivity and authentication failures count towards opening the circuit
+        :param error: Exception
+        """
+        if not is_connectivity_failure(error):
+            self.record_success()
+            return
+
+        with self.lock:
+            self.failures += 1
+            should_trip = self.failures >= self.threshold or self.trial_running
+        if should_trip:
+            self.trip(f"{self.failures} api calls in a row failed, the last with {type(error).__name__}: {error}")
+
+    def report(self) -> str:
+        """
+        :return: str
+        """
+        state = f"open, {self.reason}" if self.is_open else "closed"
+        return f"circuit {state}, tripped {self.trips} times, {self.short_circuited} calls or tests short circuited"
+
+
+def preflight(credentials: dict, host: str = None, timeout: int = 5) -> Callable:
+    """
+    Gets a probe that checks the api keys are set and makes one cheap, authenticated call with them
+    :param credentials: dict of api_access_key and api_secret
+    :param host: str control plane address, the sdk default if None
+    :param timeout: int seconds the probe call may take
+    :return: callable that raises if the control plane can not be used
+    """
+    def probe():
+        missing = [name for name, value in credentials.items() if not value]
+        if missing:
+            raise ValueError(f"{', '.join(missing)} not set, export SDM_API_ACCESS_KEY and SDM_API_SECRET_KEY")
+
+        client = strongdm.Client(**credentials, **({"host": host} if host else dict()))
+        try:
+            # An id that can not exist, so the control plane answers without scanning anything
+            list(client.roles.list("id:?", "r-preflight", timeout=timeout))
+        finally:
+            client.close()
+
+    return probe
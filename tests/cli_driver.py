@@ -0,0 +1,198 @@
+import asyncio
+import codecs
+import contextvars
+import json
+import shlex
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from tests.json_stream import ArraySearch
+
+# The test a scenario is running for, set inside each scenario's task so its commands can be attributed to it
+current_test_id = contextvars.ContextVar("current_test_id", default=None)
+
+
+@dataclass
+class CommandResult:
+    """
+    The outcome of a single cli invocation
+    """
+    command: str
+    exit_code: int
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    test_id: str = None
+    # The command was terminated once the output it had printed so far answered the question
+    stopped_early: bool = False
+
+    def json(self):
+        """
+        Parses stdout as json
+        :return: object
+        """
+        return json.loads(self.stdout)
+
+
+def check_search(result: CommandResult, search: ArraySearch):
+    """
+    Raises if a streamed command timed out or never printed a complete json list
+    :param result: CommandResult
+    :param search: ArraySearch
+    """
+    if result.timed_out:
+        raise TimeoutError(f"'{result.command}' timed out after {result.duration:.1f}s")
+    if not search.decided:
+        raise ValueError(f"'{result.command}' did not print a json list: {search.head!r} {result.stderr}")
+
+
+async def read_tail(stream: asyncio.StreamReader, limit: int = 65536) -> bytes:
+    """
+    Drains a stream, keeping only its last limit bytes
+    """
+    tail = b""
+    while True:
+        chunk = await stream.read(limit)
+        if not chunk:
+            return tail
+        tail = (tail + chunk)[-limit:]
+
+
+class CliDriver:
+    """
+    Runs cli commands as asyncio subprocesses, with at most max_concurrency running at once
+    """
+    def __init__(self, max_concurrency: int = 4, timeout: float = 60):
+        """
+        :param max_concurrency: int
+        :param timeout: float default seconds before a command is killed
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.semaphore = None
+        self.results = list()
+
+    async def run(self, command: str, timeout: float = None) -> CommandResult:
+        """
+        Runs a command and captures its output and exit code
+        :param command: str
+        :param timeout: float seconds before the command is killed, defaults to the driver's timeout
+        :return: CommandResult
+        """
+        # The semaphore belongs to whichever event loop first runs a command
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = self.timeout if timeout is None else timeout
+        async with self.semaphore:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(command),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            timed_out = False
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                process.kill()
+                stdout, stderr = await process.communicate()
+
+            result = CommandResult(
+                command=command,
+                exit_code=process.returncode,
+                stdout=stdout.decode("utf-8", errors="replace"),
+                stderr=stderr.decode("utf-8", errors="replace"),
+                duration=time.perf_counter() - start,
+                timed_out=timed_out,
+                test_id=current_test_id.get(),
+            )
+
+        self.results.append(result)
+        return result
+
+    async def first_json(self, command: str, predicate: Callable = None, ruled_out: Callable = None,
+                         timeout: float = None, chunk_size: int = 65536):
+        """
+        Streams the json list a command prints and returns the first element matching predicate.
+        The command is killed as soon as a match is found or ruled_out gives up on an element, so the time and memory
+        a lookup takes do not grow with the size of the org.
+        :param command: str ie 'sdm admin users list --json'
+        :param predicate: callable taking an element, any element matches by default
+        :param ruled_out: callable taking an element that did not match, True once no later element can match
+        :param timeout: float seconds before the command is killed, defaults to the driver's timeout
+        :param chunk_size: int bytes read from stdout at a time
+        :return: the matching element, or None
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = self.timeout if timeout is None else timeout
+        search = ArraySearch(predicate, ruled_out)
+        async with self.semaphore:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(command),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stderr = asyncio.ensure_future(read_tail(process.stderr))
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            async def consume():
+                while not search.decided:
+                    chunk = await process.stdout.read(chunk_size)
+                    if not chunk:
+                        return
+                    search.feed(decoder.decode(chunk))
+                # Whatever follows a complete list is drained so the command can exit on its own
+                if not search.stopped_early:
+                    await read_tail(process.stdout, chunk_size)
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(consume(), timeout=timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+            if timed_out or search.stopped_early:
+                process.kill()
+            await process.wait()
+
+            result = CommandResult(
+                command=command,
+                exit_code=process.returncode,
+                stdout=search.head,
+                stderr=(await stderr).decode("utf-8", errors="replace"),
+                duration=time.perf_counter() - start,
+                timed_out=timed_out,
+                test_id=current_test_id.get(),
+                stopped_early=search.stopped_early,
+            )
+
+        self.results.append(result)
+        check_search(result, search)
+        return search.found
+
+    async def gather(self, *scenarios) -> list:
+        """
+        Runs independent scenario coroutines concurrently
+        :param scenarios: coroutines
+        :return: list of each scenario's return value or the exception it raised
+        """
+        return await asyncio.gather(*scenarios, return_exceptions=True)
+
+
+def timing_report(results: list) -> str:
+    """
+    Summarizes command durations, slowest first
+    :param results: list of CommandResult
+    :return: str
+    """
+    lines = [f"{'seconds':>8}  {'exit':>4}  command"]
+    for result in sorted(results, key=lambda item: item.duration, reverse=True):
+        exit_code = "T/O" if result.timed_out else result.exit_code
+        lines.append(f"{result.duration:8.3f}  {exit_code:>4}  {result.command}")
+    return "\n".join(lines)
@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+import strongdm
+from strongdm.errors import RPCError
+
+# grpc status codes that mean the channel or credentials are bad rather than the request
+connectivity_error_codes = {2, 4, 14, 16}
+
+
+def probe_client(client: strongdm.Client, timeout: int = 5) -> bool:
+    """
+    Makes the cheapest possible round trip to see if a client can still reach the api
+    :param client: strongdm.Client
+    :param timeout: int
+    :return: bool
+    """
+    try:
+        next(iter(client.roles.list("id:r-0000000000000000", timeout=timeout)), None)
+    except RPCError as e:
+        return e.code not in connectivity_error_codes
+    except Exception:
+        return False
+
+    return True
+
+
+class ClientPool:
+    """
+    A thread safe pool of authenticated clients that tests lease one at a time.
+    Each pytest-xdist worker is its own process and builds its own pool.
+    """
+    def __init__(self, factory: Callable[[], strongdm.Client], size: int = 4, health_check_interval: float = 30.0,
+                 probe: Callable[[strongdm.Client], bool] = probe_client):
+        """
+        :param factory: callable that builds a new authenticated client
+        :param size: int max number of clients alive at once
+        :param health_check_interval: float seconds a client may sit idle before it is probed again
+        :param probe: callable that returns False when a client should be rebuilt
+        """
+        self.factory = factory
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.probe = probe
+        self.idle = queue.LifoQueue()
+        self.leased = dict()
+        self.last_checked = dict()
+        self.created = 0
+        self.reconnects = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _new_client(self) -> strongdm.Client:
+        client = self.factory()
+        self.last_checked[id(client)] = time.monotonic()
+        return client
+
+    def _build(self) -> strongdm.Client:
+        """
+        Builds a client for a slot already counted in created, giving the slot back if the factory fails
+        :return: strongdm.Client
+        """
+        try:
+            return self._new_client()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def _discard(self, client: strongdm.Client):
+        self.last_checked.pop(id(client), None)
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, client: strongdm.Client) -> bool:
+        last_checked = self.last_checked.get(id(client), 0)
+        if time.monotonic() - last_checked < self.health_check_interval:
+            return True
+
+        healthy = self.probe(client)
+        if healthy:
+            self.last_checked[id(client)] = time.monotonic()
+        return healthy
+
+    def lease(self, timeout: float = None) -> strongdm.Client:
+        """
+        Takes a client out of the pool, building one if the pool is not full yet
+        :param timeout: float seconds to wait for a client to be released
+        :return: strongdm.Client
+        """
+        if self.closed:
+            raise RuntimeError("The client pool is closed")
+
+        client = None
+        try:
+            client = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                build = self.created < self.size
+                if build:
+                    self.created += 1
+            if build:
+                client = self._build()
+                with self.lock:
+                    self.leased[id(client)] = client
+                return client
+
+        if client is None:
+            try:
+                client = self.idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No client was released within {timeout} seconds")
+
+        if not self._is_healthy(client):
+            self._discard(client)
+            client = self._build()
+            with self.lock:
+                self.reconnects += 1
+
+        with self.lock:
+            self.leased[id(client)] = client
+        return client
+
+    def release(self, client: strongdm.Client, healthy: bool = True):
+        """
+        Returns a leased client to the pool
+        :param client: strongdm.Client
+        :param healthy: bool pass False to force the client to be rebuilt
+        """
+        with self.lock:
+            self.leased.pop(id(client), None)
+
+        if self.closed:
+            self._discard(client)
+            return
+
+        if not healthy:
+            self._discard(client)
+            client = self._new_client()
+            with self.lock:
+                self.reconnects += 1
+
+        self.idle.put(client)
+
+    @contextmanager
+    def leased_client(self, timeout: float = None) -> strongdm.Client:
+        """
+        Leases a client for the length of a with block
+        :param timeout: float
+        :return: strongdm.Client
+        """
+        client = self.lease(timeout=timeout)
+        healthy = True
+        try:
+            yield client
+        except RPCError as e:
+            healthy = e.code not in connectivity_error_codes
+            raise
+        finally:
+            self.release(client, healthy=healthy)
+
+    def close(self):
+        """
+        Closes every idle client and any client released afterwards
+        """
+        self.closed = True
+        while True:
+            try:
+                self._discard(self.idle.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,170 @@
+"""
+Composite fixtures.
+
+A grant is a user and a postgres resource carrying the same tag, a role whose access rule grants that tag and the
+attachment of the role to the user. Building one takes five calls in three rounds, so tests that only read a grant
+share one per module or session instead of each building their own.
+
+Shared entities are handed out as copies, so a test changing its copy locally never affects another test. A test that
+has to change an entity on the server asks for a clone instead, copy on write, which is created with a tag of its own
+so nothing it does shows up in queries against the shared grant. Clones are deleted along with the grant.
+"""
+import copy
+import threading
+from dataclasses import dataclass
+
+import strongdm
+
+from tests.batch import Batch, response_entity
+from tests.data_factory import factory
+
+# The client service each part of a grant belongs to
+grant_services = {"user": "accounts", "resource": "resources", "role": "roles", "attachment": "account_attachments"}
+
+
+@dataclass
+class Grant:
+    """
+    The entities of one grant, as they were created
+    """
+    tags: dict
+    user: strongdm.User
+    resource: strongdm.Postgres
+    role: strongdm.Role
+    attachment: strongdm.AccountAttachment
+
+
+def grant_tags() -> dict:
+    """
+    Gets a tag no other grant uses
+    :return: dict
+    """
+    return {"grant": factory.next_case()}
+
+
+def tagged(kind: str, tags: dict):
+    """
+    Builds a new entity of a grant part
+    :param kind: str 'user', 'resource' or 'role'
+    :param tags: dict the grant's tag, set on users and resources and granted by roles
+    :return: a strongdm entity
+    """
+    if kind == "role":
+        return factory.build("role", access_rules=[{"tags": dict(tags)}])
+    entity = factory.build("postgres" if kind == "resource" else kind)
+    entity.tags = dict(tags)
+    return entity
+
+
+def provision_grant(client: strongdm.Client, tags: dict = None) -> Grant:
+    """
+    Creates the user, resource and role of a grant at the same time, then attaches the role to the user.
+    Whatever was created is deleted again if any step fails.
+    :param client: strongdm.Client
+    :param tags: dict, a new tag by default
+    :return: Grant
+    """
+    tags = tags or grant_tags()
+    setup = Batch()
+    creates = {kind: setup.create(getattr(client, grant_services[kind]), tagged(kind, tags))
+               for kind in ["user", "resource", "role"]}
+    setup.run(raise_errors=False)
+
+    try:
+        created = {kind: response_entity(create.result()) for kind, create in creates.items()}
+        attachment = strongdm.AccountAttachment(account_id=created["user"].id, role_id=created["role"].id)
+        created["attachment"] = client.account_attachments.create(attachment, timeout=30).account_attachment
+    except Exception:
+        with Batch() as teardown:
+            for kind, create in creates.items():
+                teardown.delete_created(getattr(client, grant_services[kind]), create)
+        raise
+
+    # The tag is read back from the server, so a grant answered from a recording carries the recorded tag
+    return Grant(tags=dict(created["user"].tags or tags), **created)
+
+
+def remove_grant(client: strongdm.Client, grant: Grant):
+    """
+    Deletes every part of a grant that still exists, the attachment before the user and role it joins
+    :param client: strongdm.Client
+    :param grant: Grant
+    """
+    with Batch() as teardown:
+        teardown.delete(client.account_attachments, grant.attachment.id)
+    with Batch() as teardown:
+        for kind in ["user", "resource", "role"]:
+            teardown.delete(getattr(client, grant_services[kind]), getattr(grant, kind).id)
+
+
+class SharedGrant:
+    """
+    A grant built once and read by many tests, with copy on write for the tests that change it
+    """
+    def __init__(self, client: strongdm.Client):
+        """
+        :param client: strongdm.Client the grant, its clones and its forks are created and deleted with
+        """
+        self.client = client
+        self.grant = provision_grant(client)
+        self.clones = list()
+        self.forks = list()
+        self.lock = threading.Lock()
+
+    @property
+    def tags(self) -> dict:
+        return dict(self.grant.tags)
+
+    @property
+    def user(self) -> strongdm.User:
+        return copy.deepcopy(self.grant.user)
+
+    @property
+    def resource(self) -> strongdm.Postgres:
+        return copy.deepcopy(self.grant.resource)
+
+    @property
+    def role(self) -> strongdm.Role:
+        return copy.deepcopy(self.grant.role)
+
+    @property
+    def attachment(self) -> strongdm.AccountAttachment:
+        return copy.deepcopy(self.grant.attachment)
+
+    def clone(self, kind: str):
+        """
+        Creates a private copy of the user, resource or role for a test that changes it on the server.
+        The copy has a tag of its own, a cloned role grants that tag rather than the shared one.
+        :param kind: str 'user', 'resource' or 'role'
+        :return: the created entity
+        """
+        if kind not in ("user", "resource", "role"):
+            raise ValueError(f"Can not clone a grant's {kind}, fork the whole grant instead")
+
+        service = getattr(self.client, grant_services[kind])
+        entity = response_entity(service.create(tagged(kind, grant_tags()), timeout=30))
+        with self.lock:
+            self.clones.append((kind, entity.id))
+        return entity
+
+    def fork(self) -> Grant:
+        """
+        Creates a private grant for a test that changes how its parts relate, ie deletes the attachment
+        :return: Grant
+        """
+        grant = provision_grant(self.client)
+        with self.lock:
+            self.forks.append(grant)
+        return grant
+
+    def close(self):
+        """
+        Deletes the grant, its clones and its forks
+        """
+        with Batch() as teardown:
+            for kind, entity_id in self.clones:
+                teardown.delete(getattr(self.client, grant_services[kind]), entity_id)
+        for grant in self.forks + [self.grant]:
+            remove_grant(self.client, grant)
+        self.clones.clear()
+        self.forks.clear()
@@ -1,11 +1,524 @@
-import random
+import base64
+import inspect
+import time
+from concurrent import futures
+from typing import Callable
 
 import pytest
 import os
 import strongdm
 
+from tests.access import AccessResolver
+from tests.async_client import AsyncClient, run_coroutine_test
+from tests.bench import Benchmark, load_baseline
+from tests.budget import BudgetPlugin
+from tests.cassette import Cassettes
+from tests.circuit_breaker import CircuitBreaker, preflight
+from tests.cli_driver import timing_report
+from tests.client_pool import ClientPool
+from tests.composites import SharedGrant
+from tests.data_factory import factory
+from tests.entity_pool import EntityPool
+from tests.fake_backend import FakeControlPlane
+from tests.health_watcher import ResourceWatcher
+from tests import impact
+from tests.instrumentation import Recorder, instrument, remove_partials, write_partial, write_report
+from tests.namespace import run_token, worker_id
+from tests.scale import Ledger, OrgSeeder, ScaleHistory, default_ledger_path, history_cache_key
+from tests.scheduler import Scheduler
+from tests.sweeper import Sweeper, format_report
+
+# Every cli command run during the session, for the timing report
+cli_results_key = pytest.StashKey[list]()
+# Summary of the orphan sweep run at session start
+sweep_report_key = pytest.StashKey[str]()
+# Api and cli call timings, only set with --latency-report or latency budgets
+recorder_key = pytest.StashKey[Recorder]()
+# How many factory cases had been issued when the test started
+issued_mark_key = pytest.StashKey[int]()
+# How many case ids the factory had handed out when the test started
+cases_mark_key = pytest.StashKey[int]()
+# The scheduler every api call goes through, for its queue wait report
+scheduler_key = pytest.StashKey[Scheduler]()
+# Stops api tests and calls while the control plane is unreachable or the credentials are rejected
+breaker_key = pytest.StashKey[CircuitBreaker]()
+# Records, replays or verifies api traffic, only set with --cassettes
+cassettes_key = pytest.StashKey[Cassettes]()
+# What seeding and tearing down the scale tier's org did, only set with --scale
+scale_report_key = pytest.StashKey[dict]()
+# Latencies of this and earlier --scale runs by org size
+scale_history_key = pytest.StashKey[ScaleHistory]()
+
+
+# --- Pytest Hooks ---
+def pytest_addoption(parser):
+    parser.addoption(
+        "--backend",
+        choices=["live", "fake"],
+        default=os.getenv("SDM_BACKEND", "live"),
+        help="Run the api tests against the live StrongDM control plane or the in-process fake"
+    )
+    parser.addoption(
+        "--entity-pool-size",
+        type=int,
+        default=4,
+        help="Number of users and service accounts pre-created for the pooled fixtures"
+    )
+    parser.addoption(
+        "--cli-concurrency",
+        type=int,
+        default=4,
+        help="Max number of sdm cli commands running at once"
+    )
+    parser.addoption(
+        "--sweep-orphans",
+        action="store_true",
+        default=False,
+        help="Delete entities leaked by earlier interrupted runs before the session starts"
+    )
+    parser.addoption(
+        "--latency-report",
+        default=None,
+        metavar="PATH",
+        help="Time every api call and cli command and write per operation percentiles and the slowest tests as json"
+    )
+    parser.addoption(
+        "--latency-budget",
+        default=None,
+        metavar="SECONDS",
+        help="Default latency budget for every test, a total in seconds and per phase ones, ie '120' or "
+             "'120,setup=30,call=60', a test's latency_budget marker takes precedence"
+    )
+    parser.addoption(
+        "--latency-budget-action",
+        default="fail",
+        choices=["fail", "warn", "off"],
+        help="What a test running over its latency budget does, the breakdown by api call is reported either way"
+    )
+    parser.addoption(
+        "--data-seed",
+        default=None,
+        help="Run token for the data factory, rerun with a failed run's token to rebuild the same entities"
+    )
+    parser.addoption(
+        "--api-rate",
+        type=float,
+        default=None,
+        help="Api calls started per second across all workers, defaults to 20 live and no limit against the fake or "
+             "with --bench"
+    )
+    parser.addoption(
+        "--api-concurrency",
+        type=int,
+        default=8,
+        help="Max api calls in flight per service in each worker"
+    )
+    parser.addoption(
+        "--breaker-threshold",
+        type=int,
+        default=3,
+        help="Consecutive connectivity or authentication failures that open the api circuit breaker"
+    )
+    parser.addoption(
+        "--breaker-cooldown",
+        type=float,
+        default=30,
+        help="Seconds between probes of the control plane while the api circuit breaker is open"
+    )
+    parser.addoption(
+        "--breaker-action",
+        choices=["error", "skip"],
+        default="error",
+        help="What happens to api tests while the circuit breaker is open"
+    )
+    parser.addoption(
+        "--cassettes",
+        choices=["record", "replay", "verify"],
+        default=None,
+        help="Record every test's api traffic, replay it without the network, or check the live api still matches it"
+    )
+    parser.addoption(
+        "--cassette-dir",
+        default=None,
+        metavar="PATH",
+        help="Where cassettes are kept, defaults to tests/cassettes"
+    )
+    parser.addoption(
+        "--impact-base",
+        default=None,
+        metavar="REF",
+        help="Only run the tests affected by the changes since this git ref, according to earlier runs"
+    )
+    parser.addoption(
+        "--full-run",
+        action="store_true",
+        default=False,
+        help="Run every test even when --impact-base is given"
+    )
+    parser.addoption(
+        "--bench",
+        action="store_true",
+        default=False,
+        help="Run only the benchmark workloads and write their results to bench_output.txt"
+    )
+    parser.addoption(
+        "--bench-levels",
+        default="1,4,16",
+        help="Comma separated concurrency levels each benchmark workload runs at"
+    )
+    parser.addoption(
+        "--bench-cycles",
+        type=int,
+        default=50,
+        help="Create, update, list and delete cycles run at each concurrency level"
+    )
+    parser.addoption(
+        "--bench-baseline",
+        default=None,
+        metavar="PATH",
+        help="bench_output.txt from an earlier run to compare against, workloads that regressed fail"
+    )
+    parser.addoption(
+        "--bench-tolerance",
+        type=float,
+        default=1.5,
+        help="Factor latency or throughput may move by against the baseline before it counts as a regression"
+    )
+    parser.addoption(
+        "--scale",
+        type=int,
+        default=None,
+        metavar="COUNT",
+        help="Seed the org with this many users, service accounts, roles and resources, then run only the find, "
+             "filter and delete tests and report how their latency grows with the org's size"
+    )
+    parser.addoption(
+        "--scale-seed",
+        default="scale",
+        help="Name of the seed --scale grows and tags its entities with, letters and digits only"
+    )
+    parser.addoption(
+        "--scale-teardown",
+        action="store_true",
+        default=False,
+        help="Delete the seed when the session ends, an interrupted teardown picks up where it stopped next time"
+    )
+    parser.addoption(
+        "--async-workers",
+        type=int,
+        default=16,
+        help="Max sdk calls coroutine tests run at once, across every test sharing the session's executor"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "live: the test can only run against the live StrongDM control plane")
+    config.addinivalue_line("markers", "smoke: a small tier of tests worth running against the live backend")
+    config.addinivalue_line("markers", "bench: a benchmark workload, only run with --bench")
+    config.addinivalue_line("markers", "scale: a find, filter or delete test the --scale tier runs against a large org")
+    config.addinivalue_line("markers", "latency_budget(seconds, setup=None, call=None, teardown=None, cli=None, "
+                                       "action=None): fail the test once it runs longer than this")
+    if config.getoption("--scale") is not None:
+        # Every call's latency is kept to show how it scales
+        config.option.latency_report = config.option.latency_report or str(config.cache.mkdir("scale") / "latency.json")
+    if config.getoption("--latency-report"):
+        config.stash[recorder_key] = Recorder()
+    # An xdist controller runs no tests itself, it only gathers the overruns its workers report
+    xdist_controller = getattr(config.option, "numprocesses", None) and not hasattr(config, "workerinput")
+    if config.getoption("--latency-budget") or xdist_controller:
+        enable_budgets(config)
+    if config.getoption("--data-seed"):
+        factory.reseed(config.getoption("--data-seed"))
+    if config.getoption("--cassettes"):
+        directory = config.getoption("--cassette-dir") or str(config.rootpath / "tests" / "cassettes")
+        config.stash[cassettes_key] = Cassettes(directory, config.getoption("--cassettes"), worker_id())
+    config.stash[breaker_key] = CircuitBreaker(threshold=config.getoption("--breaker-threshold"),
+                                               cooldown=config.getoption("--breaker-cooldown"))
+    if getattr(config, "cache", None) is not None:
+        config.pluginmanager.register(impact.ImpactPlugin(config), "impact")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_sessionstart(session):
+    config = session.config
+    # Worker dumps a crashed run never merged would otherwise be merged into this run's report
+    if config.getoption("--latency-report") and not hasattr(config, "workerinput"):
+        remove_partials(config.getoption("--latency-report"))
+    if config.getoption("--backend") == "fake" or replaying(config):
+        return
+
+    # One cheap call up front, so empty keys or a down control plane stop the run in seconds instead of an hour
+    breaker = config.stash[breaker_key]
+    breaker.probe = preflight(get_client_credentials())
+    if not breaker.check_probe():
+        return
+
+    # Only the xdist controller sweeps and seeds, before any worker has created anything of its own
+    if hasattr(config, "workerinput"):
+        return
+
+    client = strongdm.Client(**get_client_credentials())
+    if config.getoption("--sweep-orphans"):
+        # Whatever this run or a rerun of an earlier one with --data-seed creates is never swept
+        sweeper = Sweeper(client, exclude_tokens={run_token, factory.token})
+        config.stash[sweep_report_key] = format_report(sweeper.sweep())
+    if config.getoption("--scale") is not None:
+        seeder = scale_seeder(config, client)
+        config.stash[scale_report_key] = {"seed": seeder.seed_org(config.getoption("--scale")),
+                                          "size": len(seeder.ledger)}
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item):
+    item.stash[issued_mark_key] = len(factory.issued)
+    item.stash[cases_mark_key] = len(factory.cases)
+    scheduler = item.config.stash.get(scheduler_key, None)
+    if scheduler is not None:
+        scheduler.services_used.clear()
+    cassettes = item.config.stash.get(cassettes_key, None)
+    if cassettes is not None:
+        cassettes.begin(item.nodeid)
+        if cassettes.mode == "replay":
+            factory.replay(cassettes.recorded_cases(item.nodeid))
+    recorder = item.config.stash.get(recorder_key, None)
+    if recorder is not None:
+        recorder.current_test = item.nodeid
+    start = time.perf_counter()
+
+    yield
+
+    if recorder is not None:
+        recorder.add_test_duration(item.nodeid, time.perf_counter() - start)
+        recorder.current_test = None
+    if cassettes is not None:
+        cassettes.end(item.nodeid, factory.cases[item.stash[cases_mark_key]:], "api_scheduler" in item.fixturenames)
+        factory.replay(list())
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    # A shared fixture's calls are its own, not those of whichever test happened to need it first or last
+    recorder = request.config.stash.get(recorder_key, None)
+    if recorder is None or fixturedef.scope == "function":
+        yield
+        return
+    owner = f"{fixturedef.scope} fixture {fixturedef.argname}"
+    recorder.charge_to(owner)
+    try:
+        yield
+    finally:
+        recorder.uncharge()
+        # Run before the fixture's own teardown, pytest_fixture_post_finalizer uncharges after it
+        fixturedef.addfinalizer(lambda: recorder.charge_to(owner))
+
+
+def pytest_fixture_post_finalizer(fixturedef, request):
+    recorder = request.config.stash.get(recorder_key, None)
+    if recorder is not None and fixturedef.scope != "function":
+        recorder.uncharge()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    # Coroutine tests, ie ones awaiting async_client calls, run on an event loop of their own
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        run_coroutine_test(pyfuncitem.obj, {arg: pyfuncitem.funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames})
+        return True
+    return None
+
+
+def pytest_runtest_setup(item):
+    # Every fixture that talks to the control plane goes through the scheduler
+    if replaying(item.config) and "api_scheduler" in item.fixturenames \
+            and item.config.stash[cassettes_key].test_cassette(item.nodeid) is None:
+        pytest.skip("no cassette was recorded for this test, run it with --cassettes=record first")
+
+    breaker = item.config.stash[breaker_key]
+    if "api_scheduler" not in item.fixturenames or not breaker.blocks():
+        return
+
+    with breaker.lock:
+        breaker.short_circuited += 1
+    message = f"The api circuit breaker is open: {breaker.reason}"
+    if item.config.getoption("--breaker-action") == "skip":
+        pytest.skip(message)
+    pytest.fail(message, pytrace=False)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when == "teardown":
+        report.impact = sorted(dependency_keys(item))
+    if not report.failed:
+        return
+
+    cases = factory.issued[item.stash.get(issued_mark_key, 0):]
+    if cases:
+        lines = [f"DataFactory.regenerate({kind!r}, {case!r})" for kind, case in cases]
+        report.sections.append(("data factory cases", "\n".join(lines)))
+
+
+def dependency_keys(item) -> set:
+    """
+    Gets what a test depended on, for impact selection
+    :return: set of dependency keys
+    """
+    root = str(item.config.rootpath)
+    conftest = impact.module_info(os.path.join(root, impact.conftest_path))
+    keys = impact.static_dependencies(root, os.path.relpath(str(item.path), root),
+                                      getattr(item, "originalname", item.name), conftest)
+    keys |= {f"fixture:{name}" for name in item.fixturenames}
+    scheduler = item.config.stash.get(scheduler_key, None)
+    if scheduler is not None:
+        keys |= {f"service:{service}" for service in scheduler.services_used}
+    return keys
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    cassettes = config.stash.get(cassettes_key, None)
+    if cassettes is not None:
+        cassettes.close()
+
+    recorder = config.stash.get(recorder_key, None)
+    if recorder is None or not config.getoption("--latency-report"):
+        return
+
+    recorder.add_cli_results(config.stash.get(cli_results_key, list()))
+    path = config.getoption("--latency-report")
+    # Workers hand their records to the controller, which writes the one report
+    if hasattr(config, "workerinput"):
+        write_partial(recorder, path, config.workerinput["workerid"])
+        return
+    write_report(recorder, path)
+
+    if config.getoption("--scale") is not None:
+        report = config.stash.setdefault(scale_report_key, dict())
+        history = ScaleHistory(config.cache.get(history_cache_key, None))
+        size = report.get("size", config.getoption("--scale"))
+        history.record(size, recorder.report(slowest=len(recorder.test_durations)))
+        config.cache.set(history_cache_key, history.dump())
+        config.stash[scale_history_key] = history
+        if config.getoption("--scale-teardown") and config.getoption("--backend") != "fake":
+            report["teardown"] = scale_seeder(config, strongdm.Client(**get_client_credentials())).teardown()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    sweep_report = config.stash.get(sweep_report_key, None)
+    if sweep_report:
+        terminalreporter.write_sep("-", "orphan sweep")
+        terminalreporter.write_line(sweep_report)
+
+    cli_results = config.stash.get(cli_results_key, None)
+    if cli_results:
+        terminalreporter.write_sep("-", "sdm cli command timings")
+        terminalreporter.write_line(timing_report(cli_results))
+
+    cassettes = config.stash.get(cassettes_key, None)
+    if cassettes is not None:
+        terminalreporter.write_sep("-", "cassettes")
+        terminalreporter.write_line(cassettes.report())
+
+    history = config.stash.get(scale_history_key, None)
+    if history is not None:
+        report = config.stash.get(scale_report_key, dict())
+        terminalreporter.write_sep("-", "org scale")
+        if "seed" in report:
+            terminalreporter.write_line(f"seeded org of {report['size']} entities: {report['seed']}")
+        terminalreporter.write_line("api call p95 by seeded entities")
+        terminalreporter.write_line(history.table("operations"))
+        terminalreporter.write_line("test duration by seeded entities")
+        terminalreporter.write_line(history.table("tests"))
+        if "teardown" in report:
+            terminalreporter.write_line(f"seed teardown: {report['teardown']}")
+
+    breaker = config.stash.get(breaker_key, None)
+    if breaker is not None and breaker.trips:
+        terminalreporter.write_sep("-", "api circuit breaker")
+        terminalreporter.write_line(breaker.report())
+
+    scheduler = config.stash.get(scheduler_key, None)
+    if scheduler is not None and scheduler.calls:
+        terminalreporter.write_sep("-", "api scheduler")
+        terminalreporter.write_line(scheduler.report())
+
+    if config.getoption("--latency-report") and not hasattr(config, "workerinput"):
+        terminalreporter.write_line(f"api latency report written to {config.getoption('--latency-report')}")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmark mode runs nothing but the benchmarks, and the benchmarks never run outside of it
+    if config.getoption("--bench"):
+        config.hook.pytest_deselected(items=[item for item in items if "bench" not in item.keywords])
+        items[:] = [item for item in items if "bench" in item.keywords]
+    else:
+        skip_bench = pytest.mark.skip(reason="only runs with --bench")
+        for item in items:
+            if "bench" in item.keywords:
+                item.add_marker(skip_bench)
+
+    # The scale tier runs only the tests whose latency depends on the size of the org
+    if config.getoption("--scale") is not None:
+        config.hook.pytest_deselected(items=[item for item in items if "scale" not in item.keywords])
+        items[:] = [item for item in items if "scale" in item.keywords]
+
+    # Without a default budget, calls are only timed for budgets when a test selected carries a marker
+    if any(item.get_closest_marker("latency_budget") is not None for item in items):
+        enable_budgets(config)
+
+    if config.getoption("--backend") != "fake":
+        return
+
+    skip_live = pytest.mark.skip(reason="requires the live StrongDM control plane")
+    for item in items:
+        if "live" in item.keywords:
+            item.add_marker(skip_live)
+
 
 # --- Shared Functions ---
+def replaying(config) -> bool:
+    cassettes = config.stash.get(cassettes_key, None)
+    return cassettes is not None and cassettes.mode == "replay"
+
+
+def enable_budgets(config):
+    """
+    Times every api call and registers the latency budget plugin, which needs those timings to say where an
+    overrun went, unless budgets are turned off or already enabled
+    :param config: pytest config
+    """
+    if config.getoption("--latency-budget-action") == "off" or config.pluginmanager.has_plugin("budget"):
+        return
+    if recorder_key not in config.stash:
+        config.stash[recorder_key] = Recorder()
+    config.pluginmanager.register(BudgetPlugin(config, config.stash[recorder_key], cli_results_key), "budget")
+
+
+def scale_seeder(config, client: strongdm.Client) -> OrgSeeder:
+    """
+    Gets the seeder for the live org, its ledger kept in the pytest cache so seeding and teardown can resume
+    :param config: pytest config
+    :param client: strongdm.Client
+    :return: OrgSeeder
+    """
+    seed = config.getoption("--scale-seed")
+    return OrgSeeder(client, seed, Ledger(default_ledger_path(str(config.rootpath), seed)),
+                     rate=config.getoption("--api-rate") or 20)
+
+
+def get_client_credentials() -> dict:
+    """
+    Gets the api keys from the OS
+    :return: dict
+    """
+    return {
+        "api_access_key": os.getenv("SDM_API_ACCESS_KEY", ""),
+        "api_secret": os.getenv("SDM_API_SECRET_KEY", "")
+    }
+
+
 def get_user(first: str = None, last: str = None, email_address: str = None) -> strongdm.User:
     """
     Creates a prepopulated strongdm user
@@ -14,16 +527,7 @@ def get_user(first: str = None, last: str = None, email_address: str = None) ->
     :param email_address: str
     :return: strongdm.User
     """
-    if not first:
-        first = f"Tacos{random.randint(100000, 999999)}"
-
-    if not last:
-        last = f"McMuffin{random.randint(100000, 999999)}"
-
-    if not email_address:
-        email_address = f"{first}_{last}_{random.randint(100000, 999999)}@eyepaste.com"
-
-    return strongdm.User(email=email_address, first_name=first, last_name=last)
+    return factory.build("user", first=first, last=last, email=email_address)
 
 
 def get_role(name: str = None, access_rules: list = None) -> strongdm.Role:
@@ -33,34 +537,25 @@ def get_role(name: str = None, access_rules: list = None) -> strongdm.Role:
     :param access_rules: list
     :return: strongdm.Role
     """
-    if not name:
-        name = f"ROLL_{random.randint(100000000, 999999999)}"
+    return factory.build("role", name=name, access_rules=access_rules)
 
-    if not access_rules:
-        access_rules = list()
 
-    return strongdm.Role(name=name, access_rules=access_rules)
+def get_service(name: str = None) -> strongdm.Service:
+    """
+    Creates a prepopulated strongdm service account
+    :param name: str
+    :return: strongdm.Service
+    """
+    return factory.build("service", name=name)
 
 
-def get_resource_postgres(num: int = None) -> strongdm.Postgres:
+def get_resource_postgres(num: str = None) -> strongdm.Postgres:
     """
     Creates a prepopulated strongdm postgres
-    :param num: int
+    :param num: str
     :return: strongdm.Postgres
     """
-    if not num:
-        num = random.randint(1000000, 9999999)
-
-    postgres = strongdm.Postgres(
-        name=f"Fake Postgres Resource{num}",
-        hostname=f"foo{num}.bar.com",
-        port=5432,
-        username=f"foo{num}",
-        password="test123",
-        database="foo"
-    )
-
-    return postgres
+    return factory.build("postgres", case=num)
 
 
 # --- Fixtures ---
@@ -70,22 +565,173 @@ def get_client_credentials_fixture() -> dict:
     Gets the api keys from the OS
     :return: dict
     """
-    creds = {
-        "api_access_key": os.getenv("SDM_API_ACCESS_KEY", ""),
-        "api_secret": os.getenv("SDM_API_SECRET_KEY", "")
-    }
+    return get_client_credentials()
+
+
+@pytest.fixture(scope="session", name="fake_control_plane")
+def fake_control_plane_fixture(request) -> FakeControlPlane:
+    """
+    Starts the in-process fake control plane when running with --backend=fake
+    :return: FakeControlPlane or None
+    """
+    # Replayed tests never reach a control plane, fake or live
+    if request.config.getoption("--backend") != "fake" or replaying(request.config):
+        yield None
+        return
+
+    control_plane = FakeControlPlane()
+    control_plane.start()
+    # Each process has a fake of its own, so each seeds its own
+    if request.config.getoption("--scale") is not None:
+        seeder = OrgSeeder(create_client(dict(), control_plane), request.config.getoption("--scale-seed"))
+        request.config.stash[scale_report_key] = {"seed": seeder.seed_org(request.config.getoption("--scale")),
+                                                  "size": len(seeder.ledger)}
+    yield control_plane
+    control_plane.stop()
+
+
+@pytest.fixture(name="private_control_plane")
+def private_control_plane_fixture() -> FakeControlPlane:
+    """
+    A fake control plane of the test's own, regardless of --backend, for tests that count or seed what it stores
+    :return: FakeControlPlane
+    """
+    control_plane = FakeControlPlane()
+    control_plane.start()
+    yield control_plane
+    control_plane.stop()
+
+
+def create_client(credentials: dict, fake_control_plane: FakeControlPlane = None,
+                  recorder: Recorder = None, scheduler: Scheduler = None, cassettes: Cassettes = None,
+                  shared: str = None) -> strongdm.Client:
+    """
+    Creates a client for the live api or the fake control plane
+    :param credentials: dict
+    :param fake_control_plane: FakeControlPlane
+    :param recorder: Recorder that times every call made through the client, if given
+    :param scheduler: Scheduler that paces and retries every call made through the client, if given
+    :param cassettes: Cassettes that record or answer every rpc the client makes, if given
+    :param shared: str cassette name for session wide fixture clients, whose calls belong to no one test
+    :return: strongdm.Client
+    """
+    if not fake_control_plane:
+        client = strongdm.Client(**credentials)
+    else:
+        client = strongdm.Client(
+            api_access_key="fake",
+            api_secret=base64.b64encode(b"fake").decode(),
+            host=fake_control_plane.address,
+            insecure=True
+        )
+        # The fake answers instantly, so retrying its internal errors should not cost real seconds
+        client.base_retry_delay = 0.01
+        client.max_retry_delay = 0.05
+
+    # Cassettes sit right on the stubs, so replayed rpcs still pass through everything layered above them
+    if cassettes is not None:
+        cassettes.attach(client, shared)
+    if recorder is not None:
+        instrument(client, recorder)
+    if scheduler is not None:
+        scheduler.attach(client)
+    return client
+
+
+@pytest.fixture(scope="session", name="api_recorder")
+def api_recorder_fixture(request) -> Recorder:
+    """
+    The session's call recorder
+    :return: Recorder or None without --latency-report or a latency budget
+    """
+    return request.config.stash.get(recorder_key, None)
+
+
+@pytest.fixture(scope="session", name="api_cassettes")
+def api_cassettes_fixture(request) -> Cassettes:
+    """
+    The session's cassettes
+    :return: Cassettes or None without --cassettes
+    """
+    return request.config.stash.get(cassettes_key, None)
+
 
-    return creds
+@pytest.fixture(scope="session", name="api_scheduler")
+def api_scheduler_fixture(request) -> Scheduler:
+    """
+    Paces the session's api calls, each xdist worker gets an equal share of the rate
+    :return: Scheduler
+    """
+    config = request.config
+    rate = config.getoption("--api-rate")
+    if rate is None:
+        # Benchmarks look for the control plane's limits, so they are not paced unless asked to be
+        rate = 0 if config.getoption("--backend") == "fake" or config.getoption("--bench") or replaying(config) \
+            else 20
+    workers = int(os.getenv("PYTEST_XDIST_WORKER_COUNT", "1"))
+    scheduler = Scheduler(rate=rate / workers, concurrency=config.getoption("--api-concurrency"),
+                          breaker=config.stash[breaker_key])
+    config.stash[scheduler_key] = scheduler
+    return scheduler
+
+
+@pytest.fixture(scope="session", name="access_resolver")
+def access_resolver_fixture(credentials, fake_control_plane, api_recorder, api_scheduler,
+                            api_cassettes) -> AccessResolver:
+    """
+    Which resources each account can reach, loaded on first use and kept current by every client the tests write with
+    :return: AccessResolver
+    """
+    return AccessResolver(create_client(credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes,
+                                        "access_resolver"))
+
+
+@pytest.fixture(scope="session", name="client_pool")
+def client_pool_fixture(credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes,
+                        access_resolver) -> ClientPool:
+    """
+    A session wide pool of clients so each test does not pay for a new channel and tls handshake
+    :return: ClientPool
+    """
+    pool = ClientPool(
+        lambda: access_resolver.attach(create_client(credentials, fake_control_plane, api_recorder, api_scheduler,
+                                                     api_cassettes)),
+        size=4
+    )
+    yield pool
+    pool.close()
 
 
 @pytest.fixture(name="client")
-def get_client_fixture(credentials) -> strongdm.Client:
+def get_client_fixture(client_pool) -> strongdm.Client:
     """
-    Creates a client
+    Leases a client from the session pool for the length of the test
     :return: strongdm.Client
     """
-    client = strongdm.Client(**credentials)
+    client = client_pool.lease(timeout=60)
     yield client
+    client_pool.release(client)
+
+
+@pytest.fixture(scope="session", name="async_executor")
+def async_executor_fixture(request) -> futures.ThreadPoolExecutor:
+    """
+    The threads every async client call runs on, bounded so gathering many calls can not flood the control plane
+    :return: futures.ThreadPoolExecutor
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=request.config.getoption("--async-workers"),
+                                          thread_name_prefix="sdm-async")
+    yield executor
+    executor.shutdown(wait=True)
+
+
+@pytest.fixture(name="async_client")
+def async_client_fixture(client, async_executor) -> AsyncClient:
+    """
+    The test's leased client with awaitable services, for coroutine tests that gather independent calls
+    :return: AsyncClient
+    """
+    return AsyncClient(client, async_executor)
 
 
 @pytest.fixture(name="user")
@@ -103,7 +749,7 @@ def service_fixture() -> strongdm.Service:
     Creates a strongdm service account
     :return: strongdm.Service
     """
-    return strongdm.Service(name=f"Apple_{random.randint(100000000, 999999999)}")
+    return get_service()
 
 
 @pytest.fixture(name="role")
@@ -124,6 +770,149 @@ def resource_postgres_fixture() -> strongdm.Postgres:
     return get_resource_postgres()
 
 
+@pytest.fixture(scope="session", name="benchmark")
+def benchmark_fixture(request) -> Benchmark:
+    """
+    Collects every workload's results and writes them to bench_output.txt when the session ends
+    :return: Benchmark
+    """
+    config = request.config
+    levels = [int(level) for level in config.getoption("--bench-levels").split(",")]
+    benchmark = Benchmark(levels=levels, cycles=config.getoption("--bench-cycles"))
+    yield benchmark
+
+    regressions = list()
+    if config.getoption("--bench-baseline"):
+        regressions = benchmark.compare(load_baseline(config.getoption("--bench-baseline")),
+                                        config.getoption("--bench-tolerance"))
+    benchmark.write(str(config.rootpath / "bench_output.txt"), regressions)
+
+
+@pytest.fixture(name="resource")
+def resource_fixture(request):
+    """
+    Builds the resource kind a test is parametrized with, so nothing is built at collection time
+    :return: a strongdm resource
+    """
+    return factory.build(request.param)
+
+
+@pytest.fixture(name="node")
+def node_fixture(request):
+    """
+    Builds the node kind a test is parametrized with
+    :return: strongdm.Gateway or strongdm.Relay
+    """
+    return factory.build(request.param)
+
+
+@pytest.fixture(scope="session", name="entity_pool")
+def entity_pool_fixture(request, credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes,
+                        access_resolver) -> EntityPool:
+    """
+    Pre-creates entities that tests lease instead of creating and deleting their own
+    :return: EntityPool
+    """
+    client = create_client(credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes, "entity_pool")
+    pool = EntityPool(access_resolver.attach(client),
+                      size=request.config.getoption("--entity-pool-size"))
+    pool.register("user", "accounts", get_user)
+    pool.register("service_account", "accounts", get_service)
+    pool.warm()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="session", name="resource_watcher")
+def resource_watcher_fixture(credentials, fake_control_plane, api_recorder, api_scheduler,
+                             api_cassettes) -> ResourceWatcher:
+    """
+    One shared poller for every test waiting on resource health
+    :return: ResourceWatcher
+    """
+    watcher = ResourceWatcher(create_client(credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes,
+                                            "resource_watcher"))
+    yield watcher
+    watcher.stop()
+
+
+def lease_pooled(request, entity_pool: EntityPool, cassettes: Cassettes, kind: str):
+    """
+    Leases a pooled entity for a test, the same one it was recorded with when replaying
+    :param request: the fixture's request
+    :param entity_pool: EntityPool
+    :param cassettes: Cassettes or None
+    :param kind: str
+    :return: a copy of the entity
+    """
+    test_id = request.node.nodeid
+    prefer = cassettes.recall(test_id, kind) if cassettes is not None else None
+    entity = entity_pool.lease(kind, owner=test_id, prefer=prefer)
+    if cassettes is not None:
+        cassettes.remember(test_id, kind, entity.id)
+    return entity
+
+
+@pytest.fixture(name="pooled_user")
+def pooled_user_fixture(request, entity_pool, api_cassettes) -> strongdm.User:
+    """
+    Leases an existing user, it is reset when the test finishes
+    :return: strongdm.User
+    """
+    user = lease_pooled(request, entity_pool, api_cassettes, "user")
+    yield user
+    entity_pool.release("user", user)
+
+
+@pytest.fixture(name="pooled_service_account")
+def pooled_service_account_fixture(request, entity_pool, api_cassettes) -> strongdm.Service:
+    """
+    Leases an existing service account, it is reset when the test finishes
+    :return: strongdm.Service
+    """
+    service_account = lease_pooled(request, entity_pool, api_cassettes, "service_account")
+    yield service_account
+    entity_pool.release("service_account", service_account)
+
+
+@pytest.fixture(scope="session", name="grant_client")
+def grant_client_fixture(credentials, fake_control_plane, api_recorder, api_scheduler, api_cassettes,
+                         access_resolver) -> Callable:
+    """
+    Makes the clients shared grants are built with, so building one never waits on a leased test client.
+    Each grant gets a client and shared cassette of its own, so it replays the same whichever test builds it.
+    :return: callable taking the grant's name and returning a strongdm.Client
+    """
+    def make(name: str) -> strongdm.Client:
+        return access_resolver.attach(create_client(credentials, fake_control_plane, api_recorder, api_scheduler,
+                                                    api_cassettes, name))
+
+    return make
+
+
+@pytest.fixture(scope="session", name="session_grant")
+def session_grant_fixture(grant_client) -> SharedGrant:
+    """
+    A user, tagged resource, role granting the tag and attachment built once for the whole session.
+    Read it freely, clone or fork it before changing anything on the server.
+    :return: SharedGrant
+    """
+    grant = SharedGrant(grant_client("session_grant"))
+    yield grant
+    grant.close()
+
+
+@pytest.fixture(scope="module", name="module_grant")
+def module_grant_fixture(request, grant_client) -> SharedGrant:
+    """
+    Like session_grant, but built for and deleted after a single test module
+    :return: SharedGrant
+    """
+    grant = SharedGrant(grant_client(f"module_grant.{request.module.__name__}"))
+    yield grant
+    grant.close()
+
+
 # --- Shared Test Data for Parameterization ---
 punctuation_list = list("~!@#$%^&*()_+|}{[]\":;'<>? `/.,")
 accepted_punctuation_failures = ["\"", "<", ">"]
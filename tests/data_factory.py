@@ -0,0 +1,212 @@
+"""
+Deterministic test data.
+
+Every entity is built from a case id like 'gw3x1a2b3c6a1b2c3d42': the worker, the run's seed token and a counter.
+The same case id always builds the same entity, so a failing case can be rebuilt exactly with
+
+    DataFactory.regenerate("postgres", "gw3x1a2b3c6a1b2c3d42")
+
+and, because the case id doubles as the name suffix, the sweeper recognizes anything the factory built.
+"""
+import re
+import threading
+
+import strongdm
+
+from tests.namespace import next_count, port_range_start, port_slices, ports_per_worker, run_token, token_pattern, \
+    worker_id
+
+case_pattern = re.compile(rf"^(?:main|gw(\d+))x{token_pattern}(\d+)$")
+
+k8_certificate_authority = """-----BEGIN CERTIFICATE-----
+MIIEKjCCAxKgAwIBAgIEOGPe+DANBgkqhkiG9w0BAQUFADCBtDEUMBIGA1UEChMLRW50cnVzdC5u
+ZXQxQDA+BgNVBAsUN3d3dy5lbnRydXN0Lm5ldC9DUFNfMjA0OCBpbmNvcnAuIGJ5IHJlZi4gKGxp
+bWl0cyBsaWFiLikxJTAjBgNVBAsTHChjKSAxOTk5IEVudHJ1c3QubmV0IExpbWl0ZWQxMzAxBgNV
+BAMTKkVudHJ1c3QubmV0IENlcnRpZmljYXRpb24gQXV0aG9yaXR5ICgyMDQ4KTAeFw05OTEyMjQx
+NzUwNTFaFw0yOTA3MjQxNDE1MTJaMIG0MRQwEgYDVQQKEwtFbnRydXN0Lm5ldDFAMD4GA1UECxQ3
+d3d3LmVudHJ1c3QubmV0L0NQU18yMDQ4IGluY29ycC4gYnkgcmVmLiAobGltaXRzIGxpYWIuKTEl
+MCMGA1UECxMcKGMpIDE5OTkgRW50cnVzdC5uZXQgTGltaXRlZDEzMDEGA1UEAxMqRW50cnVzdC5u
+ZXQgQ2VydGlmaWNhdGlvbiBBdXRob3JpdHkgKDIwNDgpMIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8A
+MIIBCgKCAQEArU1LqRKGsuqjIAcVFmQqK0vRvwtKTY7tgHalZ7d4QMBzQshowNtTK91euHaYNZOL
+Gp18EzoOH1u3Hs/lJBQesYGpjX24zGtLA/ECDNyrpUAkAH90lKGdCCmziAv1h3edVc3kw37XamSr
+hRSGlVuXMlBvPci6Zgzj/L24ScF2iUkZ/cCovYmjZy/Gn7xxGWC4LeksyZB2ZnuU4q941mVTXTzW
+nLLPKQP5L6RQstRIzgUyVYr9smRMDuSYB3Xbf9+5CFVghTAp+XtIpGmG4zU/HoZdenoVve8AjhUi
+VBcAkCaTvA5JaJG/+EfTnZVCwQ5N328mz8MYIWJmQ3DW1cAH4QIDAQABo0IwQDAOBgNVHQ8BAf8E
+BAMCAQYwDwYDVR0TAQH/BAUwAwEB/zAdBgNVHQ4EFgQUVeSB0RGAvtiJuQijMfmhJAkWuXAwDQYJ
+KoZIhvcNAQEFBQADggEBADubj1abMOdTmXx6eadNl9cZlZD7Bh/KM3xGY4+WZiT6QBshJ8rmcnPy
+T/4xmf3IDExoU8aAghOY+rat2l098c5u9hURlIIM7j+VrxGrD9cv3h8Dj1csHsm7mhpElesYT6Yf
+zX1XEC+bBAlahLVu2B064dae0Wx5XnkcFMXj0EyTO2U87d89vqbllRrDtRnDvV5bu/8j72gZyxKT
+J1wDLW8w0B62GqzeWvfRqqgnpv55gcR5mTNXuhKwqeBCbJPKVt7+bYQLCIt+jerXmCHG8+c8eS9e
+nNFMFY3h7CI3zJpDC5fcgJCNs2ebb0gIFVbPv/ErfF6adulZkMV8gzURZVE=
+-----END CERTIFICATE-----
+    """
+
+
+def case_port(case: str) -> int:
+    """
+    Gets the port a case uses, from its worker's slice of the port range
+    :param case: str
+    :return: int
+    """
+    match = case_pattern.match(case)
+    if not match:
+        return port_range_start + sum(case.encode()) % ports_per_worker
+    worker_number, index = int(match.group(1) or 0), int(match.group(2))
+    return port_range_start + worker_number % port_slices * ports_per_worker + index % ports_per_worker
+
+
+# --- Builders ---
+def build_user(case: str, first: str = None, last: str = None, email: str = None) -> strongdm.User:
+    first = first or f"Tacos{case}"
+    last = last or f"McMuffin{case}"
+    email = email or f"{first}_{last}_{case}@eyepaste.com"
+    return strongdm.User(email=email, first_name=first, last_name=last)
+
+
+def build_service(case: str, name: str = None) -> strongdm.Service:
+    return strongdm.Service(name=name or f"Apple_{case}")
+
+
+def build_role(case: str, name: str = None, access_rules: list = None) -> strongdm.Role:
+    return strongdm.Role(name=name or f"ROLL_{case}", access_rules=access_rules or list())
+
+
+def build_postgres(case: str) -> strongdm.Postgres:
+    return strongdm.Postgres(
+        name=f"Fake Postgres Resource{case}",
+        hostname=f"foo{case}.bar.com",
+        port=5432,
+        username=f"foo{case}",
+        password="test123",
+        database="foo"
+    )
+
+
+def build_k8_cluster(case: str, certificate_authority: str = None) -> strongdm.AmazonEKS:
+    return strongdm.AmazonEKS(
+        name=f"K8 Cluster {case}",
+        endpoint="https://A1ADBDD0AE833267869C6ED0476D6B41.gr7.us-east-2.eks.amazonaws.com",
+        access_key="CLUSTERAKIAIOSFODNN7",
+        secret_access_key="wJalrXUtnFEMI/K7MDENG/bPxRfiCYCLUSTERKEY",
+        certificate_authority=certificate_authority or k8_certificate_authority,
+        region="us-east-2",
+        cluster_name=f"cluster_{case}",
+        role_arn="arn:aws:iam::000000000000:role/RoleName",
+        healthcheck_namespace="default",
+    )
+
+
+def build_ssh_server(case: str, hostname: str = "hyper.tank.com", port: int = None) -> strongdm.SSH:
+    port = port or case_port(case)
+    return strongdm.SSH(
+        name=f"SSH Server for {hostname}:{port} {case}",
+        hostname=hostname,
+        username=f"ssh_user_{port}",
+        port=port,
+    )
+
+
+def build_gateway(case: str, hostname: str = "apple.berry.com", port: int = None) -> strongdm.Gateway:
+    port = port or case_port(case)
+    return strongdm.Gateway(name=f"gateway{port}_{case}", listen_address=f"{hostname}:{port}")
+
+
+def build_relay(case: str) -> strongdm.Relay:
+    return strongdm.Relay(name=f"relay{case}")
+
+
+builders = {
+    "user": build_user,
+    "service": build_service,
+    "role": build_role,
+    "postgres": build_postgres,
+    "k8_cluster": build_k8_cluster,
+    "ssh_server": build_ssh_server,
+    "gateway": build_gateway,
+    "relay": build_relay,
+}
+
+
+class DataFactory:
+    """
+    Hands out case ids and builds entities from them.
+    The seed is the worker id plus the run's token, random per run unless one is given, so two workers or two runs never
+    share a case id while a run started with the same token hands out the same sequence again.
+    """
+    def __init__(self, token: str = None, worker: str = None):
+        """
+        :param token: str six hex digits, or fourteen with the run's start time, defaults to the run's token
+        :param worker: str, defaults to the current xdist worker
+        """
+        self.token = token or run_token
+        self.worker = worker
+        self.issued = list()
+        # Every case id handed out, built from or not, in order
+        self.cases = list()
+        self.queued = list()
+        self.lock = threading.Lock()
+
+    @property
+    def seed(self) -> str:
+        # The worker is looked up on every call as xdist names its workers after conftest is imported
+        return f"{self.worker or worker_id()}x{self.token}"
+
+    def reseed(self, token: str):
+        """
+        :param token: str six hex digits, or fourteen with the run's start time
+        """
+        if not re.fullmatch(token_pattern, token):
+            raise ValueError(f"Seed token '{token}' should be six or fourteen lowercase hex digits")
+        self.token = token
+
+    def next_case(self) -> str:
+        with self.lock:
+            case = self.queued.pop(0) if self.queued else f"{self.seed}{next_count()}"
+            self.cases.append(case)
+        return case
+
+    def replay(self, cases: list):
+        """
+        Hands out the given case ids, in order, before any new ones, so a replayed test builds what it was recorded with
+        :param cases: list of str
+        """
+        with self.lock:
+            self.queued = list(cases)
+
+    def build(self, kind: str, case: str = None, **overrides):
+        """
+        Builds one entity
+        :param kind: str one of builders, ie 'user' or 'postgres'
+        :param case: str case id to build, a new one by default
+        :param overrides: builder specific fields, ie name or port
+        :return: a strongdm entity
+        """
+        case = case or self.next_case()
+        entity = builders[kind](case, **overrides)
+        with self.lock:
+            self.issued.append((kind, case))
+        return entity
+
+    def batch(self, kind: str, count: int):
+        """
+        Lazily builds count entities of one kind
+        :param kind: str
+        :param count: int
+        :return: generator of entities
+        """
+        for _ in range(count):
+            yield self.build(kind)
+
+    @staticmethod
+    def regenerate(kind: str, case: str):
+        """
+        Builds exactly the entity a case id was built as before
+        :param kind: str
+        :param case: str
+        :return: a strongdm entity
+        """
+        return builders[kind](case)
+
+
+# The suite's shared factory, reseeded from --data-seed
+factory = DataFactory()
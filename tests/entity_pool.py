@@ -0,0 +1,144 @@
+import copy
+import threading
+import warnings
+from typing import Callable
+
+import strongdm
+from strongdm import errors
+
+from tests.batch import Batch, response_entity
+
+
+class EntityPool:
+    """
+    Pre-creates accounts, roles and resources and leases them to tests that only need an existing entity.
+    Leased entities are reset to the state they were created with when they are returned.
+    """
+    def __init__(self, client: strongdm.Client, size: int = 4):
+        """
+        :param client: strongdm.Client dedicated to the pool
+        :param size: int number of entities of each kind created up front
+        """
+        self.client = client
+        self.size = size
+        self.kinds = dict()
+        self.baselines = dict()
+        self.idle = dict()
+        self.leased = dict()
+        self.lock = threading.Lock()
+
+    def register(self, kind: str, service_name: str, builder: Callable):
+        """
+        Adds a kind of entity to the pool
+        :param kind: str ie 'user'
+        :param service_name: str name of the client service, ie 'accounts'
+        :param builder: callable that returns a new unsaved entity
+        """
+        self.kinds[kind] = (service_name, builder)
+        self.idle[kind] = list()
+
+    def service(self, kind: str):
+        return getattr(self.client, self.kinds[kind][0])
+
+    def warm(self):
+        """
+        Creates the initial entities of every registered kind concurrently
+        """
+        batch = Batch()
+        creates = list()
+        for kind, (service_name, builder) in self.kinds.items():
+            for _ in range(self.size):
+                creates.append((kind, batch.create(self.service(kind), builder())))
+        batch.run(raise_errors=False)
+
+        for kind, create in creates:
+            if create.exception() is None:
+                self._add(kind, response_entity(create.result()))
+
+    def _add(self, kind: str, entity):
+        with self.lock:
+            self.baselines[entity.id] = (kind, copy.deepcopy(entity))
+            self.idle[kind].append(entity.id)
+
+    def lease(self, kind: str, owner: str = None, prefer: str = None):
+        """
+        Takes an entity out of the pool, creating one if every entity of that kind is leased
+        :param kind: str
+        :param owner: str usually the test id, reported if the entity is never returned
+        :param prefer: str id of the entity to take if it is idle, ie the one a replayed test was recorded with
+        :return: a copy of the entity that the caller is free to mutate
+        """
+        with self.lock:
+            if prefer in self.idle[kind]:
+                self.idle[kind].remove(prefer)
+                entity_id = prefer
+            else:
+                entity_id = self.idle[kind].pop() if self.idle[kind] else None
+
+        if entity_id is None:
+            service_name, builder = self.kinds[kind]
+            entity = response_entity(self.service(kind).create(builder(), timeout=30))
+            with self.lock:
+                self.baselines[entity.id] = (kind, copy.deepcopy(entity))
+                entity_id = entity.id
+
+        with self.lock:
+            self.leased[entity_id] = owner
+            return copy.deepcopy(self.baselines[entity_id][1])
+
+    def release(self, kind: str, entity):
+        """
+        Resets an entity to its baseline and returns it to the pool.
+        Entities the test deleted or that cannot be reset are dropped.
+        :param kind: str
+        :param entity: the leased entity, releasing one the pool did not lease out raises a ValueError
+        """
+        with self.lock:
+            if entity.id not in self.leased:
+                raise ValueError(f"'{entity.id}' is not leased from the entity pool, it cannot be released")
+            self.leased.pop(entity.id)
+            baseline = copy.deepcopy(self.baselines[entity.id][1])
+
+        try:
+            self.service(kind).update(baseline, timeout=30)
+        except errors.RPCError:
+            self._drop(entity.id)
+            return
+
+        with self.lock:
+            self.idle[kind].append(entity.id)
+
+    def _drop(self, entity_id: str):
+        with self.lock:
+            kind, _ = self.baselines.pop(entity_id)
+        try:
+            self.service(kind).delete(entity_id, timeout=30)
+        except errors.RPCError:
+            pass
+
+    def leaks(self) -> dict:
+        """
+        Gets the entities that are leased but were never returned
+        :return: dict of entity id to owner
+        """
+        with self.lock:
+            return dict(self.leased)
+
+    def close(self):
+        """
+        Warns about leaked entities and deletes everything the pool created
+        """
+        leaks = self.leaks()
+        if leaks:
+            owners = ", ".join(f"{entity_id} ({owner})" for entity_id, owner in leaks.items())
+            warnings.warn(f"Entity pool leases were never returned: {owners}")
+
+        teardown = Batch()
+        for entity_id, (kind, _) in self.baselines.items():
+            teardown.delete(self.service(kind), entity_id)
+        teardown.run(raise_errors=False)
+
+        self.baselines.clear()
+        self.leased.clear()
+        for kind in self.idle:
+            self.idle[kind] = list()
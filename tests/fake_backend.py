@@ -0,0 +1,608 @@
+import fnmatch
+import json
+import secrets
+import shlex
+import string
+import threading
+from concurrent import futures
+
+import grpc
+from google.rpc import status_pb2
+from strongdm import account_attachments_pb2, account_attachments_pb2_grpc, accounts_pb2, accounts_pb2_grpc, drivers_pb2, \
+    nodes_pb2, nodes_pb2_grpc, resources_pb2, resources_pb2_grpc, roles_pb2, roles_pb2_grpc
+
+# --- Validation Rules ---
+# Mirrors the behavior observed against the live control plane (see the bug list in tests/__init__.py)
+forbidden_name_characters = set("\"<>")
+max_service_name_length = 1024
+ascii_whitespace = string.whitespace
+default_page_size = 50
+
+
+class FakeError(Exception):
+    """
+    Raised inside a servicer to abort the current rpc with a status the sdk understands
+    """
+    def __init__(self, code: grpc.StatusCode, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def bad_request(message: str) -> FakeError:
+    return FakeError(grpc.StatusCode.INVALID_ARGUMENT, message)
+
+
+def not_found(message: str) -> FakeError:
+    return FakeError(grpc.StatusCode.NOT_FOUND, message)
+
+
+def already_exists(message: str) -> FakeError:
+    return FakeError(grpc.StatusCode.ALREADY_EXISTS, message)
+
+
+def internal_error(message: str) -> FakeError:
+    return FakeError(grpc.StatusCode.INTERNAL, message)
+
+
+def validate_name(kind: str, name: str):
+    """
+    Applies the name rules shared by accounts, roles, resources and nodes
+    :param kind: str
+    :param name: str
+    """
+    # Only ascii whitespace is rejected, unicode spaces are accepted by the live api
+    if not name.strip(ascii_whitespace):
+        raise bad_request(f"cannot create {kind}: name cannot be empty")
+
+    if forbidden_name_characters.intersection(name):
+        raise bad_request(f"cannot create {kind}: name contains invalid characters")
+
+
+# --- Filters ---
+def parse_filter(filter_string: str) -> list:
+    """
+    Splits a filter like 'name:"foo bar" tags:env=dev' into (field, value) terms
+    :param filter_string: str
+    :return: list
+    """
+    try:
+        tokens = shlex.split(filter_string)
+    except ValueError as e:
+        raise bad_request(f"invalid filter: {e}")
+
+    terms = list()
+    for token in tokens:
+        field, separator, value = token.partition(":")
+        if not separator or not field:
+            raise bad_request(f"invalid filter term '{token}'")
+        terms.append((field.lower(), value))
+
+    return terms
+
+
+def get_field_value(entity, field: str):
+    """
+    Gets a filterable value from a plumbing entity, accounting for the sdk's RO/RW field names
+    :param entity: protobuf message
+    :param field: str
+    :return: object or None when the entity does not have the field
+    """
+    fields = entity.DESCRIPTOR.fields_by_name
+    for name in (f"{field}RO", f"{field}RW", field):
+        if name in fields:
+            return getattr(entity, name)
+
+    return None
+
+
+def matches_term(entity, kind: str, field: str, value: str) -> bool:
+    """
+    Checks a single filter term against a plumbing entity
+    :param entity: protobuf message
+    :param kind: str the oneof name of the entity, ie 'user' or 'postgres'
+    :param field: str
+    :param value: str
+    :return: bool
+    """
+    pattern = value.lower()
+
+    if field == "type":
+        return fnmatch.fnmatchcase(kind, pattern)
+
+    if field == "tags":
+        tags = {pair.name.lower(): pair.value.lower() for pair in entity.tags.pairs}
+        tag_name, separator, tag_value = pattern.partition("=")
+        if tag_name not in tags:
+            return False
+        return not separator or fnmatch.fnmatchcase(tags[tag_name], tag_value)
+
+    if field == "managed":
+        return str(bool(get_field_value(entity, "managed_by"))).lower() == pattern
+
+    actual = get_field_value(entity, field)
+    if actual is None:
+        return False
+
+    if isinstance(actual, bool):
+        actual = str(actual).lower()
+
+    # A list of ids matches any of them, ie 'id:rs-1,rs-2', which the resource watcher polls with
+    if field == "id":
+        return any(fnmatch.fnmatchcase(str(actual).lower(), part) for part in pattern.split(","))
+
+    return fnmatch.fnmatchcase(str(actual).lower(), pattern)
+
+
+# --- Entity Store ---
+class EntityStore:
+    """
+    Thread safe storage for one kind of plumbing entity, ie accounts or resources
+    """
+    def __init__(self, prefix: str, message_class, oneof: str = None):
+        """
+        :param prefix: str used for generated ids, ie 'a' for 'a-0123456789abcdef'
+        :param message_class: the plumbing message class stored
+        :param oneof: str name of the oneof when the message wraps several types
+        """
+        self.prefix = prefix
+        self.message_class = message_class
+        self.oneof = oneof
+        self.entities = dict()
+        self.lock = threading.RLock()
+
+    def new_id(self) -> str:
+        return f"{self.prefix}-{secrets.token_hex(8)}"
+
+    def inner(self, message):
+        """
+        Returns the (kind, concrete message) for an entity wrapped in a oneof
+        """
+        if not self.oneof:
+            return "", message
+
+        kind = message.WhichOneof(self.oneof)
+        if kind is None:
+            raise bad_request(f"cannot create {self.prefix}: no type was specified")
+        return kind, getattr(message, kind)
+
+    def check_id(self, entity_id: str) -> str:
+        """
+        Validates the id format and returns it
+        :param entity_id: str
+        :return: str
+        """
+        if not entity_id:
+            raise bad_request("id cannot be empty")
+
+        prefix, separator, suffix = entity_id.partition("-")
+        if prefix != self.prefix or not separator or not suffix:
+            raise bad_request(f"invalid id '{entity_id}'")
+
+        return entity_id
+
+    def get(self, entity_id: str):
+        with self.lock:
+            entity = self.entities.get(self.check_id(entity_id))
+            if entity is None:
+                raise not_found(f"cannot find entity with id '{entity_id}'")
+
+            copy = self.message_class()
+            copy.CopyFrom(entity)
+            return copy
+
+    def put(self, entity_id: str, message):
+        with self.lock:
+            stored = self.message_class()
+            stored.CopyFrom(message)
+            self.entities[entity_id] = stored
+
+    def delete(self, entity_id: str):
+        with self.lock:
+            if self.entities.pop(self.check_id(entity_id), None) is None:
+                raise not_found(f"cannot find entity with id '{entity_id}'")
+
+    def values(self) -> list:
+        with self.lock:
+            return list(self.entities.values())
+
+    def list(self, filter_string: str) -> list:
+        """
+        Returns copies of every entity that matches all terms of the filter
+        :param filter_string: str
+        :return: list
+        """
+        terms = parse_filter(filter_string)
+        results = list()
+        with self.lock:
+            for entity in self.entities.values():
+                kind, inner = self.inner(entity)
+                if all(matches_term(inner, kind, field, value) for field, value in terms):
+                    copy = self.message_class()
+                    copy.CopyFrom(entity)
+                    results.append(copy)
+
+        return results
+
+
+def paginate(items: list, meta) -> tuple:
+    """
+    Slices a result list according to the request's list metadata
+    :param items: list
+    :param meta: ListRequestMetadata
+    :return: tuple of (page, next_cursor)
+    """
+    start = int(meta.cursor) if meta.cursor.isdigit() else 0
+    limit = meta.limit or default_page_size
+    end = start + limit
+    next_cursor = str(end) if end < len(items) else ""
+    return items[start:end], next_cursor
+
+
+# --- Servicers ---
+def handle_errors(method):
+    """
+    Converts FakeErrors raised by a servicer method into a grpc status with details the sdk can read
+    """
+    def wrapper(self, request, context):
+        try:
+            return method(self, request, context)
+        except FakeError as e:
+            status = status_pb2.Status(code=e.code.value[0], message=e.message)
+            context.set_trailing_metadata((("grpc-status-details-bin", status.SerializeToString()),))
+            context.abort(e.code, e.message)
+
+    return wrapper
+
+
+class AccountsServicer(accounts_pb2_grpc.AccountsServicer):
+    def __init__(self, control_plane):
+        self.control_plane = control_plane
+        self.store = control_plane.accounts
+
+    def validate(self, account, account_id: str = ""):
+        kind, inner = self.store.inner(account)
+        if kind == "user":
+            if not inner.email:
+                raise bad_request("cannot create user: email cannot be empty")
+            validate_name("user", inner.first_name)
+            validate_name("user", inner.last_name)
+            for existing in self.store.values():
+                if existing.WhichOneof("account") == "user" and existing.user.id != account_id \
+                        and existing.user.email.lower() == inner.email.lower():
+                    raise already_exists(f"cannot create user: email '{inner.email}' is already in use")
+        elif kind == "service":
+            validate_name("service account", inner.name)
+            if len(inner.name) > max_service_name_length:
+                raise internal_error("cannot create service account: cannot create entry for service account "
+                                     "storage: internal error: database error")
+            for existing in self.store.values():
+                if existing.WhichOneof("account") == "service" and existing.service.id != account_id \
+                        and existing.service.name == inner.name:
+                    raise already_exists(f"cannot create service account: name '{inner.name}' is already in use")
+        else:
+            raise bad_request(f"cannot create account of type '{kind}'")
+
+    @handle_errors
+    def Create(self, request, context):
+        with self.store.lock:
+            account = request.account
+            self.validate(account)
+            kind, inner = self.store.inner(account)
+            inner.id = self.store.new_id()
+            self.store.put(inner.id, account)
+
+        response = accounts_pb2.AccountCreateResponse(account=account)
+        if kind == "service":
+            response.token = secrets.token_hex(16)
+        return response
+
+    @handle_errors
+    def Get(self, request, context):
+        return accounts_pb2.AccountGetResponse(account=self.store.get(request.id))
+
+    @handle_errors
+    def Update(self, request, context):
+        with self.store.lock:
+            account = request.account
+            kind, inner = self.store.inner(account)
+            existing = self.store.get(inner.id)
+            if existing.WhichOneof("account") != kind:
+                raise bad_request("cannot change the type of an account")
+            self.validate(account, inner.id)
+            self.store.put(inner.id, account)
+
+        return accounts_pb2.AccountUpdateResponse(account=account)
+
+    @handle_errors
+    def Delete(self, request, context):
+        with self.store.lock:
+            self.store.delete(request.id)
+            self.control_plane.remove_attachments(account_id=request.id)
+        return accounts_pb2.AccountDeleteResponse()
+
+    @handle_errors
+    def List(self, request, context):
+        page, next_cursor = paginate(self.store.list(request.filter), request.meta)
+        response = accounts_pb2.AccountListResponse(accounts=page)
+        response.meta.next_cursor = next_cursor
+        return response
+
+
+class RolesServicer(roles_pb2_grpc.RolesServicer):
+    def __init__(self, control_plane):
+        self.control_plane = control_plane
+        self.store = control_plane.roles
+
+    def validate(self, role, role_id: str = ""):
+        validate_name("role", role.name)
+        try:
+            rules = parse_access_rules(role.access_rules)
+        except ValueError as e:
+            raise bad_request(f"cannot create role: invalid access rules: {e}")
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise bad_request("cannot create role: access rules must be objects")
+        for existing in self.store.values():
+            if existing.id != role_id and existing.name == role.name:
+                raise already_exists(f"cannot create role: name '{role.name}' is already in use")
+
+    @handle_errors
+    def Create(self, request, context):
+        with self.store.lock:
+            role = request.role
+            self.validate(role)
+            role.id = self.store.new_id()
+            self.store.put(role.id, role)
+        return roles_pb2.RoleCreateResponse(role=role)
+
+    @handle_errors
+    def Get(self, request, context):
+        return roles_pb2.RoleGetResponse(role=self.store.get(request.id))
+
+    @handle_errors
+    def Update(self, request, context):
+        with self.store.lock:
+            role = request.role
+            self.store.get(role.id)
+            self.validate(role, role.id)
+            self.store.put(role.id, role)
+        return roles_pb2.RoleUpdateResponse(role=role)
+
+    @handle_errors
+    def Delete(self, request, context):
+        with self.store.lock:
+            self.store.delete(request.id)
+            self.control_plane.remove_attachments(role_id=request.id)
+        return roles_pb2.RoleDeleteResponse()
+
+    @handle_errors
+    def List(self, request, context):
+        page, next_cursor = paginate(self.store.list(request.filter), request.meta)
+        response = roles_pb2.RoleListResponse(roles=page)
+        response.meta.next_cursor = next_cursor
+        return response
+
+
+def parse_access_rules(access_rules: str) -> list:
+    """
+    Decodes the json access rules the sdk sends for a role
+    :param access_rules: str
+    :return: list
+    """
+    if not access_rules:
+        return list()
+
+    rules = json.loads(access_rules)
+    if rules is None:
+        return list()
+    if not isinstance(rules, list):
+        raise ValueError("access rules must be a list")
+
+    return rules
+
+
+class ResourcesServicer(resources_pb2_grpc.ResourcesServicer):
+    def __init__(self, control_plane):
+        self.control_plane = control_plane
+        self.store = control_plane.resources
+
+    def validate(self, resource, resource_id: str = ""):
+        kind, inner = self.store.inner(resource)
+        validate_name("resource", inner.name)
+        for existing in self.store.values():
+            _, existing_inner = self.store.inner(existing)
+            if existing_inner.id != resource_id and existing_inner.name == inner.name:
+                raise already_exists(f"cannot create resource: name '{inner.name}' is already in use")
+
+    @handle_errors
+    def Create(self, request, context):
+        with self.store.lock:
+            resource = request.resource
+            self.validate(resource)
+            kind, inner = self.store.inner(resource)
+            inner.id = self.store.new_id()
+            # Nothing is reachable from the fake, so resources start out unhealthy
+            inner.healthy = False
+            self.store.put(inner.id, resource)
+        return resources_pb2.ResourceCreateResponse(resource=resource)
+
+    @handle_errors
+    def Get(self, request, context):
+        return resources_pb2.ResourceGetResponse(resource=self.store.get(request.id))
+
+    @handle_errors
+    def Update(self, request, context):
+        with self.store.lock:
+            resource = request.resource
+            kind, inner = self.store.inner(resource)
+            existing = self.store.get(inner.id)
+            if existing.WhichOneof("resource") != kind:
+                raise bad_request("cannot change the type of a resource")
+            self.validate(resource, inner.id)
+            inner.healthy = getattr(existing, kind).healthy
+            self.store.put(inner.id, resource)
+        return resources_pb2.ResourceUpdateResponse(resource=resource)
+
+    @handle_errors
+    def Delete(self, request, context):
+        self.store.delete(request.id)
+        return resources_pb2.ResourceDeleteResponse()
+
+    @handle_errors
+    def List(self, request, context):
+        page, next_cursor = paginate(self.store.list(request.filter), request.meta)
+        response = resources_pb2.ResourceListResponse(resources=page)
+        response.meta.next_cursor = next_cursor
+        return response
+
+
+class NodesServicer(nodes_pb2_grpc.NodesServicer):
+    def __init__(self, control_plane):
+        self.control_plane = control_plane
+        self.store = control_plane.nodes
+
+    def validate(self, node, node_id: str = ""):
+        kind, inner = self.store.inner(node)
+        validate_name("node", inner.name)
+        if kind == "gateway" and not inner.listen_address:
+            raise bad_request("cannot create gateway: listen address cannot be empty")
+        for existing in self.store.values():
+            _, existing_inner = self.store.inner(existing)
+            if existing_inner.id != node_id and existing_inner.name == inner.name:
+                raise already_exists(f"cannot create node: name '{inner.name}' is already in use")
+
+    @handle_errors
+    def Create(self, request, context):
+        with self.store.lock:
+            node = request.node
+            self.validate(node)
+            kind, inner = self.store.inner(node)
+            inner.id = self.store.new_id()
+            inner.state = "new"
+            self.store.put(inner.id, node)
+        return nodes_pb2.NodeCreateResponse(node=node, token=secrets.token_hex(16))
+
+    @handle_errors
+    def Get(self, request, context):
+        return nodes_pb2.NodeGetResponse(node=self.store.get(request.id))
+
+    @handle_errors
+    def Update(self, request, context):
+        with self.store.lock:
+            node = request.node
+            kind, inner = self.store.inner(node)
+            existing = self.store.get(inner.id)
+            if existing.WhichOneof("node") != kind:
+                raise bad_request("cannot change the type of a node")
+            self.validate(node, inner.id)
+            self.store.put(inner.id, node)
+        return nodes_pb2.NodeUpdateResponse(node=node)
+
+    @handle_errors
+    def Delete(self, request, context):
+        self.store.delete(request.id)
+        return nodes_pb2.NodeDeleteResponse()
+
+    @handle_errors
+    def List(self, request, context):
+        page, next_cursor = paginate(self.store.list(request.filter), request.meta)
+        response = nodes_pb2.NodeListResponse(nodes=page)
+        response.meta.next_cursor = next_cursor
+        return response
+
+
+class AccountAttachmentsServicer(account_attachments_pb2_grpc.AccountAttachmentsServicer):
+    def __init__(self, control_plane):
+        self.control_plane = control_plane
+        self.store = control_plane.account_attachments
+
+    @handle_errors
+    def Create(self, request, context):
+        attachment = request.account_attachment
+        with self.control_plane.lock:
+            self.control_plane.accounts.get(attachment.account_id)
+            self.control_plane.roles.get(attachment.role_id)
+            for existing in self.store.values():
+                if existing.account_id == attachment.account_id and existing.role_id == attachment.role_id:
+                    raise already_exists("cannot create account attachment: the account is already attached")
+            attachment.id = self.store.new_id()
+            self.store.put(attachment.id, attachment)
+        return account_attachments_pb2.AccountAttachmentCreateResponse(account_attachment=attachment)
+
+    @handle_errors
+    def Get(self, request, context):
+        return account_attachments_pb2.AccountAttachmentGetResponse(account_attachment=self.store.get(request.id))
+
+    @handle_errors
+    def Delete(self, request, context):
+        self.store.delete(request.id)
+        return account_attachments_pb2.AccountAttachmentDeleteResponse()
+
+    @handle_errors
+    def List(self, request, context):
+        page, next_cursor = paginate(self.store.list(request.filter), request.meta)
+        response = account_attachments_pb2.AccountAttachmentListResponse(account_attachments=page)
+        response.meta.next_cursor = next_cursor
+        return response
+
+
+# --- Control Plane ---
+class FakeControlPlane:
+    """
+    An in-process grpc server implementing the accounts, roles, resources, nodes and account_attachments
+    services, so a real strongdm.Client can be pointed at it with insecure=True
+    """
+    def __init__(self, max_workers: int = 16):
+        self.lock = threading.RLock()
+        self.accounts = EntityStore("a", accounts_pb2.Account, "account")
+        self.roles = EntityStore("r", roles_pb2.Role)
+        self.resources = EntityStore("rs", drivers_pb2.Resource, "resource")
+        self.nodes = EntityStore("n", nodes_pb2.Node, "node")
+        self.account_attachments = EntityStore("aa", account_attachments_pb2.AccountAttachment)
+        self.max_workers = max_workers
+        self.server = None
+        self.address = None
+
+    def start(self) -> str:
+        """
+        Starts the grpc server on a free local port
+        :return: str the host:port address to give strongdm.Client
+        """
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=self.max_workers))
+        accounts_pb2_grpc.add_AccountsServicer_to_server(AccountsServicer(self), self.server)
+        roles_pb2_grpc.add_RolesServicer_to_server(RolesServicer(self), self.server)
+        resources_pb2_grpc.add_ResourcesServicer_to_server(ResourcesServicer(self), self.server)
+        nodes_pb2_grpc.add_NodesServicer_to_server(NodesServicer(self), self.server)
+        account_attachments_pb2_grpc.add_AccountAttachmentsServicer_to_server(
+            AccountAttachmentsServicer(self), self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+        self.address = f"localhost:{port}"
+        return self.address
+
+    def stop(self):
+        if self.server:
+            self.server.stop(grace=None)
+            self.server = None
+
+    def remove_attachments(self, account_id: str = None, role_id: str = None):
+        """
+        Cascades an account or role deletion to its attachments
+        """
+        with self.account_attachments.lock:
+            for attachment in self.account_attachments.values():
+                if attachment.account_id == account_id or attachment.role_id == role_id:
+                    self.account_attachments.entities.pop(attachment.id, None)
+
+    def set_resource_health(self, resource_id: str, healthy: bool = True):
+        """
+        Flips the health of a stored resource, the fake never health checks anything on its own
+        :param resource_id: str
+        :param healthy: bool
+        """
+        with self.resources.lock:
+            resource = self.resources.get(resource_id)
+            kind, inner = self.resources.inner(resource)
+            inner.healthy = healthy
+            self.resources.put(resource_id, resource)
@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from concurrent import futures
+
+import strongdm
+from strongdm import errors
+
+from tests.batch import Batch
+
+
+class ResourceWatcher:
+    """
+    Polls the health of every watched resource on one thread with one list query per tick, and resolves a Future
+    per resource as soon as it is healthy. The poll interval starts short, backs off
+    while nothing changes and drops back down whenever something does.
+    """
+    def __init__(self, client: strongdm.Client, min_interval: float = 0.25, max_interval: float = 5.0,
+                 factor: float = 1.5, jitter: float = 0.2, max_in_flight: int = 8):
+        """
+        :param client: strongdm.Client
+        :param min_interval: float seconds between the first polls
+        :param max_interval: float cap on the seconds between polls
+        :param factor: float growth of the interval after a tick where nothing changed
+        :param jitter: float fraction of the interval randomly added or removed
+        :param max_in_flight: int max gets running at once for the ids a tick's list did not return
+        """
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.max_in_flight = max_in_flight
+        self.watches = dict()
+        self.queries = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def watch(self, resource_id: str, timeout: float = 60) -> futures.Future:
+        """
+        Starts watching a resource
+        :param resource_id: str
+        :param timeout: float seconds before the Future fails with a TimeoutError
+        :return: Future resolving to the healthy resource
+        """
+        future = futures.Future()
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("The resource watcher is stopped")
+            self.watches.setdefault(resource_id, list()).append((future, time.monotonic() + timeout))
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="resource-watcher", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def wait_until_healthy(self, resource_id: str, timeout: float = 60):
+        """
+        Blocks until a resource is healthy
+        :param resource_id: str
+        :param timeout: float
+        :return: the healthy resource
+        """
+        # The poller settles the watch by its deadline, the wait on top of it only covers a poll running long
+        return self.watch(resource_id, timeout=timeout).result(timeout=timeout + self.max_interval)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+
+        for waiters in self.watches.values():
+            for future, _ in waiters:
+                future.cancel()
+        self.watches.clear()
+
+    def _poll(self, resource_ids: list) -> dict:
+        """
+        Lists every watched resource in one query, then gets the ids the list did not return, so a list lagging
+        behind a create, or a control plane not taking the id list, can not pass for a deleted resource
+        :param resource_ids: list
+        :return: dict of id to the resource, or to None once a get says it does not exist.
+                 Ids whose get failed any other way are left out, and polled again next tick.
+        """
+        self.queries += 1
+        resources = {resource.id: resource
+                     for resource in self.client.resources.list(f"id:{','.join(resource_ids)}")}
+        missing = [resource_id for resource_id in resource_ids if resource_id not in resources]
+        if not missing:
+            return resources
+
+        batch = Batch(max_in_flight=self.max_in_flight, retries=0)
+        gets = [(resource_id, batch.add(self.client.resources.get, resource_id)) for resource_id in missing]
+        self.queries += len(gets)
+        batch.run(raise_errors=False)
+
+        for resource_id, get in gets:
+            error = get.exception()
+            if error is None:
+                resources[resource_id] = get.result().resource
+            elif isinstance(error, errors.NotFoundError):
+                resources[resource_id] = None
+            elif not isinstance(error, errors.RPCError):
+                raise error
+        return resources
+
+    def _resolve(self, resources: dict, resource_ids: list) -> bool:
+        """
+        Settles every watch that became healthy, disappeared or ran out of time
+        :param resources: dict from _poll, a watch whose id is missing from it only has its deadline checked
+        :param resource_ids: list
+        :return: bool True if any watch was settled
+        """
+        now = time.monotonic()
+        changed = False
+        with self.condition:
+            for resource_id in resource_ids:
+                known = resource_id in resources
+                resource = resources.get(resource_id)
+                remaining = list()
+                for future, deadline in self.watches.get(resource_id, list()):
+                    if future.done():
+                        pass
+                    elif known and resource is not None and resource.healthy:
+                        future.set_result(resource)
+                    elif known and resource is None:
+                        future.set_exception(errors.NotFoundError(f"resource '{resource_id}' no longer exists"))
+                    elif now >= deadline:
+                        future.set_exception(TimeoutError(f"resource '{resource_id}' was not healthy in time"))
+                    else:
+                        remaining.append((future, deadline))
+                        continue
+                    changed = True
+
+                if remaining:
+                    self.watches[resource_id] = remaining
+                else:
+                    self.watches.pop(resource_id, None)
+        return changed
+
+    def _fail(self, resource_ids: list, error: Exception):
+        with self.condition:
+            for resource_id in resource_ids:
+                for future, _ in self.watches.pop(resource_id, list()):
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self.condition:
+                while not self.watches and not self.stopped:
+                    self.condition.wait()
+                    interval = self.min_interval
+                if self.stopped:
+                    return
+                resource_ids = list(self.watches)
+
+            try:
+                resources = self._poll(resource_ids)
+            except errors.RPCError:
+                # Only the deadlines are checked, the next tick polls again
+                resources = dict()
+            except Exception as e:
+                # Anything else, ie an open circuit, fails the watches instead of the poller
+                self._fail(resource_ids, e)
+                continue
+            if self._resolve(resources, resource_ids):
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.factor, self.max_interval)
+
+            # Never sleep past the nearest deadline, so timeouts are reported on time
+            with self.condition:
+                deadlines = [deadline for waiters in self.watches.values() for _, deadline in waiters]
+                delay = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                if deadlines:
+                    delay = max(0.0, min(delay, min(deadlines) - time.monotonic()))
+                self.condition.wait(timeout=delay)
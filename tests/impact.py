@@ -0,0 +1,324 @@
+"""
+Test impact selection.
+
+Every run records what each test depended on: its file, the fixtures it used, the conftest data tables and helpers
+its code refers to, the harness modules its file imports and the sdk services it called. A later run given
+--impact-base=<git ref> works out which of those dependencies the diff against that ref touched, and runs only
+the tests that depend on one of them, plus any test it has no record of. Changes it cannot attribute, like a pytest
+hook or requirements.txt, fall back to a full run, as does --full-run.
+"""
+import ast
+import functools
+import os
+import re
+import subprocess
+from importlib import metadata
+
+from tests.scheduler import scheduled_services
+
+cache_key = "impact/map"
+conftest_path = "tests/conftest.py"
+
+
+def sdk_version() -> str:
+    try:
+        return metadata.version("strongdm")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+# --- Static analysis ---
+def referenced_names(node) -> set:
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+
+
+@functools.lru_cache(maxsize=None)
+def module_info(path: str):
+    """
+    Parses a file once per session
+    :param path: str
+    :return: ModuleInfo
+    """
+    return ModuleInfo(path)
+
+
+def fixture_name(node) -> str:
+    """
+    Gets the name a conftest function is requested by, or None if it is not a fixture
+    :param node: ast.FunctionDef
+    :return: str
+    """
+    for decorator in node.decorator_list:
+        call = decorator if isinstance(decorator, ast.Call) else None
+        target = call.func if call else decorator
+        if isinstance(target, ast.Attribute) and target.attr == "fixture":
+            for keyword in call.keywords if call else list():
+                if keyword.arg == "name":
+                    return keyword.value.value
+            return node.name
+    return None
+
+
+class ModuleInfo:
+    """
+    The top level definitions of a python file, what each refers to and what the file imports from tests.*
+    """
+    def __init__(self, path: str):
+        with open(path) as source:
+            tree = ast.parse(source.read())
+        # name -> (first line, last line, names it refers to, fixture name or None)
+        self.definitions = dict()
+        # local name -> module it was imported from
+        self.imports = dict()
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom) and node.module == "tests":
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = f"tests.{alias.name}"
+            elif isinstance(node, ast.ImportFrom) and node.module and node.module.startswith("tests."):
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = node.module
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.name.startswith("tests."):
+                        self.imports[alias.asname or alias.name] = alias.name
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                fixture = fixture_name(node) if isinstance(node, ast.FunctionDef) else None
+                self.definitions[node.name] = (node.lineno, node.end_lineno, referenced_names(node), fixture)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        self.definitions[target.id] = (node.lineno, node.end_lineno, referenced_names(node), None)
+
+    def closure(self, names: set) -> set:
+        """
+        Adds every local definition the given names refer to, directly or through each other
+        :param names: set of str
+        :return: set of str
+        """
+        found = set()
+        pending = [name for name in names if name in self.definitions]
+        while pending:
+            name = pending.pop()
+            if name in found:
+                continue
+            found.add(name)
+            pending.extend(ref for ref in self.definitions[name][2] if ref in self.definitions and ref not in found)
+        return found
+
+    def dependents(self, names: set) -> set:
+        """
+        Adds every local definition that refers to one of the given names, directly or through each other
+        :param names: set of str
+        :return: set of str
+        """
+        found = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for name, (_, _, refs, _) in self.definitions.items():
+                if name not in found and refs & found:
+                    found.add(name)
+                    changed = True
+        return found
+
+    def definition_at(self, line: int) -> str:
+        for name, (first, last, _, _) in self.definitions.items():
+            if first <= line <= last:
+                return name
+        return None
+
+
+def static_dependencies(root: str, relative_path: str, function_name: str, conftest: ModuleInfo) -> set:
+    """
+    Gets the dependencies of a test that can be read from its source
+    :param root: str rootdir
+    :param relative_path: str ie 'tests/test_user.py'
+    :param function_name: str the test function, without parameters
+    :param conftest: ModuleInfo
+    :return: set of dependency keys
+    """
+    module = module_info(os.path.join(root, relative_path))
+    local = module.closure({function_name})
+    referenced = set()
+    for name in local:
+        referenced |= module.definitions[name][2]
+
+    keys = {f"file:{relative_path}"}
+    keys |= {f"module:{imported}" for imported in set(module.imports.values()) if imported != "tests.conftest"}
+    keys |= {f"name:{name}" for name in referenced if module.imports.get(name) == "tests.conftest"}
+    # Fixtures a test requests are recorded at run time, the conftest helpers they call are found statically
+    for name in list(referenced & set(conftest.definitions)):
+        keys |= {f"name:{helper}" for helper in conftest.closure({name})}
+    return keys
+
+
+# --- Changes ---
+def git(root: str, *args) -> str:
+    return subprocess.run(["git", *args], cwd=root, check=True, capture_output=True, text=True).stdout
+
+
+def changed_files(root: str, base: str) -> list:
+    """
+    Gets the files that differ from base, committed or not, and new untracked files
+    :param root: str
+    :param base: str git ref
+    :return: list of str paths relative to root
+    """
+    changed = git(root, "diff", "--name-only", base).split()
+    untracked = git(root, "ls-files", "--others", "--exclude-standard").split()
+    return sorted(set(changed) | set(untracked))
+
+
+def changed_lines(root: str, base: str, path: str) -> list:
+    """
+    Gets the lines of path, as it is now, that differ from base
+    :return: list of int
+    """
+    lines = list()
+    for start, count in re.findall(r"^@@ -\S+ \+(\d+)(?:,(\d+))? @@", git(root, "diff", "-U0", base, "--", path),
+                                   re.MULTILINE):
+        start, count = int(start), int(count or 1)
+        # A pure deletion has no lines of its own, the definition around where it was is the one that changed
+        lines.extend(range(start, start + count) if count else [start, start + 1])
+    return lines
+
+
+def harness_modules(root: str) -> dict:
+    """
+    :return: dict of module name, ie 'tests.batch', to the tests.* modules it imports
+    """
+    modules = dict()
+    for name in os.listdir(os.path.join(root, "tests")):
+        if name.endswith(".py") and not name.startswith("test_") and name not in ("__init__.py", "conftest.py"):
+            info = ModuleInfo(os.path.join(root, "tests", name))
+            modules[f"tests.{name[:-3]}"] = set(info.imports.values())
+    return modules
+
+
+def changed_keys(root: str, base: str, recorded_version: str) -> set:
+    """
+    Works out which dependency keys the changes since base touched
+    :param root: str
+    :param base: str git ref
+    :param recorded_version: str sdk version the map was recorded with
+    :return: set of keys, or None when only a full run is safe
+    """
+    keys = set()
+    if recorded_version != sdk_version():
+        keys |= {f"service:{service}" for service in scheduled_services}
+
+    conftest = ModuleInfo(os.path.join(root, conftest_path))
+    modules = harness_modules(root)
+    changed_modules = set()
+    changed_conftest = set()
+    for path in changed_files(root, base):
+        if re.fullmatch(r"tests/test_\w+\.py", path):
+            keys.add(f"file:{path}")
+        elif path == conftest_path:
+            for line in changed_lines(root, base, path):
+                name = conftest.definition_at(line)
+                if name and name.startswith("pytest_"):
+                    return None
+                if name:
+                    changed_conftest.add(name)
+        elif re.fullmatch(r"tests/\w+\.py", path) and f"tests.{path[6:-3]}" in modules:
+            changed_modules.add(f"tests.{path[6:-3]}")
+        elif path.endswith(".md") or path == "tests/__init__.py":
+            continue
+        else:
+            return None
+
+    # A harness module is changed by changes to anything it imports
+    grown = True
+    while grown:
+        importers = {name for name, imports in modules.items() if imports & changed_modules} - changed_modules
+        grown = bool(importers)
+        changed_modules |= importers
+    keys |= {f"module:{module}" for module in changed_modules}
+    changed_conftest |= {name for name, module in conftest.imports.items() if module in changed_modules}
+
+    # A hook changes how every test runs, whether it was edited or something it uses was
+    dependents = conftest.dependents(changed_conftest)
+    if any(name.startswith("pytest_") for name in dependents):
+        return None
+    for name in dependents:
+        keys.add(f"name:{name}")
+        fixture = conftest.definitions.get(name, (None, None, None, None))[3]
+        if fixture:
+            keys.add(f"fixture:{fixture}")
+    return keys
+
+
+class ImpactMap:
+    """
+    What each test depended on when it last ran
+    """
+    def __init__(self, data: dict = None):
+        data = data or dict()
+        self.tests = {test_id: set(keys) for test_id, keys in data.get("tests", dict()).items()}
+        self.sdk_version = data.get("sdk_version")
+
+    def record(self, test_id: str, keys):
+        self.tests[test_id] = set(keys)
+
+    def dump(self) -> dict:
+        return {"sdk_version": sdk_version(), "tests": {test_id: sorted(keys) for test_id, keys in self.tests.items()}}
+
+    def is_affected(self, test_id: str, keys: set) -> bool:
+        """
+        :param test_id: str
+        :param keys: set of changed dependency keys
+        :return: bool True for tests the map knows nothing about
+        """
+        recorded = self.tests.get(test_id)
+        return recorded is None or bool(recorded & keys)
+
+
+class ImpactPlugin:
+    """
+    Deselects unaffected tests when asked to, and saves what every test that ran depended on
+    """
+    def __init__(self, config):
+        self.config = config
+        self.map = ImpactMap(config.cache.get(cache_key, None))
+        self.recorded = dict()
+        self.summary = None
+
+    def pytest_collection_modifyitems(self, config, items):
+        base = config.getoption("--impact-base")
+        if not base or config.getoption("--full-run"):
+            return
+        if not self.map.tests:
+            self.summary = "no earlier run recorded, running everything"
+            return
+
+        keys = changed_keys(str(config.rootpath), base, self.map.sdk_version)
+        if keys is None:
+            self.summary = f"changes since {base} can not be narrowed down, running everything"
+            return
+
+        selected = [item for item in items if self.map.is_affected(item.nodeid, keys)]
+        deselected = [item for item in items if not self.map.is_affected(item.nodeid, keys)]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = selected
+        self.summary = f"{len(selected)} of {len(selected) + len(deselected)} tests affected by changes since {base}"
+
+    def pytest_runtest_logreport(self, report):
+        keys = getattr(report, "impact", None)
+        if keys is not None:
+            self.recorded[report.nodeid] = keys
+
+    def pytest_sessionfinish(self, session):
+        # Workers hand their reports to the controller, only it saves the map
+        if hasattr(self.config, "workerinput"):
+            return
+        for test_id, keys in self.recorded.items():
+            self.map.record(test_id, keys)
+        self.config.cache.set(cache_key, self.map.dump())
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.summary:
+            terminalreporter.write_sep("-", "impact selection")
+            terminalreporter.write_line(self.summary)
@@ -0,0 +1,338 @@
+import glob
+import json
+import os
+import shlex
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+
+import strongdm
+
+# The client services the suite talks to, each one is wrapped by instrument
+instrumented_services = ["accounts", "roles", "resources", "nodes", "account_attachments"]
+
+
+@dataclass
+class CallRecord:
+    """
+    One api call or cli command as seen by the test that made it.
+    A list call spans every page it fetched, so attempts counts rpcs and payload sizes are summed over them.
+    """
+    operation: str
+    test_id: str
+    duration: float = 0.0
+    attempts: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    error: str = None
+    # The test's setup, call or teardown, while latency budgets are timing them
+    phase: str = None
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Nearest rank percentile
+    :param values: list of float
+    :param percent: float between 0 and 100
+    :return: float
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(int(-(-percent * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+
+def cli_operation(command: str) -> str:
+    """
+    Groups cli commands by their subcommand, ie 'sdm admin users list --json ...' -> 'cli sdm admin users list'
+    :param command: str
+    :return: str
+    """
+    words = list()
+    for word in shlex.split(command):
+        if word.startswith("-"):
+            break
+        words.append(word)
+    return "cli " + " ".join(words[:4])
+
+
+class Recorder:
+    """
+    Collects CallRecords for the session and summarizes them per operation and per test
+    """
+    def __init__(self):
+        self.records = list()
+        self.test_durations = defaultdict(float)
+        self.current_test = None
+        self.current_phase = None
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        # Who calls were charged to before each charge_to, innermost last
+        self._charged = list()
+
+    def add(self, record: CallRecord):
+        with self.lock:
+            self.records.append(record)
+
+    def add_test_duration(self, test_id: str, duration: float):
+        with self.lock:
+            self.test_durations[test_id] += duration
+
+    def charge_to(self, owner: str):
+        """
+        Charges calls to something other than the running test until uncharge, ie to a shared fixture setting up
+        :param owner: str recorded as the calls' test id
+        """
+        with self.lock:
+            self._charged.append(self.current_test)
+            self.current_test = owner
+
+    def uncharge(self):
+        with self.lock:
+            self.current_test = self._charged.pop() if self._charged else None
+
+    def active(self) -> CallRecord:
+        """
+        Gets the call being made on this thread, rpcs are added to it
+        :return: CallRecord or None
+        """
+        return getattr(self._local, "record", None)
+
+    @contextmanager
+    def activate(self, record: CallRecord):
+        previous = self.active()
+        self._local.record = record
+        try:
+            yield record
+        finally:
+            self._local.record = previous
+
+    def add_cli_results(self, results: list):
+        """
+        Records cli commands
+        :param results: list of CommandResult
+        """
+        for result in results:
+            error = None
+            if result.timed_out:
+                error = "timeout"
+            elif result.exit_code != 0:
+                error = f"exit {result.exit_code}"
+            self.add(CallRecord(
+                operation=cli_operation(result.command),
+                test_id=getattr(result, "test_id", None) or self.current_test,
+                duration=result.duration,
+                attempts=1,
+                request_bytes=len(result.command.encode()),
+                response_bytes=len(result.stdout.encode()) + len(result.stderr.encode()),
+                error=error,
+            ))
+
+    def merge(self, data: dict):
+        """
+        Adds the raw data dumped by another process, ie an xdist worker
+        :param data: dict from dump
+        """
+        for record in data["records"]:
+            self.add(CallRecord(**record))
+        for test_id, duration in data["test_durations"].items():
+            self.add_test_duration(test_id, duration)
+
+    def dump(self) -> dict:
+        with self.lock:
+            return {"records": [asdict(record) for record in self.records], "test_durations": dict(self.test_durations)}
+
+    def report(self, slowest: int = 20) -> dict:
+        """
+        Summarizes the session
+        :param slowest: int number of tests in the slowest tests table
+        :return: dict with latency percentiles per operation and the slowest tests
+        """
+        with self.lock:
+            records = list(self.records)
+            test_durations = dict(self.test_durations)
+
+        by_operation = defaultdict(list)
+        by_test = defaultdict(list)
+        for record in records:
+            by_operation[record.operation].append(record)
+            by_test[record.test_id].append(record)
+
+        operations = dict()
+        for operation, calls in sorted(by_operation.items()):
+            durations = [call.duration for call in calls]
+            errors = defaultdict(int)
+            for call in calls:
+                if call.error:
+                    errors[call.error] += 1
+            operations[operation] = {
+                "count": len(calls),
+                "total_seconds": round(sum(durations), 6),
+                "p50": round(percentile(durations, 50), 6),
+                "p95": round(percentile(durations, 95), 6),
+                "p99": round(percentile(durations, 99), 6),
+                "max": round(max(durations), 6),
+                "retries": sum(call.retries for call in calls),
+                "errors": dict(errors),
+                "request_bytes": sum(call.request_bytes for call in calls),
+                "response_bytes": sum(call.response_bytes for call in calls),
+            }
+
+        tests = list()
+        for test_id in set(test_durations) | {test_id for test_id in by_test if test_id}:
+            calls = by_test.get(test_id, list())
+            api_seconds = defaultdict(float)
+            for call in calls:
+                api_seconds[call.operation] += call.duration
+            tests.append({
+                "test_id": test_id,
+                "duration": round(test_durations.get(test_id, 0.0), 6),
+                "api_seconds": round(sum(api_seconds.values()), 6),
+                "api_calls": len(calls),
+                "slowest_operation": max(api_seconds, key=api_seconds.get) if api_seconds else None,
+            })
+        tests.sort(key=lambda test: max(test["duration"], test["api_seconds"]), reverse=True)
+
+        return {"operations": operations, "slowest_tests": tests[:slowest]}
+
+
+class InstrumentedService:
+    """
+    Wraps a client service so every call made through it is timed and recorded
+    """
+    def __init__(self, service, name: str, recorder: Recorder):
+        self.service = service
+        self.name = name
+        self.recorder = recorder
+        self._wrap_stub()
+
+    def _wrap_stub(self):
+        """
+        Wraps each rpc on the service's grpc stub, the sdk retries around the stub so every attempt passes through here
+        """
+        stub = self.service.stub
+        for rpc_name, rpc in list(vars(stub).items()):
+            if callable(rpc):
+                setattr(stub, rpc_name, self._wrap_rpc(rpc))
+
+    def _wrap_rpc(self, rpc):
+        recorder = self.recorder
+
+        def call_rpc(request, *args, **kwargs):
+            record = recorder.active()
+            if record is None:
+                return rpc(request, *args, **kwargs)
+
+            record.attempts += 1
+            record.request_bytes += request.ByteSize()
+            response = rpc(request, *args, **kwargs)
+            record.response_bytes += response.ByteSize()
+            return response
+
+        return call_rpc
+
+    def __getattr__(self, attribute: str):
+        method = getattr(self.service, attribute)
+        if not callable(method) or attribute.startswith("_"):
+            return method
+
+        def call(*args, **kwargs):
+            record = CallRecord(operation=f"{self.name}.{attribute}", test_id=self.recorder.current_test,
+                                phase=self.recorder.current_phase)
+            start = time.perf_counter()
+            try:
+                with self.recorder.activate(record):
+                    result = method(*args, **kwargs)
+            except Exception as e:
+                record.error = type(e).__name__
+                record.duration = time.perf_counter() - start
+                self.recorder.add(record)
+                raise
+            record.duration = time.perf_counter() - start
+
+            if attribute == "list":
+                # List only builds a generator, the rpcs happen while it is consumed
+                return self._iterate(record, result)
+            self.recorder.add(record)
+            return result
+
+        return call
+
+    def _iterate(self, record: CallRecord, generator):
+        """
+        Times only the work done inside the generator, not the time the caller spends between items
+        """
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    with self.recorder.activate(record):
+                        item = next(generator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    record.error = type(e).__name__
+                    raise
+                finally:
+                    record.duration += time.perf_counter() - start
+                yield item
+        finally:
+            self.recorder.add(record)
+
+
+def instrument(client: strongdm.Client, recorder: Recorder) -> strongdm.Client:
+    """
+    Wraps the client's services in place
+    :param client: strongdm.Client
+    :param recorder: Recorder
+    :return: strongdm.Client the same client
+    """
+    for name in instrumented_services:
+        service = getattr(client, name)
+        if not isinstance(service, InstrumentedService):
+            setattr(client, name, InstrumentedService(service, name, recorder))
+    return client
+
+
+def remove_partials(path: str):
+    """
+    Removes worker dumps left next to path by a run that never merged them, so they are not merged into the next one
+    :param path: str the final report path
+    """
+    for partial in glob.glob(f"{path}.*.part"):
+        os.remove(partial)
+
+
+def write_report(recorder: Recorder, path: str, partials: bool = True):
+    """
+    Writes the session report, merging in any partial dumps left by xdist workers
+    :param recorder: Recorder
+    :param path: str
+    :param partials: bool look for worker dumps next to path
+    """
+    if partials:
+        for partial in glob.glob(f"{path}.*.part"):
+            with open(partial) as partial_file:
+                recorder.merge(json.load(partial_file))
+            os.remove(partial)
+
+    with open(path, "w") as report_file:
+        json.dump(recorder.report(), report_file, indent=2)
+
+
+def write_partial(recorder: Recorder, path: str, worker: str):
+    """
+    Dumps a worker's raw records for the controller to merge
+    :param recorder: Recorder
+    :param path: str the final report path
+    :param worker: str xdist worker id
+    """
+    with open(f"{path}.{worker}.part", "w") as partial_file:
+        json.dump(recorder.dump(), partial_file)
@@ -0,0 +1,174 @@
+"""
+Incremental parsing of the json lists `sdm ... list --json` prints.
+
+A filter that matches badly on a large org prints megabytes of json, and reading all of it to look at the first
+element costs time and memory in proportion to the org. JsonArrayStream hands out each element as soon as its closing
+bracket arrives and keeps nothing but the element being read, and ArraySearch decides from those elements alone
+when the rest of the output no longer matters, so the command can be stopped there.
+"""
+import json
+import re
+from typing import Callable
+
+# Characters that change where an element ends, outside and inside of strings
+structure_pattern = re.compile(r'["\[\]{},]')
+string_pattern = re.compile(r'["\\]')
+# An opening bracket followed by a json value or the closing bracket, which a bracketed warning like "[WARN]" is not,
+# and the start of one that may still become it once more output arrives
+opening_pattern = re.compile(r'\[\s*(?:[-\d{\["\]]|(?:true|false|null)[^\w])')
+partial_opening_pattern = re.compile(r'\[\s*[a-z]{0,5}\Z')
+
+
+class JsonArrayStream:
+    """
+    Parses a json array fed to it a chunk at a time.
+    Anything before the opening bracket, like a cli warning, and anything after the closing one is ignored.
+    The opening bracket is the first one that starts a line and is followed by a json value or the closing bracket,
+    so a warning like "[WARN] ..." is skipped too.
+    """
+    def __init__(self, max_element_size: int = 1 << 20):
+        """
+        :param max_element_size: int max characters a single element may take, a guard against unbounded buffering
+        """
+        self.max_element_size = max_element_size
+        self.text = ""
+        # Where scanning resumes and where the current element began, both offsets into text
+        self.position = 0
+        self.start = 0
+        self.depth = 0
+        self.in_string = False
+        self.started = False
+        self.line_start = True
+        self.done = False
+
+    def _element(self, end: int) -> list:
+        piece = self.text[self.start:end]
+        return [json.loads(piece)] if piece.strip() else list()
+
+    def feed(self, chunk: str) -> list:
+        """
+        Adds the next piece of output
+        :param chunk: str
+        :return: list of the elements completed by this chunk, in order
+        """
+        if self.done:
+            return list()
+
+        self.text += chunk
+        elements = list()
+        text = self.text
+        position = self.position
+        while position < len(text):
+            if self.in_string:
+                match = string_pattern.search(text, position)
+                if match is None:
+                    position = len(text)
+                elif match.group() == "\\":
+                    # An escape's second character may still be on its way
+                    if match.end() >= len(text):
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                else:
+                    self.in_string = False
+                    position = match.end()
+                continue
+
+            if not self.started:
+                if self.line_start and text[position] == "[":
+                    if opening_pattern.match(text, position):
+                        self.started = True
+                        self.depth = 1
+                        position += 1
+                        self.start = position
+                        continue
+                    if partial_opening_pattern.match(text, position):
+                        # What follows the bracket is still on its way
+                        break
+                # Anything else on this line is part of a warning
+                newline = text.find("\n", position)
+                self.line_start = newline != -1
+                position = newline + 1 if self.line_start else len(text)
+                continue
+
+            match = structure_pattern.search(text, position)
+            if match is None:
+                position = len(text)
+                break
+            character, position = match.group(), match.end()
+
+            if character == '"':
+                self.in_string = True
+            elif character in "[{":
+                self.depth += 1
+            elif character in "]}":
+                self.depth -= 1
+                if self.depth == 1:
+                    elements.extend(self._element(position))
+                    self.start = position
+                elif self.depth == 0:
+                    elements.extend(self._element(match.start()))
+                    self.done = True
+                    break
+            elif character == "," and self.depth == 1:
+                elements.extend(self._element(match.start()))
+                self.start = position
+
+        # Only the element being read is kept
+        keep_from = self.start if self.started and not self.done else position
+        self.text = text[keep_from:]
+        self.position = position - keep_from
+        self.start = max(self.start - keep_from, 0)
+        if len(self.text) > self.max_element_size:
+            raise ValueError(f"A json list element is over {self.max_element_size} characters")
+        return elements
+
+
+class ArraySearch:
+    """
+    Looks through a streamed json array for the first element that matches, and knows when to stop looking
+    """
+    def __init__(self, predicate: Callable = None, ruled_out: Callable = None, max_element_size: int = 1 << 20,
+                 head_size: int = 4096):
+        """
+        :param predicate: callable taking an element, any element matches by default
+        :param ruled_out: callable taking an element that did not match, True once no later element can match,
+                          ie past the wanted name in a sorted list
+        :param max_element_size: int
+        :param head_size: int characters of the output kept for error messages
+        """
+        self.stream = JsonArrayStream(max_element_size)
+        self.predicate = predicate or (lambda element: True)
+        self.ruled_out = ruled_out
+        self.head_size = head_size
+        self.head = ""
+        self.found = None
+        self.decided = False
+        self.seen = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        :param chunk: str the next piece of output
+        :return: bool True once the answer is known and the rest of the output can be dropped
+        """
+        if len(self.head) < self.head_size:
+            self.head += chunk[:self.head_size - len(self.head)]
+        if self.decided:
+            return True
+
+        for element in self.stream.feed(chunk):
+            self.seen += 1
+            if self.predicate(element):
+                self.found = element
+                self.decided = True
+            elif self.ruled_out is not None and self.ruled_out(element):
+                self.decided = True
+            if self.decided:
+                return True
+
+        self.decided = self.stream.done
+        return self.decided
+
+    @property
+    def stopped_early(self) -> bool:
+        return self.decided and not self.stream.done
@@ -0,0 +1,100 @@
+"""
+Targeted existence and property checks.
+
+Each helper asks the server about one entity, by id or by name, instead of listing a whole class of entities and
+searching the result, so its cost does not grow with the size of the org. Results are streamed and the list is
+closed as soon as an answer is known.
+"""
+import strongdm
+
+
+def first(service, filter_string: str, *args, predicate=None, timeout: float = None):
+    """
+    Streams a filtered list and stops at the first entity that matches predicate
+    :param service: a client service, ie client.accounts
+    :param filter_string: str filter, with ? placeholders for args
+    :param args: values quoted into the filter's placeholders
+    :param predicate: function taking an entity and returning bool, None accepts any entity
+    :param timeout: float
+    :return: the entity or None
+    """
+    entities = service.list(filter_string, *args, timeout=timeout)
+    try:
+        for entity in entities:
+            if predicate is None or predicate(entity):
+                return entity
+        return None
+    finally:
+        # Closing the generator stops it from fetching any further pages
+        entities.close()
+
+
+def get_or_none(service, entity_id: str, timeout: float = None):
+    """
+    Gets one entity by id
+    :param service: a client service, ie client.roles
+    :param entity_id: str
+    :param timeout: float
+    :return: the entity or None when it does not exist
+    """
+    try:
+        response = service.get(entity_id, timeout=timeout)
+    except strongdm.NotFoundError:
+        return None
+
+    for attribute in ("account", "role", "resource", "node", "account_attachment"):
+        if hasattr(response, attribute):
+            return getattr(response, attribute)
+    return None
+
+
+def find_by_id(service, entity_id: str, filter_string: str = "", *args, timeout: float = None):
+    """
+    Finds one entity by id, optionally only if it also matches a filter, ie 'suspended:true'
+    :param service: a client service
+    :param entity_id: str
+    :param filter_string: str extra filter terms, with ? placeholders for args
+    :param args: values quoted into the filter's placeholders
+    :param timeout: float
+    :return: the entity or None
+    """
+    return first(service, f"id:? {filter_string}".strip(), entity_id, *args,
+                 predicate=lambda entity: entity.id == entity_id, timeout=timeout)
+
+
+def find_by_name(service, name: str, filter_string: str = "", *args, timeout: float = None):
+    """
+    Finds one entity by its exact name
+    :param service: a client service
+    :param name: str
+    :param filter_string: str extra filter terms, with ? placeholders for args
+    :param args: values quoted into the filter's placeholders
+    :param timeout: float
+    :return: the entity or None
+    """
+    return first(service, f"name:? {filter_string}".strip(), name, *args,
+                 predicate=lambda entity: entity.name == name, timeout=timeout)
+
+
+def exists(service, entity_id: str, timeout: float = None) -> bool:
+    """
+    Checks that an entity exists
+    :param service: a client service
+    :param entity_id: str
+    :param timeout: float
+    :return: bool
+    """
+    return find_by_id(service, entity_id, timeout=timeout) is not None
+
+
+def matches(service, entity_id: str, filter_string: str, *args, timeout: float = None) -> bool:
+    """
+    Checks that an entity exists and matches a filter, ie matches(client.accounts, user_id, 'suspended:true')
+    :param service: a client service
+    :param entity_id: str
+    :param filter_string: str filter, with ? placeholders for args
+    :param args: values quoted into the filter's placeholders
+    :param timeout: float
+    :return: bool
+    """
+    return find_by_id(service, entity_id, filter_string, *args, timeout=timeout) is not None
@@ -0,0 +1,67 @@
+import itertools
+import os
+import re
+import threading
+import time
+import uuid
+
+# When this process started, as unix seconds
+run_started = int(time.time())
+# One token per process, so reruns and parallel workers never hand out the same names: six random hex digits and
+# then the start time in eight, so a sweep can tell how old a leftover is. Tokens from older runs have no time.
+run_token = f"{uuid.uuid4().hex[:6]}{run_started:08x}"
+token_pattern = r"[0-9a-f]{6}(?:[0-9a-f]{8})?"
+_counter = itertools.count(1)
+_counter_lock = threading.Lock()
+
+# Matches any suffix made by unique_suffix, so leftovers from any run or worker can be recognized
+suffix_pattern = rf"(?:main|gw\d+)x{token_pattern}\d+"
+_timed_suffix = re.compile(r"(?:main|gw\d+)x([0-9a-f]{6}([0-9a-f]{8}))\d")
+
+# Each worker gets its own slice of ports so generated gateways and ssh servers never share one, past the last slice
+# that fits below the highest port workers share slices again
+port_range_start = 10000
+ports_per_worker = 2000
+port_slices = (65536 - port_range_start) // ports_per_worker
+
+
+def worker_id() -> str:
+    """
+    Gets the pytest-xdist worker id, ie 'gw3', or 'main' when the suite is not running in parallel
+    :return: str
+    """
+    return os.getenv("PYTEST_XDIST_WORKER", "main")
+
+
+def worker_number() -> int:
+    """
+    Gets the numeric part of the worker id, 0 when the suite is not running in parallel
+    :return: int
+    """
+    match = re.search(r"\d+$", worker_id())
+    return int(match.group()) if match else 0
+
+
+def next_count() -> int:
+    with _counter_lock:
+        return next(_counter)
+
+
+def unique_suffix() -> str:
+    """
+    Gets a name suffix that is unique across workers, runs and calls, ie 'gw3x1a2b3c6a1b2c3d42'
+    :return: str
+    """
+    return f"{worker_id()}x{run_token}{next_count()}"
+
+
+def suffix_token(name: str) -> tuple:
+    """
+    Finds the run token in a name made with a suffix, and when that run started
+    :param name: str
+    :return: (str token, int unix seconds), or (None, None) for names without a timed token
+    """
+    match = _timed_suffix.search(name or "")
+    if not match:
+        return None, None
+    return match.group(1), int(match.group(2), 16)
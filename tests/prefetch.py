@@ -0,0 +1,171 @@
+"""
+Background read-ahead for sdk list iterators.
+
+A list from the sdk fetches its next page only once the caller has used up the current one, so a scan of a large org
+waits a full round trip per page. PrefetchIterator reads the list on a thread of its own into a bounded buffer, so the
+next pages are already in flight while the caller works through the current one. Reading ahead is capped by a number
+of pages and a number of buffered entities, and stops, closing the list so no further pages are fetched, as soon as
+the caller stops early.
+
+Scans made of many lists, like the sweeper's or the access resolver's load, go through prefetch_chain, which keeps
+the next few lists reading ahead too, so they overlap instead of running in turn.
+"""
+import collections
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+# Pages the sdk returns when the client does not set a page limit
+default_page_size = 50
+
+# Marks the end of the list in the buffer
+_done = object()
+
+
+class PrefetchIterator:
+    """
+    Iterates a list while a background thread reads ahead of the caller.
+    Use it as a context manager, or close it, when the caller may stop before the end of the list.
+    """
+    def __init__(self, entities: Iterable, read_ahead: int = 2, page_size: int = default_page_size,
+                 max_buffered: int = 1000):
+        """
+        :param entities: iterable, usually the generator a service's list returns
+        :param read_ahead: int pages fetched ahead of the one the caller is reading
+        :param page_size: int entities per page
+        :param max_buffered: int most entities held at once however large the pages are, a cap on memory
+        """
+        self.entities = entities
+        self.capacity = max(1, min(read_ahead * page_size, max_buffered))
+        self.buffer = queue.Queue(maxsize=self.capacity)
+        self.stopped = threading.Event()
+        self.finished = False
+        # How often, and for how long, the caller had to wait for the list
+        self.stalls = 0
+        self.stalled = 0.0
+        self.thread = threading.Thread(target=self._read, name="sdm-prefetch", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        try:
+            item = self.buffer.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            item = self.buffer.get()
+            self.stalls += 1
+            self.stalled += time.perf_counter() - start
+
+        if item is _done:
+            self.finished = True
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self.finished = True
+            raise item.error
+        return item
+
+    def _put(self, item) -> bool:
+        # Waits for room in small steps so a close is noticed even while the buffer is full
+        while not self.stopped.is_set():
+            try:
+                self.buffer.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            for entity in self.entities:
+                if not self._put(entity):
+                    return
+            self._put(_done)
+        except Exception as e:
+            self._put(_Failure(e))
+        finally:
+            # Closed on the thread reading it, a generator can not be closed from another one while it runs
+            close = getattr(self.entities, "close", None)
+            if close is not None:
+                close()
+
+    def close(self):
+        """
+        Stops reading ahead and drops whatever was buffered
+        """
+        self.finished = True
+        self.stopped.set()
+        while True:
+            try:
+                self.buffer.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join(timeout=60)
+
+
+class _Failure:
+    """
+    Carries an error from the reading thread to the caller
+    """
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def prefetch(service, filter_string: str = "", *args, read_ahead: int = 2, max_buffered: int = 1000,
+             **kwargs) -> PrefetchIterator:
+    """
+    Lists a service with read-ahead, ie `with prefetch(client.accounts, "suspended:true") as accounts:`
+    :param service: a client service, ie client.accounts
+    :param filter_string: str filter, with ? placeholders for args
+    :param args: values quoted into the filter's placeholders
+    :param read_ahead: int pages fetched ahead of the caller
+    :param max_buffered: int most entities held at once
+    :return: PrefetchIterator
+    """
+    client = getattr(service, "parent", None)
+    page_size = getattr(client, "page_limit", 0) or default_page_size
+    return PrefetchIterator(service.list(filter_string, *args, **kwargs), read_ahead=read_ahead,
+                            page_size=page_size, max_buffered=max_buffered)
+
+
+def prefetch_chain(listings: Iterable[Callable], lists_ahead: int = 4, read_ahead: int = 2,
+                   page_size: int = default_page_size, max_buffered: int = 1000):
+    """
+    Yields the entities of several lists in order, reading the next few lists ahead while the caller works through
+    the current one. Close the generator when stopping early, every list still open is closed with it.
+    :param listings: iterable of callables each starting one list, ie lambda: client.roles.list(filter_string)
+    :param lists_ahead: int lists reading at once, the current one included
+    :param read_ahead: int pages each list reads ahead
+    :param page_size: int
+    :param max_buffered: int most entities each list holds at once
+    """
+    pending = iter(listings)
+    running = collections.deque()
+    try:
+        while True:
+            while len(running) < max(1, lists_ahead):
+                listing = next(pending, None)
+                if listing is None:
+                    break
+                running.append(PrefetchIterator(listing(), read_ahead=read_ahead, page_size=page_size,
+                                                max_buffered=max_buffered))
+            if not running:
+                return
+            entities = running.popleft()
+            try:
+                yield from entities
+            finally:
+                entities.close()
+    finally:
+        for entities in running:
+            entities.close()
@@ -0,0 +1,299 @@
+"""
+Org-scale test tier.
+
+Every other run works against a nearly empty org, so filters like 'last_name:McMuffin*' or 'name:*ROLL_*' never
+scan more than a handful of entities. With --scale=<count> the org is first seeded with that many users, service
+accounts, roles with tag rules and postgres, eks and ssh resources, built by the data factory's own builders and
+created concurrently. Only the tests marked scale, the suite's find, filter and delete tests, then run against it, and
+the latency of each api operation and test is kept per org size, so runs at different sizes show how it grows.
+
+    pytest --scale=0 && pytest --scale=10000 && pytest --scale=30000 --scale-teardown
+
+Seeded entities carry a seed tag, which the orphan sweep leaves alone, and every one is written to a ledger as soon as
+it is created. Seeding a larger size only creates what is missing, and teardown deletes in steps, crossing entities
+off the ledger as it goes, so either can be interrupted and picked up again.
+
+    python -m tests.scale --teardown
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import strongdm
+
+from tests import lookup
+from tests.batch import Batch, response_entity
+from tests.data_factory import factory
+from tests.scheduler import TokenBucket
+from tests.sweeper import seed_tag_key
+
+# (data factory kind, client service, share of the seeded entities)
+seed_mix = [
+    ("user", "accounts", 0.4),
+    ("service", "accounts", 0.1),
+    ("role", "roles", 0.15),
+    ("postgres", "resources", 0.15),
+    ("k8_cluster", "resources", 0.1),
+    ("ssh_server", "resources", 0.1),
+]
+services = {kind: service_name for kind, service_name, _ in seed_mix}
+# Seeded users, resources and roles are spread over this many teams, each role grants one team's resources
+teams = 50
+history_cache_key = "scale/history"
+
+
+def seed_counts(total: int) -> dict:
+    """
+    Splits an org size over the seeded kinds
+    :param total: int
+    :return: dict of kind to count, adding up to total
+    """
+    counts = {kind: int(total * share) for kind, _, share in seed_mix}
+    # Whatever rounding left over goes to the kinds with the largest shares
+    for kind, _, _ in sorted(seed_mix, key=lambda mix: mix[2], reverse=True)[:total - sum(counts.values())]:
+        counts[kind] += 1
+    return counts
+
+
+def seed_entity(kind: str, seed: str, index: int):
+    """
+    Builds one seeded entity, always the same one for the same seed, kind and index
+    :param kind: str data factory kind
+    :param seed: str seed name, letters and digits only
+    :param index: int
+    :return: a strongdm entity
+    """
+    entity = factory.regenerate(kind, f"{seed}{index}")
+    team = f"team{index % teams}"
+    if kind == "role":
+        entity.access_rules = [{"tags": {"team": team}}]
+    entity.tags = {seed_tag_key: seed, "team": team}
+    return entity
+
+
+class Ledger:
+    """
+    The ids of a seed's entities, appended to a file as they are created and crossed off as they are deleted
+    """
+    def __init__(self, path: str = None):
+        """
+        :param path: str json lines file, kept in memory only if None
+        """
+        self.path = path
+        # (kind, index) -> id
+        self.entries = dict()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as source:
+                for line in source:
+                    entry = json.loads(line)
+                    if "deleted" in entry:
+                        gone = set(entry["deleted"])
+                        self.entries = {key: entity_id for key, entity_id in self.entries.items()
+                                        if entity_id not in gone}
+                    else:
+                        self.entries[(entry["kind"], entry["index"])] = entry["id"]
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _append(self, entry: dict):
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as output:
+                output.write(json.dumps(entry) + "\n")
+
+    def add(self, kind: str, index: int, entity_id: str):
+        with self.lock:
+            self.entries[(kind, index)] = entity_id
+            self._append({"kind": kind, "index": index, "id": entity_id})
+
+    def remove(self, entity_ids: list):
+        """
+        Crosses entities off, once the ledger is empty its file is deleted
+        :param entity_ids: list of str
+        """
+        gone = set(entity_ids)
+        with self.lock:
+            self.entries = {key: entity_id for key, entity_id in self.entries.items() if entity_id not in gone}
+            if self.entries:
+                self._append({"deleted": sorted(gone)})
+            elif self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def counts(self) -> dict:
+        counts = {kind: 0 for kind, _, _ in seed_mix}
+        with self.lock:
+            for kind, _ in self.entries:
+                counts[kind] += 1
+        return counts
+
+
+class OrgSeeder:
+    """
+    Grows an org to a size with seeded entities, and removes them again
+    """
+    def __init__(self, client: strongdm.Client, seed: str = "scale", ledger: Ledger = None, max_in_flight: int = 16,
+                 rate: float = 0):
+        """
+        :param client: strongdm.Client
+        :param seed: str seed name, letters and digits only, tags every seeded entity
+        :param ledger: Ledger, in memory by default
+        :param max_in_flight: int max creates or deletes running at once
+        :param rate: float max calls started per second, no limit if 0
+        """
+        self.client = client
+        self.seed = seed
+        self.ledger = ledger if ledger is not None else Ledger()
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate)
+
+    def seed_org(self, total: int) -> dict:
+        """
+        Creates whatever seeded entities the org is missing for its size to reach total
+        :param total: int
+        :return: dict report with 'created', 'existing', 'failed' counts and the 'seconds' it took
+        """
+        start = time.perf_counter()
+        existing = len(self.ledger)
+        batch = Batch(max_in_flight=self.max_in_flight)
+        for kind, count in seed_counts(total).items():
+            for index in range(count):
+                if (kind, index) not in self.ledger:
+                    batch.add(self._create, kind, index)
+        outcomes = batch.run(raise_errors=False)
+        failed = [future for future in outcomes if future.exception() is not None]
+        return {"created": len(outcomes) - len(failed), "existing": existing, "failed": len(failed),
+                "errors": sorted({type(future.exception()).__name__ for future in failed}),
+                "seconds": round(time.perf_counter() - start, 3)}
+
+    def _create(self, kind: str, index: int):
+        entity = seed_entity(kind, self.seed, index)
+        service = getattr(self.client, services[kind])
+        self.bucket.acquire()
+        try:
+            created = response_entity(service.create(entity, timeout=30))
+        except strongdm.AlreadyExistsError:
+            # Created by a run that stopped before writing it down
+            created = self._find(service, entity)
+            if created is None:
+                raise
+        self.ledger.add(kind, index, created.id)
+
+    @staticmethod
+    def _find(service, entity):
+        if isinstance(entity, strongdm.User):
+            return lookup.first(service, "email:?", entity.email)
+        return lookup.find_by_name(service, entity.name)
+
+    def teardown(self, step: int = 500) -> dict:
+        """
+        Deletes the seed a step at a time, writing progress to the ledger after each step,
+        then sweeps up any seeded entity the ledger missed
+        :param step: int entities deleted per step
+        :return: dict report with 'removed' and 'failed' counts
+        """
+        removed = 0
+        failed = set()
+        while True:
+            with self.ledger.lock:
+                pending = [(kind, entity_id) for (kind, _), entity_id in self.ledger.entries.items()
+                           if entity_id not in failed][:step]
+            if not pending:
+                break
+            batch = Batch(max_in_flight=self.max_in_flight)
+            deletes = [(entity_id, batch.add(self._delete, services[kind], entity_id)) for kind, entity_id in pending]
+            batch.run(raise_errors=False)
+            done = [entity_id for entity_id, delete in deletes if delete.exception() is None]
+            failed |= {entity_id for entity_id, delete in deletes if delete.exception() is not None}
+            self.ledger.remove(done)
+            removed += len(done)
+
+        for service_name in sorted(set(services.values())):
+            service = getattr(self.client, service_name)
+            leftovers = [entity.id for entity in service.list(f"tags:{seed_tag_key}=?", self.seed)]
+            batch = Batch(max_in_flight=self.max_in_flight)
+            deletes = [batch.add(self._delete, service_name, entity_id) for entity_id in leftovers]
+            batch.run(raise_errors=False)
+            removed += sum(1 for delete in deletes if delete.exception() is None)
+        return {"removed": removed, "failed": len(failed)}
+
+    def _delete(self, service_name: str, entity_id: str):
+        self.bucket.acquire()
+        try:
+            return getattr(self.client, service_name).delete(entity_id, timeout=30)
+        except strongdm.NotFoundError:
+            return None
+
+
+class ScaleHistory:
+    """
+    Api operation and test latencies of earlier runs, by the size of the org they ran against
+    """
+    def __init__(self, data: dict = None):
+        self.runs = {int(size): run for size, run in (data or dict()).items()}
+
+    def record(self, size: int, report: dict):
+        """
+        :param size: int seeded entities in the org
+        :param report: dict a Recorder report
+        """
+        self.runs[size] = {
+            "operations": {operation: stats["p95"] for operation, stats in report["operations"].items()},
+            "tests": {test["test_id"]: test["duration"] for test in report["slowest_tests"]},
+        }
+
+    def dump(self) -> dict:
+        return {str(size): run for size, run in self.runs.items()}
+
+    def table(self, section: str = "operations") -> str:
+        """
+        Lays out one row per operation or test and one column per org size, with the growth from smallest to largest
+        :param section: str 'operations' for api call p95s or 'tests' for test durations
+        :return: str
+        """
+        sizes = sorted(self.runs)
+        names = sorted({name for run in self.runs.values() for name in run[section]})
+        if not names:
+            return f"no {section} recorded"
+        width = max(len(name) for name in names)
+        lines = [f"{'':{width}}  " + "  ".join(f"{size:>9}" for size in sizes) + "     growth"]
+        for name in names:
+            values = [self.runs[size][section].get(name) for size in sizes]
+            cells = "  ".join(f"{value:>8.3f}s" if value is not None else f"{'-':>9}" for value in values)
+            known = [value for value in values if value is not None]
+            growth = f"x{known[-1] / known[0]:.1f}" if len(known) > 1 and known[0] > 0 else ""
+            lines.append(f"{name:{width}}  {cells}  {growth:>9}")
+        return "\n".join(lines)
+
+
+def default_ledger_path(root: str, seed: str) -> str:
+    return os.path.join(root, ".pytest_cache", "d", "scale", f"{seed}.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed an org with test entities at scale, or remove the seed")
+    parser.add_argument("--size", type=int, default=0, help="Grow the org to this many seeded entities")
+    parser.add_argument("--teardown", action="store_true", help="Delete every seeded entity")
+    parser.add_argument("--seed", default="scale", help="Seed name, letters and digits only")
+    parser.add_argument("--ledger", default=None, help="Ledger file, under .pytest_cache by default")
+    parser.add_argument("--max-in-flight", type=int, default=16, help="Max calls running at once")
+    parser.add_argument("--rate", type=float, default=20, help="Max calls started per second")
+    args = parser.parse_args()
+
+    client = strongdm.Client(os.getenv("SDM_API_ACCESS_KEY", ""), os.getenv("SDM_API_SECRET_KEY", ""))
+    ledger = Ledger(args.ledger or default_ledger_path(os.getcwd(), args.seed))
+    seeder = OrgSeeder(client, args.seed, ledger, max_in_flight=args.max_in_flight, rate=args.rate)
+    if args.teardown:
+        print(json.dumps(seeder.teardown()))
+    else:
+        print(json.dumps(seeder.seed_org(args.size)))
+
+
+if __name__ == "__main__":
+    main()
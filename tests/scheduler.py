@@ -0,0 +1,241 @@
+import datetime
+import random
+import threading
+import time
+
+import strongdm
+from strongdm import errors
+
+from tests.circuit_breaker import CircuitBreaker
+from tests.instrumentation import percentile
+
+# The client services whose calls go through the scheduler
+scheduled_services = ["accounts", "roles", "resources", "nodes", "account_attachments"]
+# Unavailable. The sdk has already retried it three times before the scheduler sees it, and the call may still have
+# reached the control plane, so the scheduler only sends it again for calls that are safe to repeat.
+unavailable_error_code = 14
+# Calls that are not safe to repeat: a repeated create may fail with AlreadyExists or leave a duplicate behind, and a
+# repeated delete may fail with NotFound
+non_idempotent_operations = {"create", "delete"}
+
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Checks if a call was throttled, which the control plane rejects before doing anything, or was unavailable and is
+    safe to repeat. Timeouts are not retried here, a create that timed out may still have happened.
+    :param error: Exception
+    :param idempotent: bool whether the call may be repeated
+    :return: bool
+    """
+    if isinstance(error, errors.RateLimitError):
+        return True
+    return idempotent and isinstance(error, errors.RPCError) and error.code == unavailable_error_code
+
+
+class TokenBucket:
+    """
+    Lets rate calls start per second on average, with bursts of up to burst calls
+    """
+    def __init__(self, rate: float, burst: int = None):
+        """
+        :param rate: float tokens added per second, 0 for no limit
+        :param burst: int max tokens saved up, defaults to one second's worth
+        """
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available
+        """
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class Scheduler:
+    """
+    The one path every api call in the session takes.
+    Calls wait for a free slot on their service and a token from the shared bucket, rate limit errors are retried with
+    jittered exponential backoff, and unavailable errors the sdk already gave up on are retried at most once more.
+    The rate is cut whenever the control plane throttles and creeps back up to the configured rate as calls succeed.
+    Every other error, including the InternalErrors some validation tests expect, reaches the caller untouched.
+    """
+    def __init__(self, rate: float = 20, burst: int = None, concurrency: int = 8, limits: dict = None,
+                 retries: int = 5, unavailable_retries: int = 1, base_delay: float = 0.25, max_delay: float = 10,
+                 jitter: float = 0.5, breaker: CircuitBreaker = None):
+        """
+        :param rate: float calls started per second, 0 for no limit
+        :param burst: int calls that may start at once after an idle spell
+        :param concurrency: int default max calls in flight per service
+        :param limits: dict of service name to max calls in flight, overriding concurrency
+        :param retries: int times a throttled call is retried, the sdk leaves those to the scheduler
+        :param unavailable_retries: int times an idempotent call is retried after the sdk's own retries of an
+                                    unavailable error, so each call makes at most 4 * (1 + this) attempts
+        :param base_delay: float seconds before the first retry, doubled on each one after
+        :param max_delay: float max seconds between retries
+        :param jitter: float fraction of each delay that is randomized
+        :param breaker: CircuitBreaker that stops calls while the control plane is unreachable, if given
+        """
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.slots = {name: threading.BoundedSemaphore(limit) for name, limit in (limits or dict()).items()}
+        self.retries = retries
+        self.unavailable_retries = unavailable_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.waits = list()
+        self.calls = 0
+        self.retried = 0
+        self.throttled = 0
+        # Services called since this was last cleared, for test impact selection
+        self.services_used = set()
+
+    def attach(self, client: strongdm.Client) -> strongdm.Client:
+        """
+        Routes a client's calls through the scheduler.
+        The client stops retrying rate limit errors itself so the scheduler sees them and can slow down.
+        :param client: strongdm.Client
+        :return: strongdm.Client the same client
+        """
+        client.retry_rate_limit_errors = False
+        for name in scheduled_services:
+            service = getattr(client, name)
+            if not isinstance(service, ScheduledService):
+                setattr(client, name, ScheduledService(service, name, self))
+        return client
+
+    def _slot(self, service_name: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if service_name not in self.slots:
+                self.slots[service_name] = threading.BoundedSemaphore(self.concurrency)
+            return self.slots[service_name]
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        reset_at = getattr(getattr(error, "rate_limit", None), "reset_at", None)
+        if isinstance(reset_at, datetime.datetime):
+            until_reset = (reset_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            delay = max(delay, min(until_reset, self.max_delay))
+        return delay * (1 + self.jitter * (random.random() * 2 - 1))
+
+    def _slow_down(self):
+        with self.lock:
+            self.throttled += 1
+            if self.bucket.rate:
+                self.bucket.rate = max(self.bucket.rate * 0.7, self.max_rate * 0.1)
+
+    def _speed_up(self):
+        with self.lock:
+            if self.bucket.rate and self.bucket.rate < self.max_rate:
+                self.bucket.rate = min(self.bucket.rate + self.max_rate * 0.01, self.max_rate)
+
+    def call(self, service_name: str, func, *args, idempotent: bool = True, **kwargs):
+        """
+        Runs a call once its service has a free slot and the bucket has a token
+        :param service_name: str
+        :param func: callable
+        :param idempotent: bool whether the call may be sent again after an unavailable error
+        :return: whatever func returns
+        """
+        attempt = 0
+        unavailable = 0
+        while True:
+            # Checked on every attempt too, so retries stop as soon as the circuit opens
+            if self.breaker is not None:
+                self.breaker.before_call()
+            queued = time.monotonic()
+            with self._slot(service_name):
+                self.bucket.acquire()
+                with self.lock:
+                    self.waits.append(time.monotonic() - queued)
+                    self.calls += 1
+                    self.services_used.add(service_name)
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    if self.breaker is not None:
+                        self.breaker.record_failure(e)
+                    if isinstance(e, errors.RateLimitError):
+                        self._slow_down()
+                    if attempt >= self.retries or not is_retryable(e, idempotent):
+                        raise
+                    if not isinstance(e, errors.RateLimitError):
+                        if unavailable >= self.unavailable_retries:
+                            raise
+                        unavailable += 1
+                    error = e
+                else:
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    self._speed_up()
+                    return result
+
+            with self.lock:
+                self.retried += 1
+            time.sleep(self._backoff(attempt, error))
+            attempt += 1
+
+    def report(self) -> str:
+        """
+        Summarizes how long calls queued and how often the control plane pushed back
+        :return: str
+        """
+        with self.lock:
+            waits = list(self.waits)
+        if not waits:
+            return "No api calls were scheduled"
+        return (f"{self.calls} api calls, queue wait p50 {percentile(waits, 50):.3f}s "
+                f"p95 {percentile(waits, 95):.3f}s max {max(waits):.3f}s total {sum(waits):.1f}s, "
+                f"{self.retried} retried, {self.throttled} rate limited, rate {self.bucket.rate or 'unlimited'}/s")
+
+
+class ScheduledService:
+    """
+    Wraps a client service so each of its calls goes through a Scheduler
+    """
+    def __init__(self, service, name: str, scheduler: Scheduler):
+        self.service = service
+        self.name = name
+        self.scheduler = scheduler
+
+    def __getattr__(self, attribute: str):
+        method = getattr(self.service, attribute)
+        if not callable(method) or attribute.startswith("_"):
+            return method
+
+        if attribute == "list":
+            return self._list
+        idempotent = attribute not in non_idempotent_operations
+        return lambda *args, **kwargs: self.scheduler.call(self.name, method, *args, idempotent=idempotent, **kwargs)
+
+    def _list(self, *args, **kwargs):
+        """
+        Schedules a list by its first page, the rpc every list makes, and streams the rest as it comes
+        """
+        def first_page():
+            entities = self.service.list(*args, **kwargs)
+            try:
+                return entities, [next(entities)]
+            except StopIteration:
+                return entities, list()
+
+        entities, head = self.scheduler.call(self.name, first_page)
+        yield from head
+        yield from entities
@@ -0,0 +1,201 @@
+"""
+Deletes entities leaked by interrupted test runs.
+
+    python -m tests.sweeper [--dry-run] [--tag name=value] [--min-age 3600] [--max-in-flight 8] [--rate 10]
+
+Uses SDM_API_ACCESS_KEY and SDM_API_SECRET_KEY like the test suite. Only entities whose names match
+the suite's builders (or that carry one of the given tags) are touched, and anything already gone is
+skipped.
+
+Other runs, ie another CI job, may be using the same org at the same time, so an entity is only deleted once it is
+older than --min-age. Its age comes from the start time in its name's run token, or else from its created_at.
+Entities whose age can not be told, like those named by runs before tokens carried a time, are only deleted with
+--min-age 0. The sweeping run's own entities are never deleted.
+"""
+import argparse
+import contextlib
+import functools
+import os
+import re
+import time
+from collections import Counter
+
+import strongdm
+
+from tests.batch import Batch
+from tests.namespace import run_token, suffix_pattern, suffix_token
+from tests.prefetch import prefetch_chain
+from tests.scheduler import TokenBucket
+
+# Entities with this tag were seeded by the scale tier on purpose, they outlive runs and only its teardown removes them
+seed_tag_key = "scale_seed"
+
+# (label, client service, server side filter, field, pattern the field must match)
+# Older runs used random numbers instead of namespace suffixes, nodes are only matched by suffix so a
+# real gateway named like 'gateway1' is never touched.
+sweep_targets = [
+    ("users", "accounts", "last_name:McMuffin*", "last_name", rf"^McMuffin(?:{suffix_pattern}|\d{{6}})$"),
+    ("service accounts", "accounts", "name:*Apple_*", "name", rf"Apple_(?:{suffix_pattern}|\d{{9}})$"),
+    ("roles", "roles", "name:*ROLL_*", "name", rf"ROLL_(?:{suffix_pattern}|\d{{9}})"),
+    ("roles", "roles", 'name:"If I were a rich man*"', "name", rf"^If I were a rich man\.\.\.(?: {suffix_pattern})?$"),
+    ("resources", "resources", 'name:"Fake Postgres Resource*"', "name",
+     rf"^Fake Postgres Resource(?:{suffix_pattern}|\d{{7}})$"),
+    ("resources", "resources", 'name:"K8 Cluster *"', "name", rf"^K8 Cluster (?:{suffix_pattern}|\d{{4}})$"),
+    ("resources", "resources", 'name:"SSH Server for *"', "name", rf"^SSH Server for \S+:\d+(?: {suffix_pattern})?$"),
+    ("nodes", "nodes", "name:gateway*", "name", rf"^gateway\d+_{suffix_pattern}$"),
+    ("nodes", "nodes", "name:relay*", "name", rf"^relay{suffix_pattern}$"),
+]
+
+
+class Sweeper:
+    """
+    Finds leaked test entities by name and tag and deletes them concurrently
+    """
+    def __init__(self, client: strongdm.Client, tags: list = None, max_in_flight: int = 8, rate: float = 10,
+                 min_age: float = 3600, exclude_tokens: set = None):
+        """
+        :param client: strongdm.Client
+        :param tags: list of 'name=value' tags that mark an entity as a test leftover
+        :param max_in_flight: int max deletes running at once
+        :param rate: float max deletes started per second
+        :param min_age: float seconds an entity must have existed before it is deleted, 0 deletes any age
+        :param exclude_tokens: set of run tokens whose entities are never deleted, this process's by default
+        """
+        self.client = client
+        self.tags = tags or list()
+        self.min_age = min_age
+        self.exclude_tokens = {run_token} if exclude_tokens is None else set(exclude_tokens)
+        # Matching entities left alone because they belong to an excluded run or are too young
+        self.kept = 0
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate)
+
+    def targets(self) -> list:
+        targets = list(sweep_targets)
+        for tag in self.tags:
+            for label, service_name in (("accounts", "accounts"), ("roles", "roles"), ("resources", "resources"),
+                                        ("nodes", "nodes")):
+                targets.append((label, service_name, f"tags:{tag}", None, None))
+        return targets
+
+    def _list_target(self, target: tuple):
+        _, service_name, filter_string, _, _ = target
+        for entity in getattr(self.client, service_name).list(filter_string):
+            yield target, entity
+
+    @staticmethod
+    def age(entity, now: float) -> tuple:
+        """
+        Works out which run made an entity and how long ago
+        :param entity: a strongdm entity
+        :param now: float unix seconds
+        :return: (str run token or None, float seconds or None when it can not be told)
+        """
+        for text in (getattr(entity, "name", None), getattr(entity, "last_name", None)):
+            token, started = suffix_token(text)
+            if token is not None:
+                return token, now - started
+        created_at = getattr(entity, "created_at", None)
+        return None, (now - created_at.timestamp()) if created_at else None
+
+    def is_leftover(self, entity, now: float) -> bool:
+        """
+        :param entity: a strongdm entity matching a sweep target
+        :param now: float unix seconds
+        :return: bool whether it is old enough, and not this run's, to delete
+        """
+        token, age = self.age(entity, now)
+        if token in self.exclude_tokens:
+            return False
+        if self.min_age <= 0:
+            return True
+        return age is not None and age >= self.min_age
+
+    def find(self) -> dict:
+        """
+        Finds every leaked entity
+        :return: dict of entity id to (label, service name, entity name)
+        """
+        found = dict()
+        now = time.time()
+        # The next targets' lists are read while the current one is matched, instead of one scan after another
+        listings = [functools.partial(self._list_target, target) for target in self.targets()]
+        with contextlib.closing(prefetch_chain(listings)) as listed:
+            for (label, service_name, _, field, pattern), entity in listed:
+                if seed_tag_key in (getattr(entity, "tags", None) or dict()):
+                    continue
+                if pattern is None or re.search(pattern, getattr(entity, field, "")):
+                    if not self.is_leftover(entity, now):
+                        self.kept += 1
+                        continue
+                    name = getattr(entity, "name", None) or getattr(entity, "email", "")
+                    found[entity.id] = (label, service_name, name)
+        return found
+
+    def _delete(self, service_name: str, entity_id: str):
+        self.bucket.acquire()
+        try:
+            return getattr(self.client, service_name).delete(entity_id, timeout=30)
+        except strongdm.NotFoundError:
+            return None
+
+    def sweep(self, dry_run: bool = False) -> dict:
+        """
+        Deletes every leaked entity
+        :param dry_run: bool only report what would be deleted
+        :return: dict with the 'removed' and 'failed' entities, each mapping id to (label, name)
+        """
+        found = self.find()
+        report = {"removed": dict(), "failed": dict(), "kept": self.kept}
+        if dry_run:
+            report["removed"] = {entity_id: (label, name) for entity_id, (label, _, name) in found.items()}
+            return report
+
+        batch = Batch(max_in_flight=self.max_in_flight)
+        deletes = {entity_id: batch.add(self._delete, service_name, entity_id)
+                   for entity_id, (_, service_name, _) in found.items()}
+        batch.run(raise_errors=False)
+
+        for entity_id, delete in deletes.items():
+            label, _, name = found[entity_id]
+            outcome = "failed" if delete.exception() is not None else "removed"
+            report[outcome][entity_id] = (label, name)
+        return report
+
+
+def format_report(report: dict, dry_run: bool = False) -> str:
+    """
+    Summarizes a sweep report
+    :param report: dict
+    :param dry_run: bool
+    :return: str
+    """
+    verb = "Would remove" if dry_run else "Removed"
+    counts = Counter(label for label, _ in report["removed"].values())
+    lines = [f"{verb} {len(report['removed'])} leaked entities"]
+    lines.extend(f"  {label}: {count}" for label, count in sorted(counts.items()))
+    if report.get("kept"):
+        lines.append(f"Kept {report['kept']} that belong to this run, are too young or whose age is unknown")
+    if report["failed"]:
+        lines.append(f"Failed to remove {len(report['failed'])}:")
+        lines.extend(f"  {entity_id} {label} '{name}'" for entity_id, (label, name) in report["failed"].items())
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete entities leaked by interrupted test runs")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be deleted")
+    parser.add_argument("--tag", action="append", default=list(), help="Also sweep entities with this name=value tag")
+    parser.add_argument("--min-age", type=float, default=3600,
+                        help="Only delete entities older than this many seconds, 0 deletes any age")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="Max deletes running at once")
+    parser.add_argument("--rate", type=float, default=10, help="Max deletes started per second")
+    args = parser.parse_args()
+
+    client = strongdm.Client(os.getenv("SDM_API_ACCESS_KEY", ""), os.getenv("SDM_API_SECRET_KEY", ""))
+    sweeper = Sweeper(client, tags=args.tag, max_in_flight=args.max_in_flight, rate=args.rate, min_age=args.min_age)
+    print(format_report(sweeper.sweep(dry_run=args.dry_run), dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
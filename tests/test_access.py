@@ -0,0 +1,120 @@
+import time
+
+import strongdm
+
+from tests.access import AccessResolver
+from tests.conftest import create_client, get_resource_postgres, get_role, get_user
+
+
+def tagged_postgres(tags: dict) -> strongdm.Postgres:
+    resource = get_resource_postgres()
+    resource.tags = tags
+    return resource
+
+
+def test_rules_grant_by_tags_ids_and_type(private_control_plane):
+    """
+    Test that tag, id and type rules each reach the resources they should, loaded from the server
+    """
+    client = create_client(dict(), private_control_plane)
+    blue = client.resources.create(tagged_postgres({"team": "blue", "env": "dev"})).resource
+    prod = client.resources.create(tagged_postgres({"team": "blue", "env": "prod"})).resource
+    other = client.resources.create(tagged_postgres({"team": "red"})).resource
+    user = client.accounts.create(get_user()).account
+    role = get_role()
+    role.access_rules = [{"tags": {"team": "blue", "env": "dev"}}, {"ids": [other.id]}]
+    role = client.roles.create(role).role
+    client.account_attachments.create(strongdm.AccountAttachment(account_id=user.id, role_id=role.id))
+
+    resolver = AccessResolver(client)
+    assert resolver.reachable(user.id) == {blue.id, other.id}
+    assert not resolver.can_reach(user.id, prod.id)
+    assert resolver.explain(user.id, other.id) == [(role.id, {"ids": [other.id]})]
+
+    role.access_rules = [{"type": "postgres"}]
+    resolver.store("roles", client.roles.update(role).role)
+    assert resolver.reachable(user.id) == {blue.id, prod.id, other.id}
+    assert resolver.loads == 1
+
+
+def test_attached_clients_keep_it_current(private_control_plane):
+    """
+    Test that writes through an attached client update the indexes without loading the org again
+    """
+    resolver = AccessResolver(create_client(dict(), private_control_plane))
+    client = resolver.attach(create_client(dict(), private_control_plane))
+    assert resolver.reachable("a-0000000000000000") == set()
+
+    resource = client.resources.create(tagged_postgres({"grant": "g1"})).resource
+    user = client.accounts.create(get_user()).account
+    role = get_role()
+    role.access_rules = [{"tags": {"grant": "g1"}}]
+    role = client.roles.create(role).role
+    attachment = client.account_attachments.create(
+        strongdm.AccountAttachment(account_id=user.id, role_id=role.id)).account_attachment
+    assert resolver.reachable(user.id) == {resource.id}
+
+    client.account_attachments.delete(attachment.id)
+    assert resolver.reachable(user.id) == set()
+    client.account_attachments.create(strongdm.AccountAttachment(account_id=user.id, role_id=role.id))
+    resource.tags = {"grant": "g2"}
+    client.resources.update(resource)
+    assert resolver.reachable(user.id) == set()
+    client.resources.delete(resource.id)
+    client.roles.delete(role.id)
+    assert resolver.roles_of(user.id) == set()
+    assert resolver.loads == 1
+
+
+def test_writes_during_a_load_are_kept(private_control_plane):
+    """
+    Test that writes made while the org is being listed go through at once and survive the indexes being swapped
+    """
+    loader = create_client(dict(), private_control_plane)
+    resolver = AccessResolver(loader)
+    client = resolver.attach(create_client(dict(), private_control_plane))
+    gone = client.resources.create(tagged_postgres({"grant": "g1"})).resource
+    user = client.accounts.create(get_user()).account
+    role = get_role()
+    role.access_rules = [{"tags": {"grant": "g1"}}]
+    role = client.roles.create(role).role
+    client.account_attachments.create(strongdm.AccountAttachment(account_id=user.id, role_id=role.id))
+
+    added = list()
+    listed_resources = loader.resources.list
+
+    def list_resources(*args, **kwargs):
+        # Taken before the writes, so the listing still has the deleted resource and not the created one
+        resources = list(listed_resources(*args, **kwargs))
+        client.resources.delete(gone.id)
+        added.append(client.resources.create(tagged_postgres({"grant": "g1"})).resource)
+        return iter(resources)
+
+    loader.resources.list = list_resources
+    resolver.load()
+    assert resolver.reachable(user.id) == {added[0].id}
+    assert resolver.loads == 1
+
+
+def test_queries_stay_fast_at_org_scale():
+    """
+    Test that answering for one account does not grow with the size of the org
+    """
+    resolver = AccessResolver(client=None)
+    resolver.loaded = True
+    for index in range(20000):
+        resource = tagged_postgres({"team": f"team{index % 200}", "env": ["dev", "prod"][index % 2]})
+        resource.id = f"rs-{index:016x}"
+        resolver.store("resources", resource)
+    for index in range(2000):
+        resolver.store("roles", strongdm.Role(id=f"r-{index:016x}", access_rules=[
+            {"tags": {"team": f"team{index % 200}", "env": "dev"}}, {"ids": [f"rs-{index:016x}"]}]))
+    for index in range(10000):
+        resolver.store("account_attachments", strongdm.AccountAttachment(
+            id=f"aa-{index:016x}", account_id=f"a-{index % 5000:016x}", role_id=f"r-{index % 2000:016x}"))
+
+    start = time.perf_counter()
+    for index in range(1000):
+        reachable = resolver.reachable(f"a-{index:016x}")
+    per_query = (time.perf_counter() - start) / 1000
+    assert reachable and per_query < 0.001, f"{per_query * 1000:.3f}ms per query"
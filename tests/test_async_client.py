@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from concurrent import futures
+
+import pytest
+from strongdm import errors
+
+from tests.async_client import AsyncClient, AsyncService
+from tests.conftest import create_client
+from tests.data_factory import factory
+
+
+class SlowService:
+    """
+    Stands in for an sdk service whose calls take a fixed time
+    """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def create(self, entity):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+        return entity
+
+    def list(self, count: int):
+        for index in range(count):
+            time.sleep(self.latency)
+            yield index
+
+
+def test_gathered_calls_take_the_slowest_latency():
+    """
+    Test that independent calls gathered together overlap instead of adding up
+    """
+    service = AsyncService(SlowService(0.2), futures.ThreadPoolExecutor(max_workers=8))
+
+    async def body():
+        return await asyncio.gather(*[service.create(name) for name in ["user", "resource", "role"]])
+
+    start = time.perf_counter()
+    assert asyncio.run(body()) == ["user", "resource", "role"]
+    assert time.perf_counter() - start < 0.4
+
+
+def test_executor_bounds_calls_in_flight():
+    """
+    Test that gathering more calls than the executor has threads queues the rest
+    """
+    slow = SlowService(0.05)
+    service = AsyncService(slow, futures.ThreadPoolExecutor(max_workers=2))
+
+    async def body():
+        await asyncio.gather(*[service.create(index) for index in range(6)])
+
+    asyncio.run(body())
+    assert slow.most_running == 2
+
+
+def test_lists_are_read_off_the_loop():
+    """
+    Test that a lazily paged list is read to the end on the executor, not while the loop waits
+    """
+    service = AsyncService(SlowService(0.05), futures.ThreadPoolExecutor(max_workers=2))
+
+    async def body():
+        ticks = 0
+        listing = asyncio.ensure_future(service.list(4))
+        while not listing.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return listing.result(), ticks
+
+    items, ticks = asyncio.run(body())
+    assert items == [0, 1, 2, 3]
+    assert ticks > 5, "The event loop was blocked while the list was read"
+
+
+def test_async_client_raises_sdk_errors(private_control_plane):
+    """
+    Test that the facade hands back the sdk's responses and errors unchanged
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=4)
+    client = AsyncClient(create_client(dict(), private_control_plane), executor)
+
+    async def body():
+        role = (await client.roles.create(factory.build("role"), timeout=30)).role
+        fetched = (await client.roles.get(role.id)).role
+        with pytest.raises(errors.NotFoundError):
+            await client.roles.get("r-0000000000000000")
+        await client.roles.delete(role.id)
+        return role, fetched
+
+    try:
+        role, fetched = asyncio.run(body())
+        assert fetched.id == role.id and fetched.name == role.name
+    finally:
+        executor.shutdown()
+
+
+async def test_coroutine_tests_run(async_client):
+    """
+    Test that coroutine test functions are run rather than skipped
+    """
+    roles = await async_client.roles.list("name:?", "no role has this name")
+    assert roles == list()
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from strongdm import errors
+
+from tests.batch import Batch
+from tests.conftest import get_role
+
+
+def test_results_map_back_to_callers(client):
+    """
+    Test that each queued create gets its own response
+    """
+    roles = [get_role() for _ in range(5)]
+    batch = Batch()
+    creates = [batch.create(client.roles, role) for role in roles]
+    batch.run()
+
+    try:
+        assert [create.result().role.name for create in creates] == [role.name for role in roles], \
+            "Responses were not mapped back to the right caller"
+    finally:
+        with Batch() as teardown:
+            for create in creates:
+                teardown.delete_created(client.roles, create)
+
+
+def test_in_flight_requests_are_bounded():
+    """
+    Test that no more than max_in_flight calls run at once
+    """
+    running = list()
+    peak = list()
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    batch = Batch(max_in_flight=3)
+    for _ in range(12):
+        batch.add(call)
+    batch.run()
+
+    assert max(peak) <= 3, f"{max(peak)} calls ran at once"
+
+
+def test_transient_errors_are_retried():
+    """
+    Test that rate limit errors are retried and other errors are not
+    """
+    attempts = list()
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise errors.RateLimitError("slow down", None)
+        return "done"
+
+    def broken():
+        raise errors.BadRequestError("bad")
+
+    batch = Batch(backoff=0)
+    flaky_call = batch.add(flaky)
+    broken_call = batch.add(broken)
+    batch.run(raise_errors=False)
+
+    assert flaky_call.result() == "done" and len(attempts) == 3, "Rate limit error was not retried"
+    with pytest.raises(errors.BadRequestError):
+        broken_call.result()
+
+
+def test_creates_are_not_sent_again_after_a_timeout():
+    """
+    Test that a create that may have gone through is not repeated, while a throttled one still is
+    """
+    attempts = list()
+
+    class Service:
+        @staticmethod
+        def create(entity, timeout=None):
+            attempts.append(entity)
+            if len(attempts) == 1:
+                raise errors.TimeoutError()
+            if len(attempts) == 2:
+                raise errors.RateLimitError("slow down", None)
+            return entity
+
+    batch = Batch(max_in_flight=1, backoff=0)
+    timed_out = batch.create(Service, "first")
+    throttled = batch.create(Service, "second")
+    batch.run(raise_errors=False)
+
+    assert isinstance(timed_out.exception(), errors.TimeoutError)
+    assert throttled.result() == "second" and attempts == ["first", "second", "second"]
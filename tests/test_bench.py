@@ -0,0 +1,57 @@
+import pytest
+
+from tests.bench import Benchmark, load_baseline, workloads
+from tests.conftest import create_client
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("workload", list(workloads))
+def test_workload(request, client, benchmark, workload):
+    """
+    Runs one service's create, update, list and delete workload at every concurrency level
+    """
+    results = benchmark.run(client, workloads[workload])
+    assert results, f"The {workload} workload produced no results"
+
+    baseline = request.config.getoption("--bench-baseline")
+    if baseline:
+        regressions = benchmark.compare(load_baseline(baseline), request.config.getoption("--bench-tolerance"), results)
+        assert not regressions, "Regressed against the baseline:\n" + "\n".join(regressions)
+
+
+def test_every_workload_runs_against_the_fake(private_control_plane, tmp_path):
+    """
+    Test that each workload measures every operation it supports at every level and cleans up after itself
+    """
+    benchmark = Benchmark(levels=[1, 2], cycles=3)
+    client = create_client(dict(), private_control_plane)
+    for workload in workloads.values():
+        benchmark.run(client, workload)
+
+    measured = {(result["workload"], result["concurrency"], result["operation"]) for result in benchmark.results}
+    assert ("accounts", 2, "update") in measured and ("account_attachments", 1, "delete") in measured
+    assert ("account_attachments", 1, "update") not in measured
+    assert all(result["count"] == 3 and result["error_rate"] == 0 for result in benchmark.results)
+    assert not private_control_plane.accounts.values() and not private_control_plane.roles.values()
+
+    path = str(tmp_path / "bench_output.txt")
+    benchmark.write(path)
+    assert load_baseline(path) == benchmark.results
+
+
+def test_compare_flags_regressions():
+    """
+    Test that slower, less throughput and more errors than the baseline are all reported, noise is not
+    """
+    baseline = [{"workload": "roles", "concurrency": 4, "operation": "create", "p95": 0.1, "throughput": 100,
+                 "error_rate": 0}]
+    benchmark = Benchmark()
+    benchmark.results = [dict(baseline[0], p95=0.12, throughput=90)]
+    assert benchmark.compare(baseline) == list()
+
+    benchmark.results = [dict(baseline[0], p95=0.3, throughput=50, error_rate=0.1)]
+    assert len(benchmark.compare(baseline)) == 3
+
+    fast_baseline = [dict(baseline[0], p95=0.001)]
+    benchmark.results = [dict(fast_baseline[0], p95=0.004)]
+    assert benchmark.compare(fast_baseline) == list(), "A few milliseconds of jitter should be ignored"
@@ -0,0 +1,147 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.budget import breakdown, budget_for, overruns, parse_budget
+from tests.instrumentation import CallRecord
+
+# A conftest wiring up just the budget plugin and a fake control plane
+conftest_source = '''import pytest
+
+from tests.budget import BudgetPlugin
+from tests.conftest import create_client, private_control_plane_fixture
+from tests.instrumentation import Recorder
+
+recorder_key = pytest.StashKey[Recorder]()
+cli_results_key = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--latency-budget", default=None)
+    parser.addoption("--latency-budget-action", default="fail")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "latency_budget: a latency budget")
+    config.stash[recorder_key] = Recorder()
+    config.pluginmanager.register(BudgetPlugin(config, config.stash[recorder_key], cli_results_key), "budget")
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item):
+    item.config.stash[recorder_key].current_test = item.nodeid
+    yield
+
+
+@pytest.fixture(name="client")
+def client_fixture(request, private_control_plane):
+    return create_client(dict(), private_control_plane, request.config.stash[recorder_key])
+'''
+
+tests_source = '''import time
+
+import pytest
+
+
+@pytest.fixture(name="slow_setup")
+def slow_setup_fixture(client):
+    list(client.roles.list(""))
+    time.sleep(0.3)
+
+
+@pytest.mark.latency_budget(0.2)
+def test_slow_api(client):
+    for _ in range(3):
+        list(client.roles.list(""))
+    time.sleep(0.3)
+
+
+@pytest.mark.latency_budget(5, setup=0.1)
+def test_slow_setup(slow_setup):
+    pass
+
+
+@pytest.mark.latency_budget(0.2, action="warn")
+def test_warned():
+    time.sleep(0.3)
+
+
+@pytest.mark.latency_budget(5)
+def test_within_budget(client):
+    list(client.roles.list(""))
+
+
+def test_unbudgeted():
+    time.sleep(0.3)
+'''
+
+
+def run_suite(tmp_path, *args) -> subprocess.CompletedProcess:
+    """
+    Runs the example suite in a pytest of its own
+    :return: subprocess.CompletedProcess
+    """
+    (tmp_path / "conftest.py").write_text(conftest_source)
+    (tmp_path / "test_example.py").write_text(tests_source)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    return subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-p", "no:randomly",
+                           *args], cwd=str(tmp_path), env=env, capture_output=True, text=True, timeout=120)
+
+
+def test_parse_budget():
+    """
+    Test that a bare number is the total and named terms budget a phase
+    """
+    assert parse_budget("120") == {"total": 120.0}
+    assert parse_budget("120, setup=30,call=60") == {"total": 120.0, "setup": 30.0, "call": 60.0}
+    assert parse_budget(None) == dict()
+    with pytest.raises(ValueError):
+        parse_budget("lunch=60")
+
+
+@pytest.mark.latency_budget(60, call=None, teardown=5, action="off")
+def test_marker_takes_precedence(request):
+    """
+    Test that a marker's values replace the suite's defaults and leave the rest of them alone
+    """
+    budget, action = budget_for(request.node, {"total": 120.0, "setup": 30.0}, "fail")
+    assert budget == {"total": 60.0, "setup": 30.0, "teardown": 5.0}
+    assert action == "off"
+
+
+def test_overruns_and_breakdown():
+    """
+    Test that only the budgets exceeded are reported and that time is split by phase and operation
+    """
+    took = {"setup": 1.0, "call": 5.0, "teardown": 0.5, "total": 6.5}
+    assert overruns({"total": 10.0, "call": 4.0}, took) == [("call", 5.0, 4.0)]
+    assert overruns({"cli": 1.0}, took) == list()
+
+    records = [CallRecord("roles.list", "t", 1.5, phase="call"), CallRecord("roles.list", "t", 2.5, phase="call"),
+               CallRecord("accounts.create", "t", 0.2, phase="setup")]
+    rows = breakdown(records, list(), took)
+    assert rows[0] == ("setup", "accounts.create", 1, 0.2, 0.2)
+    assert rows[2] == ("call", "roles.list", 2, 4.0, 2.5)
+    assert rows[3][:2] == ("call", "outside api calls") and rows[3][3] == pytest.approx(1.0)
+
+
+def test_budgets_fail_warn_and_explain(tmp_path):
+    """
+    Test that overruns fail or warn as configured and name the api calls the time went to
+    """
+    result = run_suite(tmp_path)
+    output = result.stdout
+    assert "2 failed, 3 passed" in output, output
+    assert "test_slow_api ran over its latency budget: total took" in output
+    assert any("call" in line and "roles.list" in line and "x3" in line for line in output.splitlines())
+    assert "setup took" in output and "test_slow_setup" in output
+    assert "LatencyBudgetWarning" in output
+    assert "3 tests over budget, 2 failed for it" in output
+
+    # A suite default budgets the tests without a marker, and warn turns every overrun into a warning
+    result = run_suite(tmp_path, "--latency-budget=0.2", "--latency-budget-action=warn")
+    assert "5 passed" in result.stdout, result.stdout
+    assert "4 tests over budget, 0 failed for it" in result.stdout
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+import strongdm
+from strongdm import errors
+
+from tests.cassette import Cassettes, cassette_path
+from tests.conftest import create_client
+from tests.data_factory import factory
+from tests.fake_backend import FakeControlPlane
+
+test_id = "tests/test_user.py::test_recorded[Normal Name-John Doe-True]"
+
+
+def record(directory: str, control_plane: FakeControlPlane) -> str:
+    """
+    Records a test that creates a user, creates it again and deletes a user that does not exist
+    :return: str id of the created user
+    """
+    cassettes = Cassettes(directory, "record")
+    client = create_client(dict(), control_plane, cassettes=cassettes)
+    cassettes.begin(test_id)
+    user = client.accounts.create(strongdm.User(email="recorded@example.com", first_name="Re", last_name="Corded"))
+    with pytest.raises(errors.AlreadyExistsError):
+        client.accounts.create(strongdm.User(email="recorded@example.com", first_name="Re", last_name="Corded"))
+    with pytest.raises(errors.NotFoundError):
+        client.accounts.delete("a-0000000000000000")
+    cassettes.end(test_id, ["case1"])
+    cassettes.close()
+    return user.account.id
+
+
+def test_replay_answers_without_a_server(tmp_path, private_control_plane):
+    """
+    Test that a replayed test gets the recorded responses and errors, and its data cases, with the server gone
+    """
+    user_id = record(str(tmp_path), private_control_plane)
+    private_control_plane.stop()
+
+    cassettes = Cassettes(str(tmp_path), "replay")
+    client = create_client(dict(), private_control_plane, cassettes=cassettes)
+    cassettes.begin(test_id)
+    assert cassettes.recorded_cases(test_id) == ["case1"]
+    # A different email only changes the request's values, so it is matched by shape
+    response = client.accounts.create(strongdm.User(email="other@example.com", first_name="Re", last_name="Corded"))
+    assert response.account.id == user_id
+    with pytest.raises(errors.AlreadyExistsError):
+        client.accounts.create(strongdm.User(email="recorded@example.com", first_name="Re", last_name="Corded"))
+    with pytest.raises(errors.NotFoundError):
+        client.accounts.delete("a-0000000000000000")
+    # Nothing recorded is left, so another call misses
+    with pytest.raises(errors.RPCError):
+        client.accounts.get(user_id)
+    cassettes.end(test_id)
+    assert cassettes.misses == 1
+
+
+def test_verify_flags_drift(tmp_path, private_control_plane):
+    """
+    Test that verify flags calls whose outcome changed and recorded calls that were not made
+    """
+    record(str(tmp_path), private_control_plane)
+
+    cassettes = Cassettes(str(tmp_path), "verify")
+    client = create_client(dict(), private_control_plane, cassettes=cassettes)
+    cassettes.begin(test_id)
+    # The user already exists now, so the first create fails where it once succeeded
+    with pytest.raises(errors.AlreadyExistsError):
+        client.accounts.create(strongdm.User(email="recorded@example.com", first_name="Re", last_name="Corded"))
+    cassettes.end(test_id)
+
+    messages = cassettes.drift[test_id]
+    assert "accounts.Create was recorded OK, now ALREADY_EXISTS" in messages
+    assert "accounts.Delete was recorded but not called" in messages
+    assert "drifted" in cassettes.report()
+
+
+def test_shared_cassettes_reuse_their_last_answer(tmp_path, private_control_plane):
+    """
+    Test that a shared fixture client keeps getting answers after its recording runs out
+    """
+    cassettes = Cassettes(str(tmp_path), "record")
+    client = create_client(dict(), private_control_plane, cassettes=cassettes, shared="entity_pool")
+    role = client.roles.create(factory.build("role")).role
+    cassettes.close()
+    assert os.path.exists(cassettes.shared_path("entity_pool"))
+
+    cassettes = Cassettes(str(tmp_path), "replay", worker="gw1")
+    client = create_client(dict(), private_control_plane, cassettes=cassettes, shared="entity_pool")
+    assert client.roles.create(factory.build("role")).role.id == role.id
+    assert client.roles.create(factory.build("role")).role.id == role.id
+
+
+def test_cassette_path_is_bounded():
+    """
+    Test that long parameter ids still give short, distinct file names
+    """
+    first = cassette_path("cassettes", "tests/test_user.py::test_name[" + "a" * 1024 + "]")
+    second = cassette_path("cassettes", "tests/test_user.py::test_name[" + "a" * 1025 + "]")
+    assert first != second
+    assert os.path.dirname(first) == os.path.join("cassettes", "test_user")
+    assert len(os.path.basename(first)) < 100
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from strongdm import errors
+
+from tests.circuit_breaker import CircuitBreaker, CircuitOpenError, preflight
+from tests.scheduler import Scheduler
+
+unavailable = errors.RPCError("unavailable", 14)
+
+
+def test_opens_after_consecutive_connectivity_failures():
+    """
+    Test that only an unbroken run of connectivity failures opens the circuit
+    """
+    breaker = CircuitBreaker(threshold=3)
+    breaker.record_failure(unavailable)
+    breaker.record_failure(errors.AuthenticationError("bad keys"))
+    breaker.record_failure(errors.BadRequestError("the control plane answered"))
+    breaker.record_failure(unavailable)
+    assert not breaker.is_open, "A bad request should have reset the count"
+
+    breaker.record_failure(errors.TimeoutError())
+    breaker.record_failure(unavailable)
+    assert breaker.is_open and "RPCError" in breaker.reason
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_probe_closes_the_circuit():
+    """
+    Test that once the cooldown is up a probe is sent, and closes the circuit when the control plane is back
+    """
+    healthy = list()
+
+    def probe():
+        if not healthy:
+            raise errors.RPCError("unavailable", 14)
+
+    breaker = CircuitBreaker(cooldown=0.05, probe=probe)
+    assert not breaker.check_probe() and breaker.blocks()
+    assert not breaker.allow(), "The circuit should stay open during the cooldown"
+
+    time.sleep(0.06)
+    assert not breaker.allow() and breaker.is_open, "A failed probe should keep the circuit open"
+    healthy.append(True)
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.is_open
+    assert breaker.trips == 1 and breaker.short_circuited == 1
+
+
+def test_trial_call_without_probe():
+    """
+    Test that without a probe one call is let through after the cooldown and decides the circuit's state
+    """
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    breaker.record_failure(unavailable)
+    time.sleep(0.02)
+    assert breaker.allow(), "The trial call was not let through"
+    assert not breaker.allow(), "Only one trial call should run at a time"
+    breaker.record_failure(unavailable)
+    assert breaker.is_open
+
+    time.sleep(0.02)
+    breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+
+
+def test_scheduler_stops_calling_when_open():
+    """
+    Test that scheduled calls fail at once with the reason, and retries stop once the circuit opens
+    """
+    calls = list()
+
+    def call():
+        calls.append(1)
+        raise unavailable
+
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    scheduler = Scheduler(rate=0, base_delay=0.001, unavailable_retries=5, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        scheduler.call("roles", call)
+    assert len(calls) == 2, "Retries should stop as soon as the circuit opens"
+
+    with pytest.raises(CircuitOpenError, match="in a row failed"):
+        scheduler.call("roles", call)
+    assert len(calls) == 2
+
+
+def test_preflight_reports_missing_keys():
+    """
+    Test that empty keys are reported without calling the control plane
+    """
+    breaker = CircuitBreaker(probe=preflight({"api_access_key": "", "api_secret": ""}))
+    assert not breaker.check_probe()
+    assert "SDM_API_ACCESS_KEY" in breaker.reason
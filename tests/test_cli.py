@@ -1,29 +1,34 @@
+import asyncio
 import json
-
-import pexpect
 import tempfile
 
 import pytest
 
-from tests.conftest import get_user, get_role, get_resource_postgres
+from tests.cli_driver import CliDriver, current_test_id
+from tests.conftest import cli_results_key, get_user, get_role, get_resource_postgres
+
+# The cli talks to whatever org `sdm` is logged into, so it cannot be pointed at the fake backend
+pytestmark = pytest.mark.live
 
 
-@pytest.fixture(name="tmp_file")
-def tmp_file_fixture() -> tempfile.NamedTemporaryFile:
+def write_template(json_template: list) -> tempfile.NamedTemporaryFile:
     """
-    Quick way to generate and cleanup a tempfile
+    Writes an ADD template to a tempfile that is removed when it is closed
+    :param json_template: list
     :return: tempfile.NamedTemporaryFile
     """
     temporary_file = tempfile.NamedTemporaryFile(mode="w+")
-    yield temporary_file
-    temporary_file.close()
+    temporary_file.write(json.dumps(json_template, indent=4))
+    temporary_file.flush()
+    return temporary_file
 
 
-def test_add_find_delete_user(tmp_file):
+# --- Scenarios ---
+async def add_find_delete_user(driver: CliDriver):
     """
-    Test that adds, finds, and deletes a user using the SDM cli
+    Adds, finds, and deletes a user using the SDM cli
     """
-    user_list = None
+    listed_user = None
     delete_user = True
 
     # Creating an ADD template file
@@ -36,31 +41,33 @@ def test_add_find_delete_user(tmp_file):
             "tags": ""
         }
     ]
-    tmp_file.write(json.dumps(json_template, indent=4))
-    tmp_file.flush()
 
-    try:
-        # Adding a User
-        pexpect.run(f'sdm admin users add --file {tmp_file.name}')
-
-        # Finding and Verifying the user exists
-        output = pexpect.run(f'sdm admin users list --json --filter "first_name:{user.first_name}')
-        user_list = json.loads(output.decode("utf-8"))
-        assert user_list and user_list[0]["lastName"] == user.last_name, "Filter returned the wrong user"
-
-        # Deleting the user and Verifying that it was deleted
-        pexpect.run(f'sdm admin users delete {user.email}')
-        output2 = pexpect.run(f'sdm admin users list --json --filter "first_name:{user.first_name}')
-        user_list2 = json.loads(output2.decode("utf-8"))
-        assert len(user_list2) == 0, "Deletion of user did not happen"
-        delete_user = False
-    finally:
-        if user_list and delete_user:
-            pexpect.run(f'sdm admin users delete {user.email}')
+    with write_template(json_template) as tmp_file:
+        try:
+            # Adding a User
+            await driver.run(f'sdm admin users add --file {tmp_file.name}')
 
+            # Finding and Verifying the user exists
+            # Only the first listed user matters, the rest of the output is never read
+            listed_user = await driver.first_json(
+                f'sdm admin users list --json --filter "first_name:{user.first_name}"')
+            assert listed_user and listed_user["lastName"] == user.last_name, "Filter returned the wrong user"
 
-def test_add_find_delete_role(tmp_file):
-    role_list = None
+            # Deleting the user and Verifying that it was deleted
+            await driver.run(f'sdm admin users delete {user.email}')
+            remaining = await driver.first_json(f'sdm admin users list --json --filter "first_name:{user.first_name}"')
+            assert remaining is None, "Deletion of user did not happen"
+            delete_user = False
+        finally:
+            if listed_user and delete_user:
+                await driver.run(f'sdm admin users delete {user.email}')
+
+
+async def add_find_delete_role(driver: CliDriver):
+    """
+    Adds, finds, and deletes a role using the SDM cli
+    """
+    listed_role = None
     delete_role = True
 
     # Creating an ADD template file
@@ -72,31 +79,31 @@ def test_add_find_delete_role(tmp_file):
             "tags": ""
         }
     ]
-    tmp_file.write(json.dumps(json_template, indent=4))
-    tmp_file.flush()
 
-    try:
-        # Adding a Role
-        pexpect.run(f'sdm admin roles add --file {tmp_file.name}')
-
-        # Finding and Verifying the role exists
-        output = pexpect.run(f'sdm admin roles list --json --filter "name:{role.name}')
-        role_list = json.loads(output.decode("utf-8"))
-        assert role_list and role_list[0]["name"] == role.name, "Filter returned the wrong role"
-
-        # Deleting the role and Verifying that it was deleted
-        pexpect.run(f'sdm admin roles delete {role_list[0]["id"]}')
-        output2 = pexpect.run(f'sdm admin roles list --json --filter "name:{role.name}')
-        role_list2 = json.loads(output2.decode("utf-8"))
-        assert len(role_list2) == 0, "Deletion of role did not happen"
-        delete_role = False
-    finally:
-        if role_list and delete_role:
-            pexpect.run(f'sdm admin roles delete {role_list[0]["id"]}')
+    with write_template(json_template) as tmp_file:
+        try:
+            # Adding a Role
+            await driver.run(f'sdm admin roles add --file {tmp_file.name}')
+
+            # Finding and Verifying the role exists
+            listed_role = await driver.first_json(f'sdm admin roles list --json --filter "name:{role.name}"')
+            assert listed_role and listed_role["name"] == role.name, "Filter returned the wrong role"
 
+            # Deleting the role and Verifying that it was deleted
+            await driver.run(f'sdm admin roles delete {listed_role["id"]}')
+            remaining = await driver.first_json(f'sdm admin roles list --json --filter "name:{role.name}"')
+            assert remaining is None, "Deletion of role did not happen"
+            delete_role = False
+        finally:
+            if listed_role and delete_role:
+                await driver.run(f'sdm admin roles delete {listed_role["id"]}')
 
-def test_add_find_delete_datasource(tmp_file):
-    datasource_list = None
+
+async def add_find_delete_datasource(driver: CliDriver):
+    """
+    Adds, finds, and deletes a postgres datasource using the SDM cli
+    """
+    listed_datasource = None
     delete_datasource = True
 
     # Creating an ADD template file
@@ -117,24 +124,88 @@ def test_add_find_delete_datasource(tmp_file):
             "username": datasource.username
         }
     ]
-    tmp_file.write(json.dumps(json_template, indent=4))
-    tmp_file.flush()
+
+    with write_template(json_template) as tmp_file:
+        try:
+            # Adding a postgres datasource
+            await driver.run(f'sdm admin datasources add postgres --file {tmp_file.name}')
+
+            # Finding and Verifying the datasource exists
+            listed_datasource = await driver.first_json(
+                f'sdm admin datasources list --json --filter \'name:"{datasource.name}"\'')
+            assert listed_datasource and listed_datasource["name"] == datasource.name, \
+                "Filter returned the wrong datasource"
+
+            # Deleting the datasource and Verifying that it was deleted
+            await driver.run(f'sdm admin datasources delete {listed_datasource["id"]}')
+            remaining = await driver.first_json(
+                f'sdm admin datasources list --json --filter \'name:"{datasource.name}"\'')
+            assert remaining is None, "Deletion of datasource did not happen"
+            delete_datasource = False
+        finally:
+            if listed_datasource and delete_datasource:
+                await driver.run(f'sdm admin datasources delete {listed_datasource["id"]}')
+
+
+scenarios = {
+    "test_add_find_delete_user": add_find_delete_user,
+    "test_add_find_delete_role": add_find_delete_role,
+    "test_add_find_delete_datasource": add_find_delete_datasource,
+}
+
+
+# --- Fixtures ---
+@pytest.fixture(scope="module", name="cli_outcomes")
+def cli_outcomes_fixture(request) -> dict:
+    """
+    Runs every selected cli scenario concurrently once, so the flows overlap instead of running back to back
+    :return: dict of test name to the exception its scenario raised, or None
+    """
+    selected = [item.name for item in request.session.items if item.name in scenarios]
+    driver = CliDriver(max_concurrency=request.config.getoption("--cli-concurrency"))
+
+    async def run_scenario(name: str):
+        # Each scenario runs in its own task, so its commands are tagged with the test that reports it
+        current_test_id.set(f"{request.node.nodeid}::{name}")
+        return await scenarios[name](driver)
+
+    async def run_selected():
+        return await driver.gather(*(run_scenario(name) for name in selected))
 
     try:
-        # Adding a postgres datasource
-        pexpect.run(f'sdm admin datasources add postgres --file {tmp_file.name}')
-
-        # Finding and Verifying the datasource exists
-        output = pexpect.run(f'sdm admin datasources list --json --filter \'name:"{datasource.name}"\'')
-        datasource_list = json.loads(output.decode("utf-8"))
-        assert datasource_list and datasource_list[0]["name"] == datasource.name, "Filter returned the wrong datasource"
-
-        # Deleting the datasource and Verifying that it was deleted
-        pexpect.run(f'sdm admin datasources delete {datasource_list[0]["id"]}')
-        output2 = pexpect.run(f'sdm admin datasources list --json --filter "name:{datasource.name}')
-        role_list2 = json.loads(output2.decode("utf-8"))
-        assert len(role_list2) == 0, "Deletion of datasource did not happen"
-        delete_datasource = False
+        outcomes = asyncio.run(run_selected())
     finally:
-        if datasource_list and delete_datasource:
-            pexpect.run(f'sdm admin datasource delete {datasource_list[0]["id"]}')
+        request.config.stash.setdefault(cli_results_key, list()).extend(driver.results)
+
+    return dict(zip(selected, outcomes))
+
+
+# --- Tests ---
+def check_outcome(cli_outcomes: dict, name: str):
+    outcome = cli_outcomes[name]
+    if isinstance(outcome, BaseException):
+        raise outcome
+
+
+@pytest.mark.latency_budget(cli=60)
+def test_add_find_delete_user(cli_outcomes):
+    """
+    Test that adds, finds, and deletes a user using the SDM cli
+    """
+    check_outcome(cli_outcomes, "test_add_find_delete_user")
+
+
+@pytest.mark.latency_budget(cli=60)
+def test_add_find_delete_role(cli_outcomes):
+    """
+    Test that adds, finds, and deletes a role using the SDM cli
+    """
+    check_outcome(cli_outcomes, "test_add_find_delete_role")
+
+
+@pytest.mark.latency_budget(cli=60)
+def test_add_find_delete_datasource(cli_outcomes):
+    """
+    Test that adds, finds, and deletes a datasource using the SDM cli
+    """
+    check_outcome(cli_outcomes, "test_add_find_delete_datasource")
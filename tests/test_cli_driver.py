@@ -0,0 +1,92 @@
+import asyncio
+import sys
+import time
+
+from tests.cli_driver import CliDriver, timing_report
+
+python = sys.executable
+
+
+def test_results_capture_output_and_exit_code():
+    """
+    Test that stdout, stderr and the exit code are captured separately
+    """
+    driver = CliDriver()
+    command = f'{python} -c "import sys; print(\'[1, 2]\'); sys.stderr.write(\'oops\'); sys.exit(3)"'
+    result = asyncio.run(driver.run(command))
+
+    assert result.json() == [1, 2], "stdout was not captured"
+    assert result.stderr == "oops", "stderr was not captured"
+    assert result.exit_code == 3 and not result.timed_out, "The exit code was not captured"
+
+
+def test_slow_commands_time_out():
+    """
+    Test that a command running past its timeout is killed and flagged
+    """
+    driver = CliDriver()
+    result = asyncio.run(driver.run(f'{python} -c "import time; time.sleep(10)"', timeout=0.5))
+
+    assert result.timed_out and result.duration < 5, "The command was not killed at its timeout"
+
+
+def test_concurrency_is_capped():
+    """
+    Test that scenarios overlap but never run more commands than the cap at once
+    """
+    driver = CliDriver(max_concurrency=2)
+    command = f'{python} -c "import time; time.sleep(0.3)"'
+
+    async def scenario():
+        return await driver.run(command)
+
+    start = time.perf_counter()
+    results = asyncio.run(driver.gather(*(scenario() for _ in range(4))))
+    elapsed = time.perf_counter() - start
+
+    assert all(result.exit_code == 0 for result in results), "A command failed"
+    assert elapsed >= 0.6, "More commands ran at once than the cap allows"
+    assert elapsed < sum(result.duration for result in results), "The commands did not overlap"
+
+
+def test_first_json_stops_a_long_listing():
+    """
+    Test that a listing is killed once the wanted record is printed, long before it would have finished
+    """
+    driver = CliDriver()
+    command = (f'{python} -c "import sys, time; sys.stdout.write(\'[\'); '
+               f'[(sys.stdout.write(\'{{\\"id\\": %d}}, \' % i), sys.stdout.flush(), time.sleep(0.01)) '
+               f'for i in range(2000)]; print(\'{{}}]\')"')
+    found = asyncio.run(driver.first_json(command, lambda record: record["id"] == 5))
+
+    result = driver.results[-1]
+    assert found == {"id": 5} and result.stopped_early, "The listing was not stopped at the match"
+    assert result.duration < 5 and result.exit_code != 0, "The command was not killed"
+
+
+def test_first_json_reads_to_the_end_without_a_match():
+    """
+    Test that a finished listing with no match returns None, and output that is not a list is an error
+    """
+    driver = CliDriver()
+    assert asyncio.run(driver.first_json(f'{python} -c "print([1, 2, 3])"', lambda item: item == 4)) is None
+    assert driver.results[-1].exit_code == 0 and not driver.results[-1].stopped_early
+
+    try:
+        asyncio.run(driver.first_json(f'{python} -c "print(\'error: not logged in\')"'))
+    except ValueError as e:
+        assert "not logged in" in str(e)
+    else:
+        raise AssertionError("Output without a json list should raise")
+
+
+def test_timing_report_lists_slowest_first():
+    """
+    Test that every command is in the timing report, slowest first, with timeouts flagged
+    """
+    driver = CliDriver()
+    asyncio.run(driver.run(f'{python} -c "print(1)"'))
+    asyncio.run(driver.run(f'{python} -c "import time; time.sleep(10)"', timeout=0.5))
+
+    lines = timing_report(driver.results).splitlines()
+    assert len(lines) == 3 and "T/O" in lines[1] and "sleep" in lines[1], "The timed out command should lead"
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from tests.client_pool import ClientPool, probe_client
+from tests.conftest import create_client
+
+
+def test_released_clients_are_reused(private_control_plane):
+    """
+    Test that the pool hands back the same client instead of building a new one
+    """
+    pool = ClientPool(lambda: create_client(dict(), private_control_plane), size=2)
+    first = pool.lease()
+    pool.release(first)
+    second = pool.lease()
+    pool.release(second)
+
+    assert first is second, "A released client should be reused"
+    assert pool.created == 1, "Only one client should have been built"
+    assert probe_client(second), "A client pointed at the fake should be healthy"
+    pool.close()
+
+
+def test_unhealthy_clients_are_rebuilt(private_control_plane):
+    """
+    Test that a client failing its health check is replaced on lease
+    """
+    pool = ClientPool(lambda: create_client(dict(), private_control_plane), size=1, health_check_interval=0,
+                      probe=lambda client: False)
+    first = pool.lease()
+    pool.release(first)
+    second = pool.lease()
+    pool.release(second)
+
+    assert first is not second, "An unhealthy client should have been rebuilt"
+    assert pool.reconnects == 1, "The reconnect was not counted"
+    pool.close()
+
+
+def test_threads_never_share_a_client(private_control_plane):
+    """
+    Test that concurrent leases are exclusive
+    """
+    pool = ClientPool(lambda: create_client(dict(), private_control_plane), size=3)
+    in_use = set()
+    shared = list()
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            with pool.leased_client(timeout=5) as client:
+                with lock:
+                    if id(client) in in_use:
+                        shared.append(client)
+                    in_use.add(id(client))
+                list(client.roles.list("name:nothing*"))
+                with lock:
+                    in_use.discard(id(client))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not shared, "Two threads leased the same client at the same time"
+    assert pool.created <= 3, "The pool grew past its size"
+    pool.close()
+
+
+def test_failed_connects_free_their_slot(private_control_plane):
+    """
+    Test that a client that could not be built does not keep its place in the pool
+    """
+    failures = [ConnectionError("no route to host")]
+
+    def factory():
+        if failures:
+            raise failures.pop()
+        return create_client(dict(), private_control_plane)
+
+    pool = ClientPool(factory, size=1)
+    with pytest.raises(ConnectionError):
+        pool.lease()
+    client = pool.lease(timeout=1)
+    pool.release(client)
+    pool.close()
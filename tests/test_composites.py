@@ -0,0 +1,63 @@
+import pytest
+from strongdm import errors
+
+from tests.composites import SharedGrant, provision_grant
+from tests.conftest import create_client
+from tests.fake_backend import FakeControlPlane
+
+
+def stored(control_plane: FakeControlPlane) -> int:
+    return sum(len(store.values()) for store in [control_plane.accounts, control_plane.resources,
+                                                  control_plane.roles, control_plane.account_attachments])
+
+
+def test_shared_grant_hands_out_copies(private_control_plane):
+    """
+    Test that a test changing its copy of a shared entity does not change what the next test reads
+    """
+    grant = SharedGrant(create_client(dict(), private_control_plane))
+    role = grant.role
+    role.name = "Changed locally"
+    role.access_rules = list()
+
+    assert grant.role.name != "Changed locally" and grant.role.access_rules == [{"tags": grant.tags}]
+    assert grant.attachment.account_id == grant.user.id and grant.resource.tags == grant.tags
+    grant.close()
+    assert stored(private_control_plane) == 0, "The grant was not deleted"
+
+
+def test_clones_and_forks_are_private(private_control_plane):
+    """
+    Test that clones and forks get tags of their own and are deleted with the grant
+    """
+    client = create_client(dict(), private_control_plane)
+    grant = SharedGrant(client)
+    role = grant.clone("role")
+    resource = grant.clone("resource")
+    fork = grant.fork()
+
+    assert role.id != grant.role.id and role.access_rules != grant.role.access_rules
+    assert resource.tags != grant.tags and fork.tags != grant.tags
+    name, value = next(iter(grant.tags.items()))
+    assert [item.id for item in client.resources.list("tags:?", f"{name}={value}")] == [grant.resource.id]
+    with pytest.raises(ValueError):
+        grant.clone("attachment")
+
+    grant.close()
+    assert stored(private_control_plane) == 0, "A clone or fork was left behind"
+
+
+class FailingRoles:
+    def create(self, *args, **kwargs):
+        raise errors.BadRequestError("no roles today")
+
+
+def test_failed_provisioning_cleans_up(private_control_plane):
+    """
+    Test that the parts created before a failure are deleted again
+    """
+    client = create_client(dict(), private_control_plane)
+    client.roles = FailingRoles()
+    with pytest.raises(errors.BadRequestError):
+        provision_grant(client)
+    assert stored(private_control_plane) == 0, "The user or resource was left behind"
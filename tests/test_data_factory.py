@@ -0,0 +1,69 @@
+import re
+import time
+
+import pytest
+
+from tests.data_factory import DataFactory, builders, case_port
+from tests.namespace import port_range_start, ports_per_worker
+from tests.sweeper import sweep_targets
+
+
+def name_of(entity) -> str:
+    return getattr(entity, "name", None) or entity.last_name
+
+
+def test_batches_are_unique_and_cheap():
+    """
+    Test that 10k entities of every kind come out unique and quickly
+    """
+    factory = DataFactory(token="00beef")
+    start = time.perf_counter()
+    names = [name_of(entity) for kind in builders for entity in factory.batch(kind, 10000 // len(builders))]
+    elapsed = time.perf_counter() - start
+
+    assert len(set(names)) == len(names), "The factory handed out a duplicate name"
+    assert elapsed < 5, f"Building 10k entities took {elapsed:.1f} seconds"
+
+
+@pytest.mark.parametrize("kind", list(builders))
+def test_cases_regenerate_exactly(kind):
+    """
+    Test that rebuilding an issued case gives back the same entity
+    """
+    factory = DataFactory(token="00beef", worker="gw7")
+    entity = factory.build(kind)
+    issued_kind, case = factory.issued[-1]
+
+    assert issued_kind == kind and case.startswith("gw7x00beef")
+    assert repr(DataFactory.regenerate(kind, case)) == repr(entity)
+
+
+@pytest.mark.parametrize("kind", list(builders))
+def test_sweeper_recognizes_every_kind(kind):
+    """
+    Test that whatever the factory builds can be found and swept by the orphan sweeper
+    """
+    entity = DataFactory(worker="gw2").build(kind)
+    patterns = [pattern for _, _, _, field, pattern in sweep_targets
+                if re.search(pattern, getattr(entity, field, "") or "")]
+    assert patterns, f"No sweep target matches '{name_of(entity)}'"
+
+
+def test_workers_get_their_own_ports():
+    """
+    Test that ports come from the case's worker slice
+    """
+    assert case_port("gw3x00beef5") == port_range_start + 3 * ports_per_worker + 5
+    assert case_port("mainx00beef5") == port_range_start + 5
+    assert case_port("gw40x00beef1999") < 65536, "A port past the highest one was handed out"
+
+
+def test_reseed_checks_the_token():
+    """
+    Test that a seed token must look like the run tokens the sweeper recognizes
+    """
+    factory = DataFactory()
+    factory.reseed("a1b2c3")
+    assert factory.seed.endswith("xa1b2c3")
+    with pytest.raises(ValueError):
+        factory.reseed("not-hex")
@@ -0,0 +1,68 @@
+import pytest
+
+from tests.conftest import create_client, get_user
+from tests.entity_pool import EntityPool
+
+
+@pytest.fixture(name="pool")
+def pool_fixture(private_control_plane) -> EntityPool:
+    """
+    An entity pool of users on a private fake control plane
+    :return: EntityPool
+    """
+    pool = EntityPool(create_client(dict(), private_control_plane), size=2)
+    pool.register("user", "accounts", get_user)
+    pool.warm()
+    yield pool
+    pool.close()
+
+
+def test_released_entities_are_reset(pool):
+    """
+    Test that a mutated entity comes back to the pool in its original state
+    """
+    user = pool.lease("user")
+    original_name = user.first_name
+    user.first_name = "Mutated"
+    user.suspended = True
+    pool.client.accounts.update(user)
+    pool.release("user", user)
+
+    stored = pool.client.accounts.get(user.id).account
+    assert stored.first_name == original_name and not stored.suspended, "The user was not reset on release"
+
+
+def test_pool_grows_when_exhausted(pool):
+    """
+    Test that leasing more entities than were warmed creates new ones
+    """
+    users = [pool.lease("user") for _ in range(3)]
+    assert len({user.id for user in users}) == 3, "The same user was leased twice"
+    for user in users:
+        pool.release("user", user)
+
+
+def test_only_leased_entities_can_be_released(pool):
+    """
+    Test that releasing an entity twice, or one the pool never leased, fails with the entity's id
+    """
+    user = pool.lease("user")
+    pool.release("user", user)
+    with pytest.raises(ValueError, match=user.id):
+        pool.release("user", user)
+
+    stranger = pool.client.accounts.create(get_user()).account
+    with pytest.raises(ValueError, match=stranger.id):
+        pool.release("user", stranger)
+
+
+def test_leaks_are_reported_and_cleaned_up(pool):
+    """
+    Test that a lease that is never returned is reported and still deleted on close
+    """
+    user = pool.lease("user", owner="tests/test_example.py::test_forgetful")
+    assert pool.leaks() == {user.id: "tests/test_example.py::test_forgetful"}, "The leak was not detected"
+
+    with pytest.warns(UserWarning, match="test_forgetful"):
+        pool.close()
+    assert not list(pool.client.accounts.list(f"id:{user.id}")), "The leaked user was not deleted"
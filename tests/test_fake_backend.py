@@ -0,0 +1,77 @@
+import pytest
+import strongdm
+from strongdm import BadRequestError, NotFoundError
+
+from tests.conftest import create_client, get_user, get_role, get_resource_postgres
+
+
+@pytest.fixture(name="fake_client")
+def fake_client_fixture(private_control_plane) -> strongdm.Client:
+    """
+    A client pointed at a private fake control plane, regardless of --backend
+    :return: strongdm.Client
+    """
+    client = create_client(dict(), private_control_plane)
+    client.control_plane = private_control_plane
+    return client
+
+
+def test_list_pages_through_every_match(fake_client):
+    """
+    Test that list results larger than a page are all returned
+    """
+    prefix = "PAGED_ROLE"
+    for num in range(120):
+        fake_client.roles.create(get_role(name=f"{prefix}_{num}"))
+
+    roles = list(fake_client.roles.list(f"name:{prefix}_*"))
+    assert len(roles) == 120, "Pagination dropped or duplicated roles"
+    assert len({role.id for role in roles}) == 120, "Pagination returned duplicate roles"
+
+
+def test_filter_by_tags_and_quoted_name(fake_client):
+    """
+    Test the tag and quoted name filters used by the suite
+    """
+    postgres = get_resource_postgres()
+    postgres.tags = {"datasource": "fake"}
+    resource = fake_client.resources.create(postgres).resource
+
+    by_tag = [item.id for item in fake_client.resources.list("tags:datasource=fake")]
+    by_name = [item.id for item in fake_client.resources.list("name:?", postgres.name)]
+    assert resource.id in by_tag, "Tag filter did not find the resource"
+    assert by_name == [resource.id], "Quoted name filter did not find exactly the resource"
+
+
+def test_health_can_be_flipped(fake_client):
+    """
+    Test that the fake's resources start unhealthy and can be marked healthy
+    """
+    resource = fake_client.resources.create(get_resource_postgres()).resource
+    assert not resource.healthy, "Fake resources should start unhealthy"
+
+    fake_client.control_plane.set_resource_health(resource.id)
+    assert fake_client.resources.get(resource.id).resource.healthy, "Resource was not marked healthy"
+
+
+def test_errors_match_the_sdk_types(fake_client):
+    """
+    Test that malformed and unknown ids surface as the sdk's error types
+    """
+    with pytest.raises(BadRequestError):
+        fake_client.accounts.delete("tacos")
+
+    with pytest.raises(NotFoundError):
+        fake_client.accounts.get("a-0000000000000000")
+
+
+def test_deleting_an_account_removes_its_attachments(fake_client):
+    """
+    Test that attachments cascade when their account is deleted
+    """
+    account = fake_client.accounts.create(get_user()).account
+    role = fake_client.roles.create(get_role()).role
+    fake_client.account_attachments.create(strongdm.AccountAttachment(account_id=account.id, role_id=role.id))
+
+    fake_client.accounts.delete(account.id)
+    assert not list(fake_client.account_attachments.list(f"account_id:{account.id}")), "Attachment was not removed"
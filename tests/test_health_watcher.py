@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from strongdm import errors
+
+from tests.conftest import create_client, get_resource_postgres
+from tests.health_watcher import ResourceWatcher
+
+
+@pytest.fixture(name="watcher")
+def watcher_fixture(private_control_plane) -> ResourceWatcher:
+    """
+    A fast polling watcher on the private control plane
+    :return: ResourceWatcher
+    """
+    watcher = ResourceWatcher(create_client(dict(), private_control_plane), min_interval=0.01, max_interval=0.05)
+    yield watcher
+    watcher.stop()
+
+
+def test_many_resources_are_polled_together(private_control_plane, watcher):
+    """
+    Test that watching 50 resources resolves every one of them from the one polling thread, one query per tick
+    """
+    resource_ids = [watcher.client.resources.create(get_resource_postgres()).resource.id for _ in range(50)]
+    watches = [watcher.watch(resource_id, timeout=5) for resource_id in resource_ids]
+
+    timer = threading.Timer(0.1, lambda: [private_control_plane.set_resource_health(item) for item in resource_ids])
+    timer.start()
+    healthy = [watch.result(timeout=5) for watch in watches]
+    timer.join()
+
+    assert [resource.id for resource in healthy] == resource_ids, "Futures resolved to the wrong resources"
+    assert watcher.queries < 50, "Resources were polled one by one"
+
+
+def test_failed_polls_keep_waiting(private_control_plane, watcher):
+    """
+    Test that a list failing for any reason is tried again, not reported as a deletion
+    """
+    resource_id = watcher.client.resources.create(get_resource_postgres()).resource.id
+    listing = watcher.client.resources.list
+    failures = [errors.RPCError("control plane unavailable", 14) for _ in range(3)]
+
+    def flaky_list(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return listing(*args, **kwargs)
+
+    watcher.client.resources.list = flaky_list
+    private_control_plane.set_resource_health(resource_id)
+    assert watcher.wait_until_healthy(resource_id, timeout=5).id == resource_id
+    assert not failures, "The failing lists were never made"
+
+
+def test_lagging_lists_fall_back_to_get(private_control_plane, watcher):
+    """
+    Test that a resource the list leaves out is read with a get rather than reported as deleted
+    """
+    resource_id = watcher.client.resources.create(get_resource_postgres()).resource.id
+    watcher.client.resources.list = lambda *args, **kwargs: iter(list())
+    private_control_plane.set_resource_health(resource_id)
+    assert watcher.wait_until_healthy(resource_id, timeout=5).id == resource_id
+
+
+def test_poll_errors_fail_the_watches(watcher):
+    """
+    Test that an error the poller can not wait out fails the watches with it and leaves the poller running
+    """
+    resource_id = watcher.client.resources.create(get_resource_postgres()).resource.id
+    listing = watcher.client.resources.list
+    failures = [RuntimeError("circuit open")]
+
+    def broken_list(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return listing(*args, **kwargs)
+
+    watcher.client.resources.list = broken_list
+    with pytest.raises(RuntimeError, match="circuit open"):
+        watcher.wait_until_healthy(resource_id, timeout=5)
+
+    watcher.client.resources.delete(resource_id)
+    with pytest.raises(errors.NotFoundError):
+        watcher.wait_until_healthy(resource_id, timeout=5)
+    assert watcher.thread.is_alive(), "The poller died"
+
+
+def test_deleted_resources_are_not_found(watcher):
+    """
+    Test that a watched resource the server no longer has fails with a NotFoundError before its deadline
+    """
+    resource_id = watcher.client.resources.create(get_resource_postgres()).resource.id
+    watcher.client.resources.delete(resource_id)
+    with pytest.raises(errors.NotFoundError):
+        watcher.wait_until_healthy(resource_id, timeout=5)
+
+
+def test_unhealthy_resources_time_out(watcher):
+    """
+    Test that a resource that never becomes healthy fails with a TimeoutError
+    """
+    resource_id = watcher.client.resources.create(get_resource_postgres()).resource.id
+    with pytest.raises(TimeoutError):
+        watcher.wait_until_healthy(resource_id, timeout=0.2)
@@ -0,0 +1,136 @@
+import os
+import subprocess
+
+import pytest
+
+from tests import impact
+
+conftest_source = '''import pytest
+
+from tests import helpers
+
+
+def get_user():
+    return helpers.build("user")
+
+
+def get_role():
+    return "role"
+
+
+def verbosity():
+    return 0
+
+
+@pytest.fixture(name="user")
+def user_fixture():
+    return get_user()
+
+
+def pytest_configure(config):
+    config.option.verbose = verbosity()
+'''
+
+
+def commit(root, message: str):
+    subprocess.run(["git", "add", "-A"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@test", "commit", "-qm", message], cwd=root,
+                   check=True, capture_output=True)
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(tmp_path) -> str:
+    """
+    A git repo with a conftest, a harness module it imports and one test file
+    :return: str path of the repo
+    """
+    root = str(tmp_path)
+    subprocess.run(["git", "init", "-q"], cwd=root, check=True)
+    os.mkdir(os.path.join(root, "tests"))
+    files = {
+        "tests/conftest.py": conftest_source,
+        "tests/helpers.py": "def build(kind):\n    return kind\n",
+        "tests/test_user.py": "def test_user(user):\n    assert user\n",
+    }
+    for path, source in files.items():
+        with open(os.path.join(root, path), "w") as file:
+            file.write(source)
+    commit(root, "initial")
+    return root
+
+
+def edit(root, path: str, old: str, new: str):
+    path = os.path.join(root, path)
+    with open(path) as file:
+        source = file.read()
+    with open(path, "w") as file:
+        file.write(source.replace(old, new))
+
+
+def test_module_info_reads_fixtures_and_references(repo):
+    """
+    Test that fixtures are known by the name tests request them by, and references are followed
+    """
+    info = impact.ModuleInfo(os.path.join(repo, "tests/conftest.py"))
+    assert info.definitions["user_fixture"][3] == "user"
+    assert info.definitions["get_role"][3] is None
+    assert info.imports == {"helpers": "tests.helpers"}
+    assert info.closure({"user_fixture"}) == {"user_fixture", "get_user"}
+    assert info.dependents({"get_user"}) == {"get_user", "user_fixture"}
+
+
+def test_helper_change_reaches_fixtures_using_it(repo):
+    """
+    Test that editing a conftest helper marks it and the fixtures built on it as changed, and nothing else
+    """
+    edit(repo, "tests/conftest.py", 'helpers.build("user")', 'helpers.build("admin")')
+    keys = impact.changed_keys(repo, "HEAD", impact.sdk_version())
+    assert keys == {"name:get_user", "name:user_fixture", "fixture:user"}
+
+
+def test_module_change_reaches_its_importers(repo):
+    """
+    Test that editing a harness module marks the module and every conftest definition using it as changed
+    """
+    edit(repo, "tests/helpers.py", "return kind", "return kind.upper()")
+    keys = impact.changed_keys(repo, "HEAD", impact.sdk_version())
+    assert "module:tests.helpers" in keys and "fixture:user" in keys and "name:get_role" not in keys
+
+
+@pytest.mark.parametrize("path,old,new", [
+    ("tests/conftest.py", "= verbosity()", "= 1"),
+    ("tests/conftest.py", "return 0", "return 1"),
+    ("tests/helpers.py", "return kind", "return kind\n\n\nimport os"),
+])
+def test_unattributable_changes_run_everything(repo, path, old, new):
+    """
+    Test that edits to a hook, or to a helper a hook uses, and unknown files fall back to a full run
+    """
+    edit(repo, path, old, new)
+    if path == "tests/helpers.py":
+        with open(os.path.join(repo, "requirements.txt"), "w") as file:
+            file.write("strongdm\n")
+    assert impact.changed_keys(repo, "HEAD", impact.sdk_version()) is None
+
+
+def test_sdk_upgrade_marks_every_service(repo):
+    """
+    Test that a map recorded against another sdk version treats every service as changed
+    """
+    keys = impact.changed_keys(repo, "HEAD", "0.0.1")
+    assert {f"service:{service}" for service in impact.scheduled_services} == keys
+
+
+def test_map_selects_affected_and_unknown_tests():
+    """
+    Test that only tests sharing a changed key, or never recorded, are affected, and the map survives the cache
+    """
+    impact_map = impact.ImpactMap()
+    impact_map.record("tests/test_user.py::test_user", {"fixture:user", "service:accounts"})
+    impact_map.record("tests/test_roles.py::test_role", {"name:get_role", "service:roles"})
+    impact_map = impact.ImpactMap(impact_map.dump())
+
+    assert impact_map.sdk_version == impact.sdk_version()
+    assert impact_map.is_affected("tests/test_user.py::test_user", {"service:accounts"})
+    assert not impact_map.is_affected("tests/test_roles.py::test_role", {"service:accounts"})
+    assert impact_map.is_affected("tests/test_new.py::test_new", set())
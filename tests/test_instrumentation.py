@@ -0,0 +1,111 @@
+import json
+
+import pytest
+import strongdm
+
+from tests.cli_driver import CommandResult
+from tests.conftest import create_client, get_user, get_service
+from tests.instrumentation import Recorder, percentile, remove_partials, write_partial, write_report
+
+
+@pytest.fixture(name="recorder")
+def recorder_fixture() -> Recorder:
+    """
+    A recorder attributing every call to a made up test
+    :return: Recorder
+    """
+    recorder = Recorder()
+    recorder.current_test = "tests/test_example.py::test_example"
+    return recorder
+
+
+def test_calls_are_recorded_per_operation(private_control_plane, recorder):
+    """
+    Test that creates, lists and failed gets are each recorded with their payload sizes and errors
+    """
+    client = create_client(dict(), private_control_plane, recorder)
+    user = client.accounts.create(get_user()).account
+    assert [account.id for account in client.accounts.list(f"id:{user.id}")] == [user.id]
+    with pytest.raises(strongdm.NotFoundError):
+        client.accounts.get("a-0000000000000000")
+
+    operations = {record.operation: record for record in recorder.records}
+    assert sorted(operations) == ["accounts.create", "accounts.get", "accounts.list"]
+    assert operations["accounts.create"].request_bytes > 0 and operations["accounts.create"].response_bytes > 0
+    assert operations["accounts.list"].attempts == 1, "A single page list should be one rpc"
+    assert operations["accounts.get"].error == "NotFoundError"
+    assert {record.test_id for record in recorder.records} == {recorder.current_test}
+
+
+def test_retries_are_counted(private_control_plane, recorder):
+    """
+    Test that the sdk's retries of an internal error show up on the one call that made them
+    """
+    client = create_client(dict(), private_control_plane, recorder)
+    client.max_retry_delay = 0.001
+    with pytest.raises(strongdm.InternalError):
+        client.accounts.create(get_service("a" * 1025), timeout=0.2)
+
+    record, = recorder.records
+    assert record.retries > 0, "The internal error was not retried"
+    assert record.error == "InternalError"
+
+
+def test_report_merges_workers_and_cli(tmp_path, recorder):
+    """
+    Test that the written report holds percentiles for api and cli operations from every worker
+    """
+    worker = Recorder()
+    worker.current_test = "tests/test_other.py::test_other"
+    worker.add_cli_results([CommandResult("sdm admin users list --json", 1, "", "boom", 2.0)])
+    worker.add_test_duration(worker.current_test, 3.0)
+    path = str(tmp_path / "latency.json")
+    write_partial(worker, path, "gw0")
+
+    recorder.add_test_duration(recorder.current_test, 0.5)
+    write_report(recorder, path)
+
+    with open(path) as report_file:
+        report = json.load(report_file)
+    cli = report["operations"]["cli sdm admin users list"]
+    assert cli["count"] == 1 and cli["p99"] == 2.0 and cli["errors"] == {"exit 1": 1}
+    assert [test["test_id"] for test in report["slowest_tests"]] == [worker.current_test, recorder.current_test]
+    assert not list(tmp_path.glob("*.part")), "Worker dumps were not cleaned up"
+
+
+def test_stale_worker_dumps_are_removed(tmp_path, recorder):
+    """
+    Test that dumps left behind by a crashed run are removed before they can be merged into a new report
+    """
+    path = str(tmp_path / "latency.json")
+    crashed = Recorder()
+    crashed.add_test_duration("tests/test_other.py::test_crashed", 3.0)
+    write_partial(crashed, path, "gw5")
+
+    remove_partials(path)
+    write_report(recorder, path)
+    with open(path) as report_file:
+        report = json.load(report_file)
+    assert "tests/test_other.py::test_crashed" not in [test["test_id"] for test in report["slowest_tests"]]
+
+
+def test_shared_fixture_calls_are_charged_to_the_fixture(recorder):
+    """
+    Test that calls made while a shared fixture is charged go to it, and the test gets them back afterwards
+    """
+    recorder.charge_to("session fixture entity_pool")
+    recorder.charge_to("module fixture module_grant")
+    assert recorder.current_test == "module fixture module_grant"
+    recorder.uncharge()
+    assert recorder.current_test == "session fixture entity_pool"
+    recorder.uncharge()
+    assert recorder.current_test == "tests/test_example.py::test_example"
+
+
+def test_percentile():
+    """
+    Test nearest rank percentiles
+    """
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from tests.json_stream import ArraySearch, JsonArrayStream
+
+records = [
+    {"id": "a-1", "name": "Tacos, \"the\" [first]", "tags": {"env": "dev"}},
+    {"id": "a-2", "name": "back\\slash }{", "roles": ["r-1", "r-2"]},
+    3,
+    "a string, with a comma",
+    None,
+    [],
+]
+
+
+def parse(text: str, chunk_size: int) -> list:
+    stream = JsonArrayStream()
+    elements = list()
+    for index in range(0, len(text), chunk_size):
+        elements.extend(stream.feed(text[index:index + chunk_size]))
+    assert stream.done, "The closing bracket was not seen"
+    return elements
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 4096])
+def test_elements_survive_any_split(chunk_size):
+    """
+    Test that strings, escapes, brackets and scalars split across chunks at every point parse the same as json.loads
+    """
+    text = "warning: a newer cli is available\n" + json.dumps(records, indent=4) + "\n"
+    assert parse(text, chunk_size) == records
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_bracketed_warnings_are_skipped(chunk_size):
+    """
+    Test that a warning with brackets in it is not taken for the start of the array
+    """
+    warning = "[WARN] token expires in [3] days\n[nullable] see {docs}\n"
+    assert parse(warning + json.dumps(records) + "\n", chunk_size) == records
+    assert parse(warning + json.dumps(records[2:]) + "\n", chunk_size) == records[2:]
+
+
+def test_only_the_current_element_is_kept():
+    """
+    Test that the buffer is bounded by the element being read, not the array
+    """
+    stream = JsonArrayStream(max_element_size=200)
+    stream.feed("[")
+    for index in range(1000):
+        stream.feed(json.dumps({"id": index, "name": "x" * 50}) + ", ")
+        assert len(stream.text) < 200
+
+    with pytest.raises(ValueError):
+        stream.feed('{"name": "' + "x" * 500)
+
+
+def test_search_stops_at_the_first_match():
+    """
+    Test that the search decides on the matching element without waiting for the rest of the array
+    """
+    search = ArraySearch(lambda element: element["id"] == 2)
+    assert not search.feed('[{"id": 1}, {"id": 2')
+    assert search.feed("}") and search.found == {"id": 2}
+    assert search.stopped_early and search.seen == 2
+
+
+def test_search_rules_out_past_a_sorted_name():
+    """
+    Test that ruled_out ends a search with no match, and an empty or finished list is an answer too
+    """
+    search = ArraySearch(lambda element: element == "c", ruled_out=lambda element: element > "c")
+    assert search.feed('["a", "b", "d", ') and search.found is None and search.stopped_early
+
+    empty = ArraySearch()
+    assert empty.feed("[]\n") and empty.found is None and not empty.stopped_early
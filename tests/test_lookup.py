@@ -0,0 +1,60 @@
+import pytest
+
+from tests import lookup
+from tests.batch import Batch
+from tests.conftest import create_client, get_role, get_user
+from tests.instrumentation import Recorder
+
+
+@pytest.fixture(name="recorder")
+def recorder_fixture() -> Recorder:
+    """
+    A recorder counting the rpcs each lookup makes
+    :return: Recorder
+    """
+    return Recorder()
+
+
+@pytest.fixture(name="client")
+def client_fixture(private_control_plane, recorder):
+    """
+    A client whose rpcs are counted, on a control plane holding a few pages worth of roles
+    :return: strongdm.Client
+    """
+    seeding_client = create_client(dict(), private_control_plane)
+    with Batch() as setup:
+        for _ in range(120):
+            setup.create(seeding_client.roles, get_role())
+    return create_client(dict(), private_control_plane, recorder)
+
+
+def rpcs(recorder: Recorder) -> int:
+    return sum(record.attempts for record in recorder.records)
+
+
+def test_first_stops_after_one_page(client, recorder):
+    """
+    Test that finding the first of many matches fetches a single page
+    """
+    assert lookup.first(client.roles, "name:ROLL_*") is not None
+    assert rpcs(recorder) == 1, "Later pages were fetched after the answer was known"
+
+
+def test_lookups_by_id_and_name(client, recorder):
+    """
+    Test that id and name lookups answer with one rpc each, however big the org is
+    """
+    user = client.accounts.create(get_user()).account
+    role = client.roles.create(get_role()).role
+    recorder.records.clear()
+
+    assert lookup.exists(client.accounts, user.id)
+    assert lookup.matches(client.accounts, user.id, "suspended:false")
+    assert not lookup.matches(client.accounts, user.id, "suspended:true")
+    assert lookup.find_by_name(client.roles, role.name).id == role.id
+    assert lookup.get_or_none(client.roles, role.id).id == role.id
+    assert rpcs(recorder) == 5
+
+    client.roles.delete(role.id)
+    assert not lookup.exists(client.roles, role.id)
+    assert lookup.get_or_none(client.roles, role.id) is None
@@ -0,0 +1,17 @@
+from tests import namespace
+
+
+def test_suffixes_are_unique():
+    """
+    Test that generated suffixes never repeat within a worker
+    """
+    suffixes = [namespace.unique_suffix() for _ in range(10000)]
+    assert len(set(suffixes)) == len(suffixes), "A suffix was handed out twice"
+
+
+def test_suffixes_name_the_worker(monkeypatch):
+    """
+    Test that a worker's suffixes start with its id
+    """
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", "gw3")
+    assert namespace.unique_suffix().startswith("gw3x"), "Suffix is missing the worker id"
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from tests.conftest import create_client
+from tests.data_factory import factory
+from tests.prefetch import PrefetchIterator, prefetch, prefetch_chain
+
+
+class PagedList:
+    """
+    Stands in for an sdk list, each page of items costs a round trip
+    """
+    def __init__(self, pages: int, page_size: int = 10, latency: float = 0.05, fail_at: int = None):
+        self.pages = pages
+        self.page_size = page_size
+        self.latency = latency
+        self.fail_at = fail_at
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        try:
+            for page in range(self.pages):
+                time.sleep(self.latency)
+                for index in range(self.page_size):
+                    if self.produced == self.fail_at:
+                        raise RuntimeError("page failed")
+                    self.produced += 1
+                    yield page * self.page_size + index
+        finally:
+            self.closed.set()
+
+
+def test_next_page_is_fetched_while_the_caller_works():
+    """
+    Test that fetching and processing pages overlap instead of adding up
+    """
+    source = PagedList(pages=5)
+    start = time.perf_counter()
+    with PrefetchIterator(iter(source), read_ahead=2, page_size=10) as entities:
+        for index, _ in enumerate(entities):
+            if index % 10 == 9:
+                # Processing a page takes as long as fetching one
+                time.sleep(0.05)
+    # 5 fetches and 5 pages of processing, overlapped, take about 6 rounds rather than 10
+    assert time.perf_counter() - start < 0.45
+
+
+def test_read_ahead_is_capped():
+    """
+    Test that the reader never holds more than its cap however far behind the caller is
+    """
+    source = PagedList(pages=10, latency=0)
+    entities = PrefetchIterator(iter(source), read_ahead=4, page_size=10, max_buffered=15)
+    time.sleep(0.2)
+    assert entities.capacity == 15
+    # One more item may be in the reader's hand, waiting for room
+    assert source.produced <= 16
+    assert next(entities) == 0
+    entities.close()
+
+
+def test_stopping_early_closes_the_list():
+    """
+    Test that a caller stopping early stops the reader and closes the list, so no more pages are fetched
+    """
+    source = PagedList(pages=100, latency=0.01)
+    with PrefetchIterator(iter(source), read_ahead=1, page_size=10) as entities:
+        assert next(entities) == 0
+    assert source.closed.wait(1)
+    assert source.produced < 50
+    assert list(entities) == list()
+
+
+def test_errors_reach_the_caller_in_order():
+    """
+    Test that an error reading the list is raised after the entities read before it
+    """
+    with PrefetchIterator(iter(PagedList(pages=3, latency=0, fail_at=12))) as entities:
+        seen = list()
+        with pytest.raises(RuntimeError):
+            for entity in entities:
+                seen.append(entity)
+    assert seen == list(range(12))
+
+
+def test_chain_keeps_order_and_closes_every_list():
+    """
+    Test that chained lists come out in order and that closing the chain early closes the lists reading ahead
+    """
+    sources = [PagedList(pages=2, latency=0.01) for _ in range(4)]
+    chained = prefetch_chain([source.__iter__ for source in sources], lists_ahead=3)
+    assert list(chained) == list(range(20)) * 4
+
+    sources = [PagedList(pages=50, latency=0.01) for _ in range(4)]
+    chained = prefetch_chain([source.__iter__ for source in sources], lists_ahead=3)
+    assert next(chained) == 0
+    chained.close()
+    assert all(source.closed.wait(1) for source in sources[:3])
+    assert sources[3].produced == 0, "A list beyond the read-ahead was started"
+
+
+def test_prefetch_reads_every_page(private_control_plane):
+    """
+    Test that a prefetched sdk list returns everything a plain one does, across pages
+    """
+    client = create_client(dict(), private_control_plane)
+    for _ in range(120):
+        client.roles.create(factory.build("role"))
+    with prefetch(client.roles, "name:*ROLL_*") as roles:
+        prefetched = [role.id for role in roles]
+    assert prefetched == [role.id for role in client.roles.list("name:*ROLL_*")]
+    assert len(prefetched) == 120
@@ -1,18 +1,7 @@
-import random
-from time import sleep
-
 import pytest
 import strongdm
-from tests.conftest import get_resource_postgres
-
-
-# def test_delete_resources(client):
-#     """
-#     Quickly delete resources
-#     """
-#     resources = list(client.resources.list('healthy:false'))
-#     for resource in resources:
-#         client.resources.delete(resource.id)
+from tests import lookup
+from tests.data_factory import factory
 
 
 def get_resource_gateway(hostname: str = "apple.berry.com", port: int = None) -> strongdm.Gateway:
@@ -22,78 +11,26 @@ def get_resource_gateway(hostname: str = "apple.berry.com", port: int = None) ->
     :param port: int
     :return: strongdm.Gateway
     """
-    if not port:
-        port = random.randint(5000, 7000)
-
-    gateway = strongdm.Gateway(
-        name=f"gateway{port}",
-        listen_address=f"{hostname}:{port}"
-    )
-    return gateway
+    return factory.build("gateway", hostname=hostname, port=port)
 
 
-def get_resource_relay(num: int = None) -> strongdm.Relay:
+def get_resource_relay(num: str = None) -> strongdm.Relay:
     """
     Get a prepopulated relay resource
-    :param num: int
+    :param num: str
     :return: strongdm.Relay
     """
-    if not num:
-        num = random.randint(5000, 7000)
-
-    relay = strongdm.Relay(
-        name=f"relay{num}",
-    )
-    return relay
+    return factory.build("relay", case=num)
 
 
-def get_resource_k8_cluster(num: int = None, certificate_authority: str = None) -> strongdm.AmazonEKS:
+def get_resource_k8_cluster(num: str = None, certificate_authority: str = None) -> strongdm.AmazonEKS:
     """
     Get a prepopulated k8 cluster resource
-    :param num: int
+    :param num: str
     :param certificate_authority: str
     :return: strongdm.AmazonEKS
     """
-    if not num:
-        num = random.randint(5000, 7000)
-
-    if not certificate_authority:
-        certificate_authority = """-----BEGIN CERTIFICATE-----
-MIIEKjCCAxKgAwIBAgIEOGPe+DANBgkqhkiG9w0BAQUFADCBtDEUMBIGA1UEChMLRW50cnVzdC5u
-ZXQxQDA+BgNVBAsUN3d3dy5lbnRydXN0Lm5ldC9DUFNfMjA0OCBpbmNvcnAuIGJ5IHJlZi4gKGxp
-bWl0cyBsaWFiLikxJTAjBgNVBAsTHChjKSAxOTk5IEVudHJ1c3QubmV0IExpbWl0ZWQxMzAxBgNV
-BAMTKkVudHJ1c3QubmV0IENlcnRpZmljYXRpb24gQXV0aG9yaXR5ICgyMDQ4KTAeFw05OTEyMjQx
-NzUwNTFaFw0yOTA3MjQxNDE1MTJaMIG0MRQwEgYDVQQKEwtFbnRydXN0Lm5ldDFAMD4GA1UECxQ3
-d3d3LmVudHJ1c3QubmV0L0NQU18yMDQ4IGluY29ycC4gYnkgcmVmLiAobGltaXRzIGxpYWIuKTEl
-MCMGA1UECxMcKGMpIDE5OTkgRW50cnVzdC5uZXQgTGltaXRlZDEzMDEGA1UEAxMqRW50cnVzdC5u
-ZXQgQ2VydGlmaWNhdGlvbiBBdXRob3JpdHkgKDIwNDgpMIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8A
-MIIBCgKCAQEArU1LqRKGsuqjIAcVFmQqK0vRvwtKTY7tgHalZ7d4QMBzQshowNtTK91euHaYNZOL
-Gp18EzoOH1u3Hs/lJBQesYGpjX24zGtLA/ECDNyrpUAkAH90lKGdCCmziAv1h3edVc3kw37XamSr
-hRSGlVuXMlBvPci6Zgzj/L24ScF2iUkZ/cCovYmjZy/Gn7xxGWC4LeksyZB2ZnuU4q941mVTXTzW
-nLLPKQP5L6RQstRIzgUyVYr9smRMDuSYB3Xbf9+5CFVghTAp+XtIpGmG4zU/HoZdenoVve8AjhUi
-VBcAkCaTvA5JaJG/+EfTnZVCwQ5N328mz8MYIWJmQ3DW1cAH4QIDAQABo0IwQDAOBgNVHQ8BAf8E
-BAMCAQYwDwYDVR0TAQH/BAUwAwEB/zAdBgNVHQ4EFgQUVeSB0RGAvtiJuQijMfmhJAkWuXAwDQYJ
-KoZIhvcNAQEFBQADggEBADubj1abMOdTmXx6eadNl9cZlZD7Bh/KM3xGY4+WZiT6QBshJ8rmcnPy
-T/4xmf3IDExoU8aAghOY+rat2l098c5u9hURlIIM7j+VrxGrD9cv3h8Dj1csHsm7mhpElesYT6Yf
-zX1XEC+bBAlahLVu2B064dae0Wx5XnkcFMXj0EyTO2U87d89vqbllRrDtRnDvV5bu/8j72gZyxKT
-J1wDLW8w0B62GqzeWvfRqqgnpv55gcR5mTNXuhKwqeBCbJPKVt7+bYQLCIt+jerXmCHG8+c8eS9e
-nNFMFY3h7CI3zJpDC5fcgJCNs2ebb0gIFVbPv/ErfF6adulZkMV8gzURZVE=
------END CERTIFICATE-----
-    """
-
-    k8_cluster = strongdm.AmazonEKS(
-        name=f"K8 Cluster {num}",
-        endpoint="https://A1ADBDD0AE833267869C6ED0476D6B41.gr7.us-east-2.eks.amazonaws.com",
-        access_key="CLUSTERAKIAIOSFODNN7",
-        secret_access_key="wJalrXUtnFEMI/K7MDENG/bPxRfiCYCLUSTERKEY",
-        certificate_authority=certificate_authority,
-        region="us-east-2",
-        cluster_name=f"cluster_{num}",
-        role_arn="arn:aws:iam::000000000000:role/RoleName",
-        healthcheck_namespace="default",
-    )
-
-    return k8_cluster
+    return factory.build("k8_cluster", case=num, certificate_authority=certificate_authority)
 
 
 def get_resource_ssh_server(hostname: str = "hyper.tank.com", port: int = None) -> strongdm.SSH:
@@ -103,33 +40,25 @@ def get_resource_ssh_server(hostname: str = "hyper.tank.com", port: int = None)
     :param port: int
     :return: strongdm.SSH
     """
-    if not port:
-        port = random.randint(5000, 7000)
-
-    ssh_server = strongdm.SSH(
-        name=f"SSH Server for {hostname}:{port}",
-        hostname=hostname,
-        username=f"ssh_user_{port}",
-        port=port,
-
-    )
-
-    return ssh_server
+    return factory.build("ssh_server", hostname=hostname, port=port)
 
 
+# (description, data factory kind), built by the resource and node fixtures when a test runs
 resources = [
-    ("datasource", get_resource_postgres()),
-    ("k8_cluster", get_resource_k8_cluster()),
-    ("ssh_server", get_resource_ssh_server()),
+    ("datasource", "postgres"),
+    ("k8_cluster", "k8_cluster"),
+    ("ssh_server", "ssh_server"),
 ]
 
 nodes = [
-    ("gateway", get_resource_gateway()),
-    ("relay", get_resource_relay()),
+    ("gateway", "gateway"),
+    ("relay", "relay"),
 ]
 
 
-def test_wait_for_healthy_datasource(client):
+@pytest.mark.live
+@pytest.mark.latency_budget(45, call=30)
+def test_wait_for_healthy_datasource(client, resource_watcher):
     """
     Adding a live datasource and waiting for a healthy state
     """
@@ -150,20 +79,20 @@ def test_wait_for_healthy_datasource(client):
     # Creating a datasource
     resource_response = client.resources.create(resource=postgres)
     resource_id = resource_response.resource.id
-    datasource_response = client.resources.get(resource_id)
 
     # Waiting for the data source to show as healthy and asserting it happened within a minute
-    num = 30
-    count = 0
-    while not datasource_response.resource.healthy and count <= num:
-        sleep(2)
-        count = count + 1
-        datasource_response = client.resources.get(resource_id)
+    timeout = 60
+    try:
+        healthy_resource = resource_watcher.wait_until_healthy(resource_id, timeout=timeout)
+    except TimeoutError:
+        healthy_resource = None
 
-    assert count <= num and datasource_response.resource.healthy, f"Live datasource not showing healthy after {num * 2} seconds."
+    assert healthy_resource, f"Live datasource not showing healthy after {timeout} seconds."
 
 
-@pytest.mark.parametrize("description, resource", resources)
+@pytest.mark.scale
+@pytest.mark.smoke
+@pytest.mark.parametrize("description, resource", resources, indirect=["resource"])
 def test_add_find_and_remove_resources(client, description, resource):
     """
     A parameterized test for adding, finding, and removing a datasource
@@ -176,21 +105,21 @@ def test_add_find_and_remove_resources(client, description, resource):
         assert hasattr(resource_response.resource, "healthy"), "Resource was not created correctly"
 
         # Finding the resource
-        list_resource_response = list(client.resources.list("healthy:false"))
-        resource_ids = [resource.id for resource in list_resource_response]
-        assert resource_response.resource.id in resource_ids, "Could not find the resource when filtering"
+        resource_id = resource_response.resource.id
+        assert lookup.matches(client.resources, resource_id, "healthy:false"), \
+            "Could not find the resource when filtering"
 
         # Deleting and validating resource is gone
-        delete_response = client.resources.delete(resource_response.resource.id)
-        list_resource_response2 = list(client.resources.list("healthy:false"))
-        resource_ids2 = [resource.id for resource in list_resource_response2]
-        assert resource_response.resource.id not in resource_ids2, "Should not have found the resource when filtering"
+        delete_response = client.resources.delete(resource_id)
+        assert not lookup.matches(client.resources, resource_id, "healthy:false"), \
+            "Should not have found the resource when filtering"
     finally:
         if resource_response and not delete_response:
             client.resources.delete(resource_response.resource.id)
 
 
-@pytest.mark.parametrize("description, node", nodes)
+@pytest.mark.scale
+@pytest.mark.parametrize("description, node", nodes, indirect=["node"])
 def test_add_find_and_remove_nodes(client, description, node):
     """
     A parameterized test for adding, finding, and removing nodes
@@ -215,6 +144,7 @@ def test_add_find_and_remove_nodes(client, description, node):
             client.nodes.delete(node_response.node.id)
 
 
+@pytest.mark.live
 def test_connect_to_resource_after_relay_destroyed(client):
     for datasource in client.resources.list(filter='name:wordwasp_debian'):
         client.resources.delete(datasource.id)
@@ -1,25 +1,22 @@
+import asyncio
+
 import pytest
-from strongdm import BadRequestError, AccountAttachment
+from strongdm import BadRequestError
 
+from tests import lookup
+from tests.composites import provision_grant, remove_grant
 from tests.conftest import punctuation_list, accepted_punctuation_failures
+from tests.namespace import unique_suffix
 
 
-# def test_delete_roles(client):
-#     """
-#     Quickly delete roles
-#     """
-#     roles = list(client.roles.list('name:ROLL_*'))
-#     for role in roles:
-#         client.roles.delete(role.id)
-
-
+@pytest.mark.smoke
 def test_add_role(client, role):
     """
     Test adding a role
     """
     role_response = None
     try:
-        role.name = "If I were a rich man..."
+        role.name = f"If I were a rich man... {unique_suffix()}"
         role_response = client.roles.create(role, timeout=30)
     finally:
         if role_response:
@@ -52,7 +49,7 @@ def test_update_role(client, role):
     try:
         role_response = client.roles.create(role, timeout=30)
         update_role = role_response.role
-        update_role.name = "If I were a rich man..."
+        update_role.name = f"If I were a rich man... {unique_suffix()}"
         current_role = client.roles.update(update_role)
 
         assert role.name != current_role.role.name, \
@@ -63,6 +60,7 @@ def test_update_role(client, role):
             client.roles.delete(role_response.role.id)
 
 
+@pytest.mark.scale
 def test_delete_role(client, role):
     """
     Test deleting a role
@@ -77,50 +75,75 @@ def test_delete_role(client, role):
         if deleted_response:
             should_delete = False
 
-        roles = client.roles.list('managed:false')
-
-        for item in roles:
-            assert item.id != created_role.id, f"Role '{created_role.id}' was not deleted as expected."
+        assert not lookup.matches(client.roles, created_role.id, "managed:false"), \
+            f"Role '{created_role.id}' was not deleted as expected."
     finally:
         if role_response and should_delete:
             client.roles.delete(role_response.role.id)
 
 
-def test_role_grant_by_tag(client, role, user, resource_postgres):
+@pytest.mark.smoke
+def test_role_grant_by_tag(client, access_resolver, module_grant):
     """
     Test granting a role to a user by specific resource tags
     """
-    # Create a user
-    user.tags = {"name": "foo"}
-    user_response = client.accounts.create(user, timeout=30)
+    role = module_grant.role
+    assert role.access_rules == [{"tags": module_grant.tags}], "The role does not grant the resource's tag"
+
+    # Verify that the granting of access worked
+    account_attachments = list(client.account_attachments.list("account_id:?", module_grant.user.id))
+    assert [attachment.role_id for attachment in account_attachments] == [role.id], \
+        "Attachment was not made for the correct role"
+    assert access_resolver.reachable(module_grant.user.id) == {module_grant.resource.id}, \
+        "The user can not reach exactly the tagged resource"
+
+
+def test_role_grant_lists_attachment_by_role(client, module_grant):
+    """
+    Test that a granted role lists the user it is attached to
+    """
+    account_attachments = list(client.account_attachments.list("role_id:?", module_grant.role.id))
+    assert [attachment.account_id for attachment in account_attachments] == [module_grant.user.id]
+
+
+@pytest.mark.scale
+def test_role_grant_tag_finds_resource(client, module_grant):
+    """
+    Test that the tag a role grants finds the tagged resource and nothing else
+    """
+    name, value = next(iter(module_grant.tags.items()))
+    resources = list(client.resources.list("tags:?", f"{name}={value}"))
+    assert [resource.id for resource in resources] == [module_grant.resource.id]
+
+
+def test_update_role_access_rules(client, access_resolver, module_grant):
+    """
+    Test replacing a role's access rules, on a clone so the shared grant keeps its own
+    """
+    role = module_grant.clone("role")
+    role.access_rules = [{"tags": {"name": "foo"}}]
+    current_role = client.roles.update(role).role
+
+    assert current_role.access_rules == [{"tags": {"name": "foo"}}], "The access rules were not replaced"
+    assert access_resolver.explain(module_grant.user.id, module_grant.resource.id) == \
+        [(module_grant.role.id, {"tags": module_grant.tags})], "Updating the clone changed what the shared role grants"
+    assert client.roles.get(module_grant.role.id).role.access_rules == [{"tags": module_grant.tags}], \
+        "Updating the clone changed the shared role"
 
-    # Create postgres datasource
-    resource_postgres.tags = {"name": "foo"}
-    resource_postgres_response = client.resources.create(resource_postgres)
 
-    # Creating a role
-    role_response = client.roles.create(role, timeout=30)
+async def test_role_grant_built_concurrently(async_client, access_resolver):
+    """
+    Test granting a role to a user by tag, creating the user, resource and role at the same time
+    """
+    grant = await async_client.run(provision_grant, async_client.client)
     try:
-        # Updating the access rules for a role
-        current_role = role_response.role
-        current_role.access_rules = [
-            {
-                "tags": {"name": "foo"},
-            },
-        ]
-        current_role = client.roles.update(current_role)
-
-        # Creating an attachment between a role and a user
-        account_attachment = AccountAttachment(
-            account_id=user_response.account.id,
-            role_id=current_role.role.id
-        )
-        client.account_attachments.create(account_attachment, timeout=30)
-
-        # Verify that the granting of access worked
-        account_attachments = list(client.account_attachments.list(f'account_id:{user_response.account.id}'))
-        assert account_attachments[0].role_id == current_role.role.id, "Attachment was not made for the correct role"
+        attachments, resources = await asyncio.gather(
+            async_client.account_attachments.list("account_id:?", grant.user.id),
+            async_client.resources.list("tags:?", f"grant={grant.tags['grant']}"))
+
+        assert [attachment.role_id for attachment in attachments] == [grant.role.id], \
+            "Attachment was not made for the correct role"
+        assert [resource.id for resource in resources] == [grant.resource.id]
+        assert await async_client.run(access_resolver.reachable, grant.user.id) == {grant.resource.id}
     finally:
-        client.accounts.delete(user_response.account.id)
-        client.resources.delete(resource_postgres_response.resource.id)
-        client.roles.delete(role_response.role.id)
+        await async_client.run(remove_grant, async_client.client, grant)
@@ -0,0 +1,52 @@
+from tests.conftest import create_client
+from tests.scale import Ledger, OrgSeeder, ScaleHistory, seed_counts
+from tests.sweeper import Sweeper
+
+
+def test_seed_counts_add_up():
+    """
+    Test that every org size is split over the seeded kinds without losing any to rounding
+    """
+    for total in [0, 1, 7, 999, 10000]:
+        counts = seed_counts(total)
+        assert sum(counts.values()) == total
+    assert seed_counts(1000)["user"] == 400
+
+
+def test_seeding_resumes_and_tears_down(tmp_path, private_control_plane):
+    """
+    Test that seeding a larger size only creates what is missing, that the orphan sweep leaves the seed alone,
+    and that teardown removes every seeded entity and its ledger
+    """
+    client = create_client(dict(), private_control_plane)
+    path = str(tmp_path / "scale.jsonl")
+    report = OrgSeeder(client, "tiny", Ledger(path)).seed_org(60)
+    assert (report["created"], report["existing"], report["failed"]) == (60, 0, 0)
+
+    # A new run reads the ledger back and only tops the org up
+    seeder = OrgSeeder(client, "tiny", Ledger(path))
+    report = seeder.seed_org(80)
+    assert (report["created"], report["existing"]) == (20, 60)
+    assert seeder.ledger.counts() == seed_counts(80)
+    assert not Sweeper(client).find()
+
+    report = seeder.teardown(step=25)
+    assert (report["removed"], report["failed"]) == (80, 0)
+    assert len(Ledger(path)) == 0 and not tmp_path.joinpath("scale.jsonl").exists()
+    assert not list(client.accounts.list("tags:scale_seed=?", "tiny"))
+
+
+def test_history_shows_growth():
+    """
+    Test that runs at different org sizes line up by operation with their growth
+    """
+    history = ScaleHistory()
+    history.record(0, {"operations": {"accounts.list": {"p95": 0.1}}, "slowest_tests": list()})
+    history.record(10000, {"operations": {"accounts.list": {"p95": 0.4}, "roles.list": {"p95": 0.2}},
+                           "slowest_tests": [{"test_id": "test_user.py::test_find_user_by_tag", "duration": 1.5}]})
+    history = ScaleHistory(history.dump())
+    lines = history.table("operations").splitlines()
+    assert "10000" in lines[0]
+    assert lines[1].startswith("accounts.list") and lines[1].endswith("x4.0")
+    assert lines[2].startswith("roles.list") and "-" in lines[2]
+    assert "test_find_user_by_tag" in history.table("tests")
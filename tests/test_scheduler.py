@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent import futures
+
+import pytest
+from strongdm import errors
+
+from tests.conftest import create_client, get_role
+from tests.scheduler import Scheduler, TokenBucket
+
+
+def flaky(failures: list):
+    """
+    Gets a call that raises each of failures in turn and then succeeds
+    :param failures: list of Exception
+    :return: callable
+    """
+    remaining = list(failures)
+
+    def call():
+        if remaining:
+            raise remaining.pop(0)
+        return "ok"
+
+    return call
+
+
+def test_throttled_and_unavailable_calls_are_retried():
+    """
+    Test that rate limit and unavailable errors are retried and slow the scheduler down
+    """
+    scheduler = Scheduler(rate=100, base_delay=0.001)
+    call = flaky([errors.RateLimitError("slow down", None), errors.RPCError("unavailable", 14)])
+
+    assert scheduler.call("roles", call) == "ok"
+    assert (scheduler.retried, scheduler.throttled) == (2, 1)
+    assert scheduler.bucket.rate < 100, "The rate was not cut after being throttled"
+
+
+def test_unavailable_retries_are_bounded():
+    """
+    Test that an unavailable call is only sent again a bounded number of times on top of the sdk's own retries
+    """
+    scheduler = Scheduler(rate=0, base_delay=0.001, unavailable_retries=1)
+    call = flaky([errors.RPCError("unavailable", 14), errors.RPCError("unavailable", 14)])
+    with pytest.raises(errors.RPCError):
+        scheduler.call("roles", call)
+    assert scheduler.retried == 1
+
+
+def test_creates_are_not_retried_when_unavailable():
+    """
+    Test that a create which may have reached the control plane is not sent again, while throttled ones still are
+    """
+    scheduler = Scheduler(rate=0, base_delay=0.001)
+    with pytest.raises(errors.RPCError):
+        scheduler.call("roles", flaky([errors.RPCError("unavailable", 14)]), idempotent=False)
+    assert scheduler.retried == 0
+
+    assert scheduler.call("roles", flaky([errors.RateLimitError("slow down", None)]), idempotent=False) == "ok"
+    assert scheduler.retried == 1
+
+
+@pytest.mark.parametrize("error", [errors.InternalError("too long"), errors.BadRequestError("bad"),
+                                   errors.TimeoutError()])
+def test_assertion_relevant_errors_are_left_alone(error):
+    """
+    Test that errors tests assert on, and timeouts that may have gone through, are raised on the first attempt
+    """
+    scheduler = Scheduler(rate=0)
+    with pytest.raises(type(error)):
+        scheduler.call("accounts", flaky([error]))
+    assert scheduler.retried == 0
+
+
+def test_bucket_paces_calls():
+    """
+    Test that a bucket of 50 per second with no burst takes about a fifth of a second for 10 calls
+    """
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert 0.15 < time.monotonic() - start < 1
+
+
+def test_per_service_limits():
+    """
+    Test that no more calls run on a service at once than its limit, and the wait is reported
+    """
+    scheduler = Scheduler(rate=0, limits={"resources": 2})
+    running = list()
+    peak = list()
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: scheduler.call("resources", call), range(8)))
+
+    assert max(peak) == 2
+    assert max(scheduler.waits) > 0.01 and "8 api calls" in scheduler.report()
+
+
+def test_attached_client_goes_through_the_scheduler(private_control_plane):
+    """
+    Test that an attached client's calls, lists included, are scheduled
+    """
+    scheduler = Scheduler(rate=0)
+    client = create_client(dict(), private_control_plane, scheduler=scheduler)
+    role = client.roles.create(get_role()).role
+    assert [item.id for item in client.roles.list("id:?", role.id)] == [role.id]
+    client.roles.delete(role.id)
+
+    assert scheduler.calls == 3
+    assert client.retry_rate_limit_errors is False
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+import strongdm
+
+from tests.conftest import create_client, get_user, get_role
+from tests.data_factory import DataFactory
+from tests.sweeper import Sweeper, format_report
+
+
+def run_factory(hours_ago: float) -> DataFactory:
+    """
+    A data factory naming entities like a run started some time ago
+    :param hours_ago: float
+    :return: DataFactory
+    """
+    return DataFactory(token=f"01d01d{int(time.time() - hours_ago * 3600):08x}")
+
+
+@pytest.fixture(name="fake_client")
+def fake_client_fixture(private_control_plane) -> strongdm.Client:
+    """
+    A client on a private fake control plane, so sweeping never touches a shared org
+    :return: strongdm.Client
+    """
+    return create_client(dict(), private_control_plane)
+
+
+def test_only_test_entities_are_swept(fake_client):
+    """
+    Test that leaked builder entities are deleted and everything else is left alone
+    """
+    old_run = run_factory(hours_ago=3)
+    leaked = [
+        fake_client.accounts.create(old_run.build("user")).account.id,
+        fake_client.accounts.create(old_run.build("service")).account.id,
+        fake_client.roles.create(old_run.build("role")).role.id,
+        fake_client.resources.create(old_run.build("postgres")).resource.id,
+        fake_client.nodes.create(old_run.build("gateway")).node.id,
+        fake_client.nodes.create(old_run.build("relay")).node.id,
+    ]
+    kept = [
+        fake_client.roles.create(get_role(name="ROLL_Production")).role.id,
+        fake_client.nodes.create(strongdm.Gateway(name="gateway1", listen_address="gw.example.com:5000")).node.id,
+        fake_client.accounts.create(get_user(last="McMuffin")).account.id,
+    ]
+
+    report = Sweeper(fake_client, rate=0).sweep()
+    assert sorted(report["removed"]) == sorted(leaked), format_report(report)
+    assert not report["failed"], format_report(report)
+
+    for entity_id in kept:
+        service = {"r": fake_client.roles, "n": fake_client.nodes, "a": fake_client.accounts}[entity_id.split("-")[0]]
+        assert service.get(entity_id), f"'{entity_id}' should not have been swept"
+
+
+def test_sweeping_twice_is_safe(fake_client):
+    """
+    Test that a second sweep finds nothing and does not fail
+    """
+    fake_client.roles.create(run_factory(hours_ago=3).build("role"))
+    Sweeper(fake_client, rate=0).sweep()
+
+    report = Sweeper(fake_client, rate=0).sweep()
+    assert not report["removed"] and not report["failed"], format_report(report)
+
+
+def test_tagged_entities_are_swept(fake_client):
+    """
+    Test that entities carrying a sweep tag are deleted whatever their name
+    """
+    role = get_role(name="Hand made role")
+    role.tags = {"leaked_by": "ci"}
+    role_id = fake_client.roles.create(role).role.id
+
+    # Nothing tells how old a hand made role is, so only a sweep of any age takes it
+    assert role_id not in Sweeper(fake_client, tags=["leaked_by=ci"], rate=0).sweep(dry_run=True)["removed"]
+    dry_run = Sweeper(fake_client, tags=["leaked_by=ci"], rate=0, min_age=0).sweep(dry_run=True)
+    assert role_id in dry_run["removed"] and fake_client.roles.get(role_id), "A dry run should not delete"
+
+    report = Sweeper(fake_client, tags=["leaked_by=ci"], rate=0, min_age=0).sweep()
+    assert role_id in report["removed"], format_report(report)
+
+
+def test_concurrent_runs_are_left_alone(fake_client):
+    """
+    Test that entities of this run and of any run younger than the minimum age are kept, even at any age
+    """
+    ours = fake_client.roles.create(get_role()).role.id
+    concurrent = fake_client.roles.create(run_factory(hours_ago=0.1).build("role")).role.id
+    stale = fake_client.roles.create(run_factory(hours_ago=3).build("role")).role.id
+
+    report = Sweeper(fake_client, rate=0).sweep()
+    assert sorted(report["removed"]) == [stale], format_report(report)
+    assert report["kept"] == 2 and "Kept 2" in format_report(report)
+
+    report = Sweeper(fake_client, rate=0, min_age=0).sweep()
+    assert sorted(report["removed"]) == [concurrent], "Only this run's own role should be left"
+    assert fake_client.roles.get(ours)
@@ -2,19 +2,11 @@
 import pytest
 from strongdm import BadRequestError, InternalError, NotFoundError
 
+from tests import lookup
 from tests.conftest import name_values, punctuation_list, accepted_punctuation_failures, unicode_whitespace_characters, \
     email_values, updated_name_values, updated_email_values, suspend_values, delete_values
 
 
-# def test_delete_users(client):
-#     """
-#     Quickly delete users
-#     """
-#     users = list(client.accounts.list('permission_level:user'))
-#     for user in users:
-#         client.accounts.delete(user.id)
-
-
 @pytest.mark.parametrize("punc", punctuation_list)
 def test_add_user_with_punctuation(client, user, punc):
     """
@@ -87,6 +79,7 @@ def test_add_user_with_different_emails(client, user, description, email_value,
             client.accounts.delete(user_response.account.id)
 
 
+@pytest.mark.smoke
 def test_add_user_with_same_email(client, user):
     """
     A test to verify that a user cannot be adde with the same email address
@@ -105,42 +98,28 @@ def test_add_user_with_same_email(client, user):
 
 
 @pytest.mark.parametrize("description, name_value, should_pass", updated_name_values)
-def test_update_user_with_name_values(client, user, description, name_value, should_pass):
+def test_update_user_with_name_values(client, pooled_user, description, name_value, should_pass):
     """
     A parameterized test to add users with different names
     """
-    responses = list()
+    account = pooled_user
     try:
-        user_response = client.accounts.create(user, timeout=30)
-        if user_response and user_response.account:
-            responses.append(user_response)
-
-        account = user_response.account
         account.first_name = name_value
         updated_user_response = client.accounts.update(account)
         assert name_value == updated_user_response.account.first_name
     except Exception as e:
-        if should_pass and responses:
-            e.msg = f"{e.msg}: {responses[-1].first_name}"
+        if should_pass:
+            e.msg = f"{getattr(e, 'msg', e)}: {account.first_name}"
             raise e
-    finally:
-        for response in responses:
-            response_id = response.account.id
-            client.accounts.delete(id=response_id)
 
 
 @pytest.mark.parametrize("description, email_value, should_pass", updated_email_values)
-def test_update_user_with_different_emails(client, user, description, email_value, should_pass):
+def test_update_user_with_different_emails(client, pooled_user, description, email_value, should_pass):
     """
     A parameterized test to verify updating users with different email values
     """
-    responses = list()
     try:
-        user_response = client.accounts.create(user, timeout=30)
-        if user_response and user_response.account:
-            responses.append(user_response)
-
-        account = user_response.account
+        account = pooled_user
         account.email = email_value
         updated_user = client.accounts.update(account)
 
@@ -149,42 +128,28 @@ def test_update_user_with_different_emails(client, user, description, email_valu
         if should_pass:
             e.msg = f"{e.msg}: {email_value}"
             raise e
-    finally:
-        for response in responses:
-            client.accounts.delete(response.account.id)
 
 
+@pytest.mark.scale
 @pytest.mark.parametrize("suspend_value, suspend", suspend_values)
-def test_suspend_user(client, user, suspend_value, suspend):
+def test_suspend_user(client, pooled_user, suspend_value, suspend):
     """
     A parameterized test to verify the suspending of users
     """
-    responses = list()
-    try:
-        user_response = client.accounts.create(user, timeout=30)
-        if user_response and user_response.account:
-            responses.append(user_response)
-
-        account = user_response.account
-        account.suspended = suspend_value
-        client.accounts.update(account)
-
-        # Filter for values and validate ID is in the list or not
-        suspended_accounts = list(client.accounts.list("suspended:true"))
-        updated_account = None
-        for suspended in suspended_accounts:
-            if account.id == suspended.id:
-                updated_account = suspended
-
-        if (updated_account and updated_account.suspended) and not suspend:
-            raise AssertionError(f"User was suspended when they should not have been.")
-        elif updated_account is None and suspend:
-            raise AssertionError(f"User was not suspended when they should not have been.")
-    finally:
-        for response in responses:
-            client.accounts.delete(response.account.id)
+    account = pooled_user
+    account.suspended = suspend_value
+    client.accounts.update(account)
+
+    # Filter for values and validate ID is in the list or not
+    updated_account = lookup.find_by_id(client.accounts, account.id, "suspended:true")
+
+    if (updated_account and updated_account.suspended) and not suspend:
+        raise AssertionError(f"User was suspended when they should not have been.")
+    elif updated_account is None and suspend:
+        raise AssertionError(f"User was not suspended when they should not have been.")
 
 
+@pytest.mark.scale
 @pytest.mark.parametrize("description, delete_value, should_pass", delete_values)
 def test_delete_user(client, user, description, delete_value, should_pass):
     """
@@ -193,12 +158,13 @@ def test_delete_user(client, user, description, delete_value, should_pass):
     user_response = None
     cleanup = True
     try:
-        user_response = client.accounts.create(user, timeout=30)
-        try:
-            if delete_value == "REPLACE_ME":
-                delete_value = user_response.account.id
-                cleanup = False
+        # Only the good id case deletes a real account, the bad ids are rejected without one being created
+        if delete_value == "REPLACE_ME":
+            user_response = client.accounts.create(user, timeout=30)
+            delete_value = user_response.account.id
+            cleanup = False
 
+        try:
             delete_response = client.accounts.delete(delete_value)
             assert delete_response and should_pass, "There should not have been a delete response"
         except (NotFoundError, Exception) as e:
@@ -208,3 +174,13 @@ def test_delete_user(client, user, description, delete_value, should_pass):
     finally:
         if user_response and cleanup:
             client.accounts.delete(user_response.account.id)
+
+
+@pytest.mark.scale
+def test_find_user_by_tag(client, session_grant):
+    """
+    Test that a tagged user can be found by its tag
+    """
+    name, value = next(iter(session_grant.tags.items()))
+    users = list(client.accounts.list("tags:?", f"{name}={value}"))
+    assert [user.id for user in users] == [session_grant.user.id], f"No user was found tagged {name}={value}"